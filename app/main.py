@@ -13,12 +13,31 @@ from .routes import (
     admin,
     modo,
     realtime,
+    devices,
+    webhooks,
 )
 from .services.state import get_state
+from .services.realtime import get_manager
+from .services.poll_scheduler import get_scheduler
+from .services.public_cache import get_public_cache
+from .services.event_bus import (
+    get_bus,
+    INLINE,
+    ASYNC,
+    THREAD,
+    ColorChanged,
+    UserBanned,
+    SettingsChanged,
+    CredentialsChanged,
+)
+from .services.snapshots import get_snapshots
+from .services.shared_snapshots import get_shared_table
+from .services.light_feed import get_light_feed
+from .services.webhooks import get_webhooks
 from .services.cleanup import cleanup_scheduler
+from .services.loop_monitor import loop_lag_monitor
 from .utils.database import create_all
 
-
 log_level = os.getenv("LOG_LEVEL", "INFO").upper()
 logging.basicConfig(level=log_level, format="%(asctime)s - %(levelname)s - %(message)s")
 
@@ -48,6 +67,8 @@ if os.getenv("ENABLE_CORS", "false").lower() == "true":
 state = get_state()
 _cleanup_stop_event = None
 _cleanup_task = None
+_loop_monitor_task = None
+_shared_watch_task = None
 
 # Include routers
 app.include_router(public.router, tags=["public"])  # /infos, /color
@@ -67,6 +88,52 @@ app.include_router(
 )  # admin dashboard & roles
 app.include_router(modo.router, prefix="/modo", tags=["moderation"])  # moderator tools
 app.include_router(realtime.router, tags=["realtime"])  # /ws
+app.include_router(
+    devices.router, prefix="/devices", tags=["devices"]
+)  # appareils d'éclairage (UDP)
+app.include_router(
+    webhooks.router, prefix="/webhooks", tags=["webhooks"]
+)  # webhooks sortants
+
+
+def _register_consumers() -> None:
+    """Tous les consommateurs d'événements (now-playing, modération, réglages)."""
+    bus = get_bus()
+    manager = get_manager()
+    cache = get_public_cache()
+    # Changements de piste/couleur poussés sur /ws (encodage JSON hors boucle)
+    bus.subscribe("ws_push", manager.push_now_playing, ColorChanged, mode=THREAD)
+    # Couleur envoyée en UDP aux appareils d'éclairage
+    bus.subscribe(
+        "light_feed", get_light_feed().on_color_changed, ColorChanged, mode=THREAD
+    )
+    # Webhooks utilisateurs: planifiés sur la boucle, POST sur un exécuteur borné
+    bus.subscribe(
+        "webhooks", get_webhooks().on_color_changed, ColorChanged, mode=THREAD
+    )
+    # Ban: force_logout puis fermeture 4401 des sockets (tous workers)
+    bus.subscribe(
+        "ws_kick",
+        lambda e: manager.kick_user(e.user_id, "banned"),
+        UserBanned,
+        mode=ASYNC,
+    )
+    # Invalidations: immédiates (lecture de ses propres écritures)
+    bus.subscribe(
+        "settings_state", state.on_settings_changed, SettingsChanged, mode=INLINE
+    )
+    bus.subscribe(
+        "settings_cache",
+        lambda e: cache.invalidate_owner(e.user_id),
+        SettingsChanged,
+        mode=INLINE,
+    )
+    bus.subscribe(
+        "credentials_state",
+        state.on_credentials_changed,
+        CredentialsChanged,
+        mode=INLINE,
+    )
 
 
 @app.on_event("startup")
@@ -76,23 +143,64 @@ async def on_startup():
     except Exception:
         pass
     await state.start()
-    # Démarrer la tâche de nettoyage en arrière-plan
     import asyncio
 
-    global _cleanup_stop_event, _cleanup_task
+    loop = asyncio.get_running_loop()
+    manager = get_manager()
+    manager.bind_loop(loop)
+    snapshots = get_snapshots()
+    snapshots.bind_loop(loop)
+    # Les utilisateurs avec des sockets ouvertes ou des abonnés SSE sont pollés en priorité
+    get_scheduler().add_live_probe(manager.has_user)
+    get_scheduler().add_live_probe(snapshots.has_subscribers)
+    # Plusieurs workers (table mmap partagée): un seul polle chaque utilisateur, les
+    # autres servent sa couleur depuis la table et lui signalent leurs viewers
+    table = get_shared_table()
+    if table is not None:
+        get_scheduler().add_live_probe(table.remote_live)
+        get_scheduler().add_access_probe(table.accessed_at)
+        snapshots.add_remote_listener(manager.local_users, manager.push_remote_snapshot)
+    get_webhooks().bind_loop(loop)
+    _register_consumers()
+    await get_bus().start()
+    # Diffusion inter-workers des envois/kicks WebSocket et des invalidations de cache
+    await manager.start()
+    cache = get_public_cache()
+    cache.set_broadcaster(manager.broadcast_invalidation)
+    manager.add_invalidation_handler(cache.apply_invalidation)
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    if not manager.backplane.distributed and (table is not None or workers > 1):
+        # Plusieurs workers sans backplane: l'obsolescence n'est bornée que par le TTL
+        cache.limit_ttl(float(os.getenv("PUBLIC_CACHE_LOCAL_TTL", "5.0")))
+    # Démarrer la tâche de nettoyage en arrière-plan
+    global _cleanup_stop_event, _cleanup_task, _loop_monitor_task, _shared_watch_task
     _cleanup_stop_event = asyncio.Event()
     _cleanup_task = asyncio.create_task(cleanup_scheduler(_cleanup_stop_event))
+    # Détecter tout code bloquant sur la boucle (chemin public non bloquant)
+    _loop_monitor_task = asyncio.create_task(loop_lag_monitor(_cleanup_stop_event))
+    # Versions écrites par les autres workers: réveil des SSE/long-poll/topics locaux
+    if table is not None:
+        _shared_watch_task = asyncio.create_task(snapshots.watch_shared())
 
 
 @app.on_event("shutdown")
 async def on_shutdown():
     await state.stop()
+    await get_bus().stop()
+    await get_manager().stop()
     # Arrêter le scheduler
     try:
         if _cleanup_stop_event is not None:
             _cleanup_stop_event.set()
         if _cleanup_task is not None:
             await _cleanup_task
+        if _loop_monitor_task is not None:
+            _loop_monitor_task.cancel()
+        if _shared_watch_task is not None:
+            _shared_watch_task.cancel()
+        # Slots libérés: les autres workers reprennent le polling immédiatement
+        if get_shared_table() is not None:
+            get_shared_table().close()
     except Exception:
         pass
 
@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Optional
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import String, DateTime, ForeignKey, Text
+from sqlalchemy import String, DateTime, ForeignKey, Integer, Text
 from ..utils.database import Base
 from ..utils.shortid import new_short_uuid
 
@@ -233,3 +233,47 @@ class UserBan(Base):
         "User", foreign_keys=[user_id], back_populates="bans"
     )
     moderator: Mapped[User] = relationship("User", foreign_keys=[moderator_id])
+
+
+class LightDevice(Base):
+    """Appareil (contrôleur LED, pont domotique) recevant les trames couleur en UDP."""
+
+    __tablename__ = "api_light_devices"
+
+    id: Mapped[str] = mapped_column(
+        String(32), primary_key=True, default=new_short_uuid
+    )
+    owner_id: Mapped[str] = mapped_column(
+        String(32), ForeignKey("api_users.id"), index=True
+    )
+    name: Mapped[str] = mapped_column(String(120), default="Lights")
+    host: Mapped[str] = mapped_column(String(255))
+    port: Mapped[int] = mapped_column(Integer)
+    # Clé HMAC des trames (chiffrée au repos)
+    secret: Mapped[str] = mapped_column(String(255))
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+
+
+class Webhook(Base):
+    """Webhook sortant appelé (POST signé HMAC) aux changements de piste/couleur."""
+
+    __tablename__ = "api_webhooks"
+
+    id: Mapped[str] = mapped_column(
+        String(32), primary_key=True, default=new_short_uuid
+    )
+    owner_id: Mapped[str] = mapped_column(
+        String(32), ForeignKey("api_users.id"), index=True
+    )
+    url: Mapped[str] = mapped_column(String(500))
+    # Types d'événements séparés par des virgules (track_changed, playback_paused, ...)
+    events: Mapped[str] = mapped_column(String(255))
+    # Clé de signature (chiffrée au repos)
+    secret: Mapped[str] = mapped_column(String(255))
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
@@ -12,6 +12,8 @@ from ..schemas.admin import (
     UserWarningsOut,
     WarningItem,
 )
+from ..services.metrics import get_metrics
+from ..services.circuit_breaker import get_breakers
 
 router = APIRouter()
 
@@ -263,3 +265,10 @@ def admin_delete_user_warnings(
     )
     db.commit()
     return {"status": "ok", "deleted": int(deleted_count), "user_id": user_id}
+
+
+@router.get("/metrics")
+def admin_metrics(_: User = Depends(require_admin)):
+    # S'assurer que les collecteurs paresseux sont enregistrés
+    get_breakers()
+    return get_metrics().snapshot()
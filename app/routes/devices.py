@@ -0,0 +1,129 @@
+"""
+Appareils d'éclairage recevant la couleur courante en UDP (trames signées HMAC).
+La clé n'est renvoyée qu'à la création et à la rotation.
+"""
+
+from fastapi import APIRouter, Depends, HTTPException
+from typing import List
+import os
+import secrets
+from sqlalchemy.orm import Session
+from ..utils.database import get_db
+from ..utils.auth_dep import get_current_user_id
+from ..models.user import LightDevice
+from ..schemas.device import (
+    LightDeviceCreateIn,
+    LightDeviceUpdateIn,
+    LightDeviceOut,
+    LightDeviceSecretOut,
+)
+from ..services.light_feed import get_light_feed, resolve_target
+import app.utils.encryption as enc
+
+router = APIRouter()
+
+MAX_DEVICES_PER_USER = int(os.getenv("LIGHT_MAX_DEVICES", "10"))
+
+
+def _check_target(host: str, port: int) -> None:
+    if resolve_target(host, port, get_light_feed().networks) is None:
+        raise HTTPException(status_code=400, detail="Adresse d'appareil non autorisée")
+
+
+def _get_owned(db: Session, device_id: str, uid: str) -> LightDevice:
+    d = (
+        db.query(LightDevice)
+        .filter(LightDevice.id == device_id, LightDevice.owner_id == uid)
+        .first()
+    )
+    if not d:
+        raise HTTPException(status_code=404, detail="Appareil introuvable")
+    return d
+
+
+def _with_secret(d: LightDevice, secret: str) -> LightDeviceSecretOut:
+    out = LightDeviceOut.model_validate(d).model_dump()
+    return LightDeviceSecretOut(**out, secret=secret)
+
+
+@router.get("/", response_model=List[LightDeviceOut])
+def list_devices(
+    uid: str = Depends(get_current_user_id), db: Session = Depends(get_db)
+):
+    return db.query(LightDevice).filter(LightDevice.owner_id == uid).all()
+
+
+@router.post("/", response_model=LightDeviceSecretOut)
+def create_device(
+    body: LightDeviceCreateIn,
+    uid: str = Depends(get_current_user_id),
+    db: Session = Depends(get_db),
+):
+    count = db.query(LightDevice).filter(LightDevice.owner_id == uid).count()
+    if count >= MAX_DEVICES_PER_USER:
+        raise HTTPException(status_code=400, detail="Trop d'appareils")
+    _check_target(body.host, body.port)
+    secret = secrets.token_hex(32)
+    d = LightDevice(
+        owner_id=uid,
+        name=body.name,
+        host=body.host,
+        port=body.port,
+        secret=enc.encrypt_str(secret) or secret,
+    )
+    db.add(d)
+    db.commit()
+    db.refresh(d)
+    get_light_feed().invalidate(uid)
+    return _with_secret(d, secret)
+
+
+@router.patch("/{device_id}", response_model=LightDeviceOut)
+def update_device(
+    device_id: str,
+    body: LightDeviceUpdateIn,
+    uid: str = Depends(get_current_user_id),
+    db: Session = Depends(get_db),
+):
+    d = _get_owned(db, device_id, uid)
+    if body.name is not None:
+        d.name = body.name
+    if body.host is not None or body.port is not None:
+        host = body.host if body.host is not None else d.host
+        port = body.port if body.port is not None else d.port
+        _check_target(host, port)
+        d.host, d.port = host, port
+    db.add(d)
+    db.commit()
+    db.refresh(d)
+    get_light_feed().invalidate(uid)
+    return d
+
+
+@router.post("/{device_id}/rotate-secret", response_model=LightDeviceSecretOut)
+def rotate_device_secret(
+    device_id: str,
+    uid: str = Depends(get_current_user_id),
+    db: Session = Depends(get_db),
+):
+    d = _get_owned(db, device_id, uid)
+    secret = secrets.token_hex(32)
+    d.secret = enc.encrypt_str(secret) or secret
+    db.add(d)
+    db.commit()
+    db.refresh(d)
+    get_light_feed().invalidate(uid)
+    return _with_secret(d, secret)
+
+
+@router.delete("/{device_id}")
+def delete_device(
+    device_id: str,
+    uid: str = Depends(get_current_user_id),
+    db: Session = Depends(get_db),
+):
+    d = _get_owned(db, device_id, uid)
+    db.delete(d)
+    db.commit()
+    get_light_feed().invalidate(uid)
+    return {"status": "ok"}
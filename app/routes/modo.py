@@ -14,10 +14,17 @@ from ..schemas.admin import (
 )
 from ..schemas.overlay import OverlayUpdateIn, OverlayOut, OverlayModerationOut
 from ..services.realtime import get_manager
+from ..services.public_cache import get_public_cache
+from ..services.event_bus import get_bus, UserBanned
 
 router = APIRouter()
 
 
+def _notify_moderation(bg: BackgroundTasks, event: str, **data) -> None:
+    """Diffuse une action aux abonnés du topic `moderation` de /ws (tous workers)."""
+    bg.add_task(get_manager().publish_topic, "moderation", {"event": event, **data})
+
+
 # Users moderation
 @router.get("/users", response_model=ModerationUserListOut)
 def list_users(
@@ -130,7 +137,8 @@ def view_user(
 def edit_user(
     user_id: str,
     payload: dict,
-    _: User = Depends(require_moderator_or_admin),
+    bg: BackgroundTasks,
+    moderator: User = Depends(require_moderator_or_admin),
     db: Session = Depends(get_db),
 ):
     u = db.query(User).filter(User.id == user_id).first()
@@ -151,6 +159,8 @@ def edit_user(
         u.email = payload["email"]
     db.add(u)
     db.commit()
+    get_public_cache().invalidate_profile(user_id)
+    _notify_moderation(bg, "user_edited", user_id=user_id, moderator_id=moderator.id)
     return {"status": "ok"}
 
 
@@ -158,6 +168,7 @@ def edit_user(
 def warn_user(
     user_id: str,
     body: WarnUserIn,
+    bg: BackgroundTasks,
     moderator: User = Depends(require_moderator_or_admin),
     db: Session = Depends(get_db),
 ):
@@ -167,6 +178,9 @@ def warn_user(
     warn = UserWarning(user_id=u.id, moderator_id=moderator.id, reason=body.reason)
     db.add(warn)
     db.commit()
+    _notify_moderation(
+        bg, "user_warned", user_id=u.id, moderator_id=moderator.id, reason=body.reason
+    )
     return {"status": "ok", "warning_id": warn.id}
 
 
@@ -200,24 +214,21 @@ def ban_user(
     # Révoquer toutes les sessions (refresh tokens) de l'utilisateur pour forcer la déconnexion
     revoked = db.query(UserSession).filter(UserSession.user_id == u.id).delete()
     db.commit()
-    # Notifier en temps réel (si connecté via /ws): force logout immédiat
-    try:
-        manager = get_manager()
-        # 1) Envoyer un message explicite au client pour déclencher la déconnexion UI
-        bg.add_task(
-            manager.send_to_user, u.id, {"type": "force_logout", "reason": "banned"}
-        )
-        # 2) Fermer toutes les connexions WS pour couper net (le front gère le code 4401)
-        bg.add_task(manager.close_user, u.id, 4401, "banned")
-    except Exception:
-        pass
+    # Déconnexion temps réel (force_logout + fermeture 4401 sur /ws): abonnés du bus
+    get_bus().publish(
+        UserBanned(user_id=u.id, moderator_id=moderator.id, reason=body.reason)
+    )
+    _notify_moderation(
+        bg, "user_banned", user_id=u.id, moderator_id=moderator.id, reason=body.reason
+    )
     return {"status": "ok", "ban_id": ban.id, "revoked_sessions": int(revoked)}
 
 
 @router.post("/users/{user_id}/ban/revoke")
 def revoke_ban(
     user_id: str,
-    _: User = Depends(require_moderator_or_admin),
+    bg: BackgroundTasks,
+    moderator: User = Depends(require_moderator_or_admin),
     db: Session = Depends(get_db),
 ):
     ban = (
@@ -231,6 +242,7 @@ def revoke_ban(
     ban.revoked_at = datetime.utcnow()
     db.add(ban)
     db.commit()
+    _notify_moderation(bg, "ban_revoked", user_id=user_id, moderator_id=moderator.id)
     return {"status": "ok", "revoked_at": ban.revoked_at}
 
 
@@ -306,7 +318,8 @@ def get_overlay(
 def edit_overlay(
     overlay_id: str,
     body: OverlayUpdateIn,
-    _: User = Depends(require_moderator_or_admin),
+    bg: BackgroundTasks,
+    moderator: User = Depends(require_moderator_or_admin),
     db: Session = Depends(get_db),
 ):
     o = db.query(Overlay).filter(Overlay.id == overlay_id).first()
@@ -319,13 +332,16 @@ def edit_overlay(
     db.add(o)
     db.commit()
     db.refresh(o)
+    get_public_cache().invalidate_overlay(o.id)
+    _notify_moderation(bg, "overlay_edited", overlay_id=o.id, moderator_id=moderator.id)
     return o
 
 
 @router.delete("/overlays/{overlay_id}")
 def delete_overlay(
     overlay_id: str,
-    _: User = Depends(require_moderator_or_admin),
+    bg: BackgroundTasks,
+    moderator: User = Depends(require_moderator_or_admin),
     db: Session = Depends(get_db),
 ):
     o = db.query(Overlay).filter(Overlay.id == overlay_id).first()
@@ -333,4 +349,8 @@ def delete_overlay(
         raise HTTPException(status_code=404, detail="Overlay introuvable")
     db.delete(o)
     db.commit()
+    get_public_cache().invalidate_overlay(overlay_id)
+    _notify_moderation(
+        bg, "overlay_deleted", overlay_id=overlay_id, moderator_id=moderator.id
+    )
     return {"status": "ok"}
@@ -5,6 +5,7 @@ from ..utils.database import get_db
 from ..utils.auth_dep import get_current_user_id
 from ..models.user import User, Overlay
 from ..schemas.overlay import OverlayCreateIn, OverlayUpdateIn, OverlayOut
+from ..services.public_cache import get_public_cache
 
 router = APIRouter()
 
@@ -76,6 +77,7 @@ def update_overlay(
     db.add(ov)
     db.commit()
     db.refresh(ov)
+    get_public_cache().invalidate_overlay(ov.id)
     return ov
 
 
@@ -114,4 +116,5 @@ def delete_overlay(
         raise HTTPException(status_code=404, detail="Overlay introuvable")
     db.delete(ov)
     db.commit()
+    get_public_cache().invalidate_overlay(overlay_id)
     return {"status": "ok"}
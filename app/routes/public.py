@@ -1,67 +1,364 @@
-from fastapi import APIRouter, HTTPException, Depends
-import time
-from sqlalchemy.orm import Session
+import os
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import RedirectResponse, StreamingResponse
 from ..services.state import get_state
-from ..utils.database import get_db
-from ..models.user import Overlay
+from ..services.snapshots import Snapshot, get_snapshots, parse_fields
+from ..services.public_cache import get_public_cache, DEFAULT_OVERLAY_COLOR
+from ..services.artwork import (
+    ARTWORK_CACHE_CONTROL,
+    ARTWORK_FORMATS,
+    ARTWORK_SIZES,
+    artwork_key,
+    get_artwork,
+    is_allowed_url,
+    is_valid_key,
+)
 from ..schemas.overlay import OverlayOut
+from ..utils.http_cache import (
+    NO_CACHE,
+    OVERLAY_CACHE_CONTROL,
+    etag_matches,
+    not_modified,
+    set_validators,
+)
 
 router = APIRouter()
 
+SSE_HEARTBEAT_INTERVAL = float(os.getenv("SSE_HEARTBEAT_INTERVAL", "15.0"))
+LONG_POLL_MAX_WAIT = float(os.getenv("LONG_POLL_MAX_WAIT", "60.0"))
+BATCH_MAX_USERS = int(os.getenv("BATCH_MAX_USERS", "50"))
+# En dessous, gzip coûte plus qu'il ne rapporte
+GZIP_MIN_BYTES = int(os.getenv("GZIP_MIN_BYTES", "512"))
+FIELDS_DESCRIPTION = "Sous-ensemble de champs, ex. `color.hex,track.name`"
+# Premier accès (extracteur tout juste créé): attente max du premier poll Spotify
+COLD_START_WAIT = float(os.getenv("COLD_START_WAIT", "3.0"))
 
-@router.get("/infos/{user_id}", summary="Infos")
-async def infos(user_id: str, db: Session = Depends(get_db)):
-    extractor = get_state().get_extractor_for_user(user_id, db)
-    # Track info (peut être None si non configuré ou rien en lecture)
-    track_info = extractor.get_current_track_info()
-    # Couleur extraite avec mesure de temps
-    started = time.time()
-    r, g, b = extractor.extract_color()
-    processing_ms = int((time.time() - started) * 1000)
-
-    payload = {
-        "color": {"r": r, "g": g, "b": b, "hex": f"#{r:02x}{g:02x}{b:02x}"},
-        "processing_time_ms": processing_ms,
-        "source": "album",
-        "status": "success",
-        "timestamp": int(time.time()),
-        "user": user_id,
+
+def _snapshot_for(user_id: str, extractor) -> Snapshot:
+    snap = get_snapshots().get(user_id)
+    if snap is None:
+        # Extracteur sans snapshot (ne devrait pas arriver): couleur de secours
+        snap = Snapshot(user_id, 0, extractor.default_fallback_rgb, None)
+    return snap
+
+
+async def _current_snapshot(user_id: str) -> Snapshot:
+    """Snapshot courant; au premier accès, attend (sans bloquer la boucle) la première
+    détection plutôt que de servir la couleur de secours."""
+    extractor = await get_state().ensure_extractor(user_id)
+    snap = _snapshot_for(user_id, extractor)
+    remaining = extractor.cold_start_remaining(COLD_START_WAIT)
+    if snap.state is None and remaining > 0:
+        changed = await get_snapshots().wait_for_change(
+            user_id, snap.version, remaining
+        )
+        snap = changed or _snapshot_for(user_id, extractor)
+    return snap
+
+
+# Chemin chaud: aucune I/O bloquante sur la boucle. La config utilisateur est chargée
+# dans un exécuteur (puis mise en cache) et la couleur provient du snapshot maintenu
+# par le pipeline d'événements (polling/push).
+def _revalidated(
+    request: Request, user_id: str, kind: str, fields: tuple | None = None
+) -> Response | None:
+    """304 direct depuis le snapshot en mémoire (ni DB ni extracteur)."""
+    snap = get_snapshots().get(user_id)
+    if snap is None:
+        return None
+    # Un ETag fort par projection et par codage de contenu (identité / gzip); la
+    # progression de la piste en fait partie (une seconde)
+    base = snap.etag(kind, fields, snap.tick() if kind == "i" else None)
+    for etag in (base, _gzip_etag(base)):
+        if etag_matches(request, etag):
+            get_state().mark_active(user_id)
+            return not_modified(etag)
+    return None
+
+
+def _gzip_etag(etag: str) -> str:
+    return etag[:-1] + '-gz"'
+
+
+def _snapshot_response(
+    request: Request, snap: Snapshot, kind: str, fields: tuple | None = None
+) -> Response:
+    """Sert les octets pré-rendus du snapshot (sans passer par l'encodeur générique)."""
+    tick = snap.tick() if kind == "infos" else None
+    headers = {
+        "ETag": snap.etag(kind[0], fields, tick),
+        "Cache-Control": NO_CACHE,
+        "Vary": "Accept-Encoding",
     }
+    body = snap.rendered(kind, fields=fields, tick=tick)
+    accept = request.headers.get("accept-encoding", "")
+    if len(body) >= GZIP_MIN_BYTES and "gzip" in accept:
+        body = snap.rendered(kind, "gzip", fields, tick)
+        headers["Content-Encoding"] = "gzip"
+        headers["ETag"] = _gzip_etag(headers["ETag"])
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@router.get("/infos/{user_id}", summary="Infos")
+async def infos(
+    user_id: str,
+    request: Request,
+    fields: str | None = Query(default=None, description=FIELDS_DESCRIPTION),
+):
+    selected = parse_fields(fields)
+    cached = _revalidated(request, user_id, "i", selected)
+    if cached is not None:
+        return cached
+    snap = await _current_snapshot(user_id)
+    return _snapshot_response(request, snap, "infos", selected)
+
+
+@router.get("/colors", summary="Colors (batch)")
+async def colors_batch(
+    ids: str = Query(..., description="user ids séparés par des virgules"),
+):
+    """Couleur + now-playing de plusieurs utilisateurs en une réponse.
+
+    Les utilisateurs déjà suivis sont servis depuis la mémoire; les autres sont chargés
+    en une requête IN par table. Sans données Spotify: signalés `no_data`, sans extracteur.
+    """
+    user_ids = list(dict.fromkeys(u.strip() for u in ids.split(",") if u.strip()))
+    if not user_ids:
+        raise HTTPException(status_code=400, detail="Paramètre 'ids' vide")
+    if len(user_ids) > BATCH_MAX_USERS:
+        raise HTTPException(
+            status_code=400, detail=f"{BATCH_MAX_USERS} utilisateurs maximum"
+        )
+    store = get_snapshots()
+    state = get_state()
+    missing = [uid for uid in user_ids if store.get(uid) is None]
+    loaded = {}
+    if missing:
+        loaded = await state.run_io(state.prepare_batch_blocking, missing)
+    items = []
+    for uid in user_ids:
+        info = loaded.get(uid)
+        if info is not None and info["status"] != "ready":
+            item = {"user": uid, "status": info["status"]}
+            if info["status"] == "no_data":
+                item["color"] = _hex_block(info["default_color"])
+            items.append(item)
+            continue
+        state.mark_active(uid)
+        snap = store.get(uid)
+        if snap is None:
+            items.append({"user": uid, "status": "no_data"})
+            continue
+        items.append(snap.infos_payload(snap.tick()))
+    return {"items": items, "count": len(items)}
+
+
+def _hex_block(hex_color: str | None) -> dict:
+    h = (hex_color or DEFAULT_OVERLAY_COLOR).strip().lstrip("#")
+    try:
+        r, g, b = int(h[0:2], 16), int(h[2:4], 16), int(h[4:6], 16)
+    except ValueError:
+        return _hex_block(DEFAULT_OVERLAY_COLOR)
+    return {"r": r, "g": g, "b": b, "hex": f"#{r:02x}{g:02x}{b:02x}"}
 
-    if track_info is None:
-        payload["track"] = {"id": None, "name": "No music playing", "is_playing": False}
-    else:
-        payload["track"] = track_info
 
-    return payload
+async def _long_poll(user_id: str, since: int, wait: float) -> None:
+    """Attente sur le waiter asyncio du snapshot: ni thread ni DB par client en attente."""
+    store = get_snapshots()
+    if store.get(user_id) is None:
+        await get_state().ensure_extractor(user_id)
+    store.add_subscriber(user_id)
+    try:
+        await store.wait_for_change(user_id, since, wait)
+    finally:
+        store.remove_subscriber(user_id)
 
 
 @router.get("/color/{user_id}", summary="Color")
-async def color(user_id: str, db: Session = Depends(get_db)):
-    extractor = get_state().get_extractor_for_user(user_id, db)
+async def color(
+    user_id: str,
+    request: Request,
+    wait: float | None = Query(default=None, ge=0, le=LONG_POLL_MAX_WAIT),
+    since: int | None = Query(default=None, ge=0),
+    fields: str | None = Query(default=None, description=FIELDS_DESCRIPTION),
+):
+    """Long-poll optionnel: avec `wait` et `since`, répond dès que la version du snapshot
+    diffère de `since`, sinon à l'expiration de `wait` (état courant)."""
+    selected = parse_fields(fields)
+    if wait and since is not None:
+        await _long_poll(user_id, since, wait)
+    cached = _revalidated(request, user_id, "c", selected)
+    if cached is not None:
+        return cached
+    snap = await _current_snapshot(user_id)
+    return _snapshot_response(request, snap, "color", selected)
+
+
+async def _sse_stream(user_id: str, last_event_id: str | None):
+    store = get_snapshots()
+    store.add_subscriber(user_id)
     try:
-        started = time.time()
-        r, g, b = extractor.extract_color()
-        processing_ms = int((time.time() - started) * 1000)
-        return {
-            "color": {"r": r, "g": g, "b": b, "hex": f"#{r:02x}{g:02x}{b:02x}"},
-            "processing_time_ms": processing_ms,
-            "source": "album",
-            "status": "success",
-            "timestamp": int(time.time()),
-            "user": user_id,
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        yield b"retry: 3000\n\n"
+        snap = store.get(user_id)
+        # Reprise: ne renvoyer l'état courant que si le client ne l'a pas déjà
+        if snap is not None and snap.event_id != last_event_id:
+            yield snap.sse_bytes()
+        since = snap.version if snap is not None else None
+        while True:
+            snap = await store.wait_for_change(user_id, since, SSE_HEARTBEAT_INTERVAL)
+            if snap is None:
+                yield b": ping\n\n"
+                continue
+            since = snap.version
+            yield snap.sse_bytes()
+    finally:
+        store.remove_subscriber(user_id)
+
+
+@router.get("/color/{user_id}/stream", summary="Color stream (SSE)")
+async def color_stream(user_id: str, request: Request):
+    """Flux Server-Sent Events: état courant à la connexion, un événement par changement,
+    commentaires de heartbeat. Supporte la reprise via `Last-Event-ID`."""
+    await get_state().ensure_extractor(user_id)
+    return StreamingResponse(
+        _sse_stream(user_id, request.headers.get("last-event-id")),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.get(
     "/overlay/{overlay_id}", summary="Public overlay", response_model=OverlayOut
 )
-async def get_public_overlay(overlay_id: str, db: Session = Depends(get_db)):
+async def get_public_overlay(overlay_id: str, request: Request, response: Response):
     """Endpoint public (sans auth) pour récupérer un overlay par son ID.
     Ne renvoie pas d'informations sensibles (pas d'owner_id)."""
-    ov = db.query(Overlay).filter(Overlay.id == overlay_id).first()
-    if not ov:
+    proj = await _overlay_projection(overlay_id)
+    etag = f'"o-{overlay_id}-{proj["updated_ms"]}"'
+    if etag_matches(request, etag):
+        return not_modified(etag, OVERLAY_CACHE_CONTROL)
+    set_validators(response, etag, OVERLAY_CACHE_CONTROL)
+    return proj["overlay"]
+
+
+async def _overlay_projection(overlay_id: str) -> dict:
+    proj = await get_public_cache().overlay(overlay_id, get_state().run_io)
+    if proj is None:
         raise HTTPException(status_code=404, detail="Overlay introuvable")
-    return ov
+    return proj
+
+
+@router.get("/overlay/{overlay_id}/boot", summary="Overlay boot bundle")
+async def overlay_boot(overlay_id: str, request: Request, response: Response):
+    """Tout le nécessaire pour le premier rendu d'un overlay en un seul aller-retour:
+    config, couleur par défaut du propriétaire, now-playing courant et canal live.
+    L'id du propriétaire n'est jamais exposé."""
+    proj = await _overlay_projection(overlay_id)
+    owner_id = proj["owner_id"]
+    snap = get_snapshots().get(owner_id)
+    if snap is None:
+        snap = await _current_snapshot(owner_id)
+    else:
+        get_state().mark_active(owner_id)
+    tick = snap.tick()
+    etag = (
+        f'"b-{overlay_id}-{proj["updated_ms"]}-'
+        f'{proj["default_color"].lstrip("#")}-{snap.event_id}-{tick}"'
+    )
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_validators(response, etag)
+    return {
+        "overlay": proj["overlay"],
+        "default_overlay_color": proj["default_color"],
+        "now_playing": snap.public_infos_payload(tick),
+        "live": {"sse": f"/overlay/{overlay_id}/stream"},
+    }
+
+
+@router.get("/overlay/{overlay_id}/stream", summary="Overlay stream (SSE)")
+async def overlay_stream(overlay_id: str, request: Request):
+    """Flux SSE du now-playing du propriétaire de l'overlay (sans exposer son id)."""
+    proj = await _overlay_projection(overlay_id)
+    owner_id = proj["owner_id"]
+    await get_state().ensure_extractor(owner_id)
+    return StreamingResponse(
+        _sse_stream(owner_id, request.headers.get("last-event-id")),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _artwork_redirect(user_id: str, size: int, fmt: str) -> Response:
+    """Redirige vers l'URL adressée par contenu de la pochette courante."""
+    if size not in ARTWORK_SIZES:
+        raise HTTPException(
+            status_code=400, detail=f"Tailles disponibles: {list(ARTWORK_SIZES)}"
+        )
+    if fmt not in ARTWORK_FORMATS:
+        raise HTTPException(
+            status_code=400, detail=f"Formats disponibles: {list(ARTWORK_FORMATS)}"
+        )
+    snap = get_snapshots().get(user_id)
+    if snap is None:
+        snap = await _current_snapshot(user_id)
+    else:
+        get_state().mark_active(user_id)
+    image_url = (snap.track or {}).get("image_url")
+    if not is_allowed_url(image_url):
+        raise HTTPException(status_code=404, detail="Aucune pochette")
+    key = artwork_key(image_url)
+    artwork = get_artwork()
+    # Normalement déjà téléchargée par l'extraction de couleurs
+    if (
+        not artwork.has_original(key)
+        and await get_state().run_io(artwork.original, image_url) is None
+    ):
+        raise HTTPException(status_code=404, detail="Pochette indisponible")
+    return RedirectResponse(
+        f"/artwork/t/{key}/{size}.{fmt}",
+        status_code=302,
+        headers={"Cache-Control": NO_CACHE},
+    )
+
+
+@router.get("/artwork/t/{key}/{name}", summary="Artwork thumbnail")
+async def artwork_thumbnail(key: str, name: str, request: Request):
+    """Miniature immuable (adressée par contenu): uniquement pour des pochettes déjà
+    vues par ce nœud, jamais de fetch amont arbitraire."""
+    size, _, fmt = name.partition(".")
+    valid_size = size.isascii() and size.isdigit() and int(size) in ARTWORK_SIZES
+    if not is_valid_key(key) or not valid_size or fmt not in ARTWORK_FORMATS:
+        raise HTTPException(status_code=404, detail="Miniature introuvable")
+    etag = f'"a-{key}-{size}-{fmt}"'
+    if etag_matches(request, etag):
+        return not_modified(etag, ARTWORK_CACHE_CONTROL)
+    data = await get_state().run_io(get_artwork().thumbnail, key, int(size), fmt)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Miniature introuvable")
+    return Response(
+        content=data,
+        media_type=ARTWORK_FORMATS[fmt],
+        headers={"ETag": etag, "Cache-Control": ARTWORK_CACHE_CONTROL},
+    )
+
+
+@router.get("/artwork/{user_id}", summary="Current artwork")
+async def current_artwork(
+    user_id: str,
+    size: int = Query(default=300),
+    format: str = Query(default="webp"),
+):
+    """Pochette de la piste courante en taille/format fixes (redirection 302)."""
+    return await _artwork_redirect(user_id, size, format)
+
+
+@router.get("/overlay/{overlay_id}/artwork", summary="Overlay artwork")
+async def overlay_artwork(
+    overlay_id: str,
+    size: int = Query(default=300),
+    format: str = Query(default="webp"),
+):
+    """Pochette courante du propriétaire de l'overlay (sans exposer son id)."""
+    proj = await _overlay_projection(overlay_id)
+    return await _artwork_redirect(proj["owner_id"], size, format)
@@ -1,20 +1,29 @@
 import logging
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from sqlalchemy.orm import Session
-from ..utils.database import get_db
 from ..utils.security import decode_token
-from ..models.user import User
+from ..utils.auth_dep import get_active_ban
 from ..services.realtime import get_manager
+from ..services.state import get_state
+from ..services.public_cache import get_public_cache
+from ..services.ws_encoding import decode_client, negotiate
+from ..utils.database import SessionLocal
+from ..models.user import User
+from ..schemas.spotify import NowPlayingIn
 
 router = APIRouter()
 
+MODERATION_TOPIC = "moderation"
+MODERATION_ROLES = ("moderator", "admin")
+
 bearer = HTTPBearer(auto_error=False)
 
 
-async def _auth_user_id(
-    websocket: WebSocket, db: Session = Depends(get_db)
-) -> str | None:
+async def _auth_user_id(websocket: WebSocket) -> str | None:
+    """Aucune session DB n'est gardée pour la durée de la socket: l'existence de
+    l'utilisateur et l'absence de ban sont vérifiées par une session courte sur
+    l'exécuteur I/O (sans cache: un compte supprimé ou banni est refusé aussitôt)."""
     # 1) Authorization header (Bearer)
     auth = websocket.headers.get("authorization")
     token = None
@@ -38,10 +47,11 @@ async def _auth_user_id(
         if not isinstance(sub, str):
             logging.warning("[WS] auth failed: invalid sub in token payload")
             return None
-        # vérifier que l'utilisateur existe
-        u = db.query(User).filter(User.id == sub).first()
-        if not u:
-            logging.warning("[WS] auth failed: user not found for sub=%s", sub)
+        # vérifier que l'utilisateur existe et n'est pas banni
+        if not await get_state().run_io(_load_ws_user_allowed, sub):
+            logging.warning(
+                "[WS] auth failed: user not found or banned for sub=%s", sub
+            )
             return None
         return sub
     except Exception:
@@ -50,17 +60,130 @@ async def _auth_user_id(
 
 
 @router.websocket("/ws")
-async def ws_endpoint(websocket: WebSocket, db: Session = Depends(get_db)):
-    user_id = await _auth_user_id(websocket, db)
+async def ws_endpoint(websocket: WebSocket):
+    user_id = await _auth_user_id(websocket)
     if not user_id:
         await websocket.close(code=4401)
         return
-    await websocket.accept()
+    # Encodage négocié par sous-protocole (ex. "melodyhue.msgpack+delta"), JSON sinon
+    subprotocol, encoding, delta = negotiate(websocket.scope.get("subprotocols"))
+    await websocket.accept(subprotocol=subprotocol)
     manager = get_manager()
-    await manager.connect(user_id, websocket)
+    # Après accept pour que le client reçoive le code; pas d'await avant connect
+    refused = manager.admission_error(user_id)
+    if refused:
+        manager.reject()
+        await websocket.close(code=manager.reject_code, reason=refused)
+        return
+    # Pings applicatifs sur demande (toujours envoyés si WS_IDLE_TIMEOUT > 0)
+    heartbeat = websocket.query_params.get("heartbeat", "").lower() in ("1", "true")
+    await manager.connect(user_id, websocket, encoding, delta, heartbeat)
     try:
         while True:
-            # garder la connexion vivante; ignorer les messages
-            await websocket.receive_text()
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            # Tout message (dont {"type": "pong"}) prouve que le client est vivant
+            manager.touch(user_id, websocket)
+            raw = message.get("text")
+            if raw is None:
+                raw = message.get("bytes")
+            msg = decode_client(raw, encoding)
+            # Messages inconnus ou mal formés: ignorés (keep-alive historique)
+            if msg is not None:
+                await _handle_client_message(websocket, user_id, msg)
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(user_id, websocket)
+
+
+async def _handle_client_message(websocket: WebSocket, user_id: str, msg: dict) -> None:
+    if msg.get("type") == "now_playing":
+        try:
+            payload = NowPlayingIn.model_validate(msg.get("data") or {})
+        except ValidationError:
+            get_manager().send_to_socket(
+                user_id, websocket, {"type": "error", "code": "invalid_now_playing"}
+            )
+            return
+        # Config (cache ou session courte) + détection: hors de la boucle d'événements
+        state = get_state()
+        extractor = await state.ensure_extractor(user_id)
+        await state.run_io(extractor.ingest_now_playing, payload.to_track_info())
+        # Réponses via la file de la connexion: jamais d'envoi concurrent au writer
+        get_manager().send_to_socket(user_id, websocket, {"type": "now_playing_ack"})
+    elif msg.get("type") in ("subscribe", "unsubscribe"):
+        await _handle_topic_message(websocket, user_id, msg)
+
+
+async def _handle_topic_message(websocket: WebSocket, user_id: str, msg: dict) -> None:
+    """`{"type": "subscribe", "topic": "color:<user_id>"}` (ou `overlay:<overlay_id>`,
+    `moderation`); `unsubscribe` retire le topic. Les mises à jour arrivent sous la
+    forme `{"type": "topic", "topic": ..., "data": ...}`."""
+    manager = get_manager()
+    topic = msg.get("topic")
+    if not isinstance(topic, str) or not topic:
+        manager.send_to_socket(
+            user_id, websocket, {"type": "error", "code": "invalid_topic"}
+        )
+        return
+    if msg["type"] == "unsubscribe":
+        manager.unsubscribe(user_id, websocket, topic)
+        manager.send_to_socket(
+            user_id, websocket, {"type": "unsubscribed", "topic": topic}
+        )
+        return
+    error = None
+    watch_user = None
+    kind, _, arg = topic.partition(":")
+    state = get_state()
+    cache = get_public_cache()
+    if kind == "color" and arg:
+        # Mêmes données que /color/{user_id}: public
+        if await cache.profile(arg, state.run_io) is None:
+            error = "unknown_topic"
+        watch_user = arg
+    elif kind == "overlay" and arg:
+        proj = await cache.overlay(arg, state.run_io)
+        if proj is None:
+            error = "unknown_topic"
+        else:
+            watch_user = proj["owner_id"]
+    elif topic == MODERATION_TOPIC:
+        role = await state.run_io(_load_role, user_id)
+        if role not in MODERATION_ROLES:
+            error = "forbidden"
+    else:
+        error = "unknown_topic"
+    if error is None and watch_user is not None:
+        await state.ensure_extractor(watch_user)
+    if error is None:
+        error = manager.subscribe(user_id, websocket, topic, watch_user)
+    if error is not None:
+        manager.send_to_socket(
+            user_id, websocket, {"type": "error", "code": error, "topic": topic}
+        )
+        return
+    manager.send_to_socket(user_id, websocket, {"type": "subscribed", "topic": topic})
+
+
+def _load_ws_user_allowed(user_id: str) -> bool:
+    # Session courte: rien n'est gardé pour la durée de la socket
+    db = SessionLocal()
+    try:
+        if db.query(User.id).filter(User.id == user_id).first() is None:
+            return False
+        return get_active_ban(db, user_id) is None
+    finally:
+        db.close()
+
+
+def _load_role(user_id: str) -> str | None:
+    # Session courte: rien n'est gardé pour la durée de la socket
+    db = SessionLocal()
+    try:
+        row = db.query(User.role).filter(User.id == user_id).first()
+        return row[0] if row else None
+    finally:
+        db.close()
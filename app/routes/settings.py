@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from ..utils.database import get_db
 from ..utils.auth_dep import get_current_user_id
 from ..models.user import UserSetting, User
+from ..services.event_bus import get_bus, SettingsChanged
 
 router = APIRouter()
 
@@ -61,6 +62,8 @@ def update_settings(
     db.commit()
     db.refresh(s)
     color_default = getattr(s, "default_overlay_color", None) or "#25d865"
+    # Couleur de secours (extracteur, snapshot) et caches publics: abonnés du bus
+    get_bus().publish(SettingsChanged(user_id=uid, default_overlay_color=color_default))
     return {
         "theme": s.theme,
         "layout": s.layout,
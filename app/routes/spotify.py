@@ -5,9 +5,13 @@ from ..utils.database import get_db
 from ..utils.auth_dep import get_current_user_id
 from ..models.user import SpotifySecret, SpotifyToken
 import app.utils.encryption as enc
-from ..schemas.spotify import SpotifyCredentialsIn, SpotifyCredentialsStatusOut
+from ..schemas.spotify import (
+    SpotifyCredentialsIn,
+    SpotifyCredentialsStatusOut,
+    NowPlayingIn,
+)
 from ..services.state import get_state
-
+from ..services.event_bus import get_bus, CredentialsChanged
 
 router = APIRouter()
 
@@ -65,6 +69,8 @@ def upsert_spotify_credentials(
     db.add(row)
     db.commit()
     db.refresh(row)
+    # Nouveaux identifiants: disjoncteurs réarmés et config rechargée (abonnés du bus)
+    get_bus().publish(CredentialsChanged(user_id=uid))
     tok = db.query(SpotifyToken).filter(SpotifyToken.user_id == uid).first()
     return SpotifyCredentialsStatusOut(
         has_client_id=bool(row.client_id),
@@ -106,6 +112,7 @@ def spotify_oauth_callback(
     ok = extractor.exchange_code_for_tokens(code)
     if not ok:
         raise HTTPException(status_code=400, detail="Échange du code échoué")
+    extractor.spotify_client.reset_breakers()
 
     # Persister le refresh token en DB si disponible
     rt = extractor.spotify_client.spotify_refresh_token
@@ -116,6 +123,7 @@ def spotify_oauth_callback(
         tok.refresh_token = enc.encrypt_str(rt)
         db.add(tok)
         db.commit()
+        get_bus().publish(CredentialsChanged(user_id=uid))
     return {"status": "ok"}
 
 
@@ -127,7 +135,11 @@ def spotify_auth_status(
     has_rt = bool(getattr(tok, "refresh_token", None))
     state = get_state()
     extractor = state.get_extractor_for_user(uid, db)
-    return {"authenticated": has_rt or extractor.spotify_client.is_authenticated()}
+    return {
+        "authenticated": has_rt or extractor.spotify_client.is_authenticated(),
+        # État des disjoncteurs (closed|open|half_open) pour diagnostiquer une intégration morte
+        "breaker": extractor.spotify_client.breaker_status(),
+    }
 
 
 @router.post("/logout")
@@ -143,4 +155,17 @@ def spotify_logout(
     # Nettoyer en mémoire
     extractor = get_state().get_extractor_for_user(uid, db)
     extractor.spotify_client.logout()
+    get_bus().publish(CredentialsChanged(user_id=uid))
     return {"status": "logged_out"}
+
+
+@router.post("/now-playing")
+def push_now_playing(
+    payload: NowPlayingIn,
+    uid: str = Depends(get_current_user_id),
+    db: Session = Depends(get_db),
+):
+    """Ingestion push du now-playing: coupe le polling serveur tant que le client pousse."""
+    get_state().ingest_now_playing(uid, db, payload.to_track_info())
+    # La couleur est calculée par le pipeline d'événements et diffusée aux consommateurs
+    return {"status": "accepted"}
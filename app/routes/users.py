@@ -16,7 +16,13 @@ from ..models.user import (
     TwoFADisable,
     UserBan,
     UserWarning,
+    LightDevice,
+    Webhook,
 )
+from ..services.public_cache import get_public_cache
+from ..services.light_feed import get_light_feed
+from ..services.webhooks import get_webhooks
+from ..services.state import get_state
 from ..schemas.user import (
     UserOut,
     PublicUserOut,
@@ -56,22 +62,12 @@ def me(
 
 
 @router.get("/{user_id}", response_model=PublicUserOut, tags=["public"])
-def get_user_public(user_id: str, db: Session = Depends(get_db)):
-    u = db.query(User).filter(User.id == user_id).first()
-    if not u:
+async def get_user_public(user_id: str):
+    # Projection publique en cache (invalidée par les routes d'écriture)
+    proj = await get_public_cache().profile(user_id, get_state().run_io)
+    if proj is None:
         raise HTTPException(status_code=404, detail="Utilisateur introuvable")
-    # Source de vérité: paramètres utilisateur s'ils existent
-    settings_row = db.query(UserSetting).filter(UserSetting.user_id == user_id).first()
-    legacy_default_color_hex = (
-        getattr(settings_row, "default_overlay_color", None) if settings_row else None
-    ) or None
-    return PublicUserOut(
-        id=u.id,
-        username=u.username,
-        created_at=u.created_at,
-        avatar_url=gravatar_url(u.email),
-        default_overlay_color=legacy_default_color_hex,
-    )
+    return proj
 
 
 @router.patch("/me/username", response_model=UserOut)
@@ -91,6 +87,7 @@ def update_username(
     db.add(u)
     db.commit()
     db.refresh(u)
+    get_public_cache().invalidate_profile(u.id)
     out = UserOut.model_validate(u)
     out.avatar_url = gravatar_url(u.email)
     return out
@@ -109,6 +106,8 @@ def update_email(
     db.add(u)
     db.commit()
     db.refresh(u)
+    # L'avatar gravatar dérive de l'email
+    get_public_cache().invalidate_profile(u.id)
     out = UserOut.model_validate(u)
     out.avatar_url = gravatar_url(u.email)
     return out
@@ -151,6 +150,10 @@ def delete_me_rest(
     db.query(PasswordReset).filter(PasswordReset.user_id == uid).delete(
         synchronize_session=False
     )
+    db.query(LightDevice).filter(LightDevice.owner_id == uid).delete(
+        synchronize_session=False
+    )
+    db.query(Webhook).filter(Webhook.owner_id == uid).delete(synchronize_session=False)
     db.query(UserSetting).filter(UserSetting.user_id == uid).delete(
         synchronize_session=False
     )
@@ -170,4 +173,8 @@ def delete_me_rest(
     # Finally delete user
     db.delete(u)
     db.commit()
+    get_public_cache().invalidate_owner(uid)
+    get_light_feed().invalidate(uid)
+    get_webhooks().invalidate(uid)
+    get_state().drop_extractor(uid)
     return {"status": "deleted"}
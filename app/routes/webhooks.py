@@ -0,0 +1,127 @@
+"""
+Webhooks sortants: POST JSON signé (en-tête X-MelodyHue-Signature) à chaque
+changement de piste/couleur. La clé n'est renvoyée qu'à la création et à la rotation.
+"""
+
+from fastapi import APIRouter, Depends, HTTPException
+from typing import List
+import os
+import secrets
+from sqlalchemy.orm import Session
+from ..utils.database import get_db
+from ..utils.auth_dep import get_current_user_id
+from ..models.user import Webhook
+from ..schemas.webhook import (
+    WebhookCreateIn,
+    WebhookUpdateIn,
+    WebhookOut,
+    WebhookSecretOut,
+)
+from ..services.webhooks import get_webhooks, check_url
+import app.utils.encryption as enc
+
+router = APIRouter()
+
+MAX_WEBHOOKS_PER_USER = int(os.getenv("WEBHOOK_MAX_PER_USER", "5"))
+
+
+def _check_url(url: str) -> None:
+    error = check_url(url)
+    if error is not None:
+        raise HTTPException(status_code=400, detail=error)
+
+
+def _get_owned(db: Session, webhook_id: str, uid: str) -> Webhook:
+    h = (
+        db.query(Webhook)
+        .filter(Webhook.id == webhook_id, Webhook.owner_id == uid)
+        .first()
+    )
+    if not h:
+        raise HTTPException(status_code=404, detail="Webhook introuvable")
+    return h
+
+
+def _with_secret(h: Webhook, secret: str) -> WebhookSecretOut:
+    out = WebhookOut.model_validate(h).model_dump()
+    return WebhookSecretOut(**out, secret=secret)
+
+
+@router.get("/", response_model=List[WebhookOut])
+def list_webhooks(
+    uid: str = Depends(get_current_user_id), db: Session = Depends(get_db)
+):
+    return db.query(Webhook).filter(Webhook.owner_id == uid).all()
+
+
+@router.post("/", response_model=WebhookSecretOut)
+def create_webhook(
+    body: WebhookCreateIn,
+    uid: str = Depends(get_current_user_id),
+    db: Session = Depends(get_db),
+):
+    count = db.query(Webhook).filter(Webhook.owner_id == uid).count()
+    if count >= MAX_WEBHOOKS_PER_USER:
+        raise HTTPException(status_code=400, detail="Trop de webhooks")
+    _check_url(body.url)
+    secret = secrets.token_hex(32)
+    h = Webhook(
+        owner_id=uid,
+        url=body.url,
+        events=",".join(body.events),
+        secret=enc.encrypt_str(secret) or secret,
+    )
+    db.add(h)
+    db.commit()
+    db.refresh(h)
+    get_webhooks().invalidate(uid)
+    return _with_secret(h, secret)
+
+
+@router.patch("/{webhook_id}", response_model=WebhookOut)
+def update_webhook(
+    webhook_id: str,
+    body: WebhookUpdateIn,
+    uid: str = Depends(get_current_user_id),
+    db: Session = Depends(get_db),
+):
+    h = _get_owned(db, webhook_id, uid)
+    if body.url is not None:
+        _check_url(body.url)
+        h.url = body.url
+    if body.events is not None:
+        h.events = ",".join(body.events)
+    db.add(h)
+    db.commit()
+    db.refresh(h)
+    get_webhooks().invalidate(uid)
+    return h
+
+
+@router.post("/{webhook_id}/rotate-secret", response_model=WebhookSecretOut)
+def rotate_webhook_secret(
+    webhook_id: str,
+    uid: str = Depends(get_current_user_id),
+    db: Session = Depends(get_db),
+):
+    h = _get_owned(db, webhook_id, uid)
+    secret = secrets.token_hex(32)
+    h.secret = enc.encrypt_str(secret) or secret
+    db.add(h)
+    db.commit()
+    db.refresh(h)
+    get_webhooks().invalidate(uid)
+    return _with_secret(h, secret)
+
+
+@router.delete("/{webhook_id}")
+def delete_webhook(
+    webhook_id: str,
+    uid: str = Depends(get_current_user_id),
+    db: Session = Depends(get_db),
+):
+    h = _get_owned(db, webhook_id, uid)
+    db.delete(h)
+    db.commit()
+    get_webhooks().invalidate(uid)
+    return {"status": "ok"}
@@ -0,0 +1,31 @@
+from datetime import datetime
+from pydantic import BaseModel, Field
+
+
+class LightDeviceCreateIn(BaseModel):
+    name: str = Field(default="Lights", min_length=1, max_length=120)
+    host: str = Field(min_length=1, max_length=255, description="IP ou nom d'hôte")
+    port: int = Field(ge=1, le=65535)
+
+
+class LightDeviceUpdateIn(BaseModel):
+    name: str | None = Field(default=None, min_length=1, max_length=120)
+    host: str | None = Field(default=None, min_length=1, max_length=255)
+    port: int | None = Field(default=None, ge=1, le=65535)
+
+
+class LightDeviceOut(BaseModel):
+    id: str
+    name: str
+    host: str
+    port: int
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class LightDeviceSecretOut(LightDeviceOut):
+    # Renvoyé uniquement à la création / rotation: non récupérable ensuite
+    secret: str
@@ -1,4 +1,6 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
+
+from ..services.artwork import is_allowed_url
 
 
 class SpotifyCredentialsIn(BaseModel):
@@ -11,3 +13,39 @@ class SpotifyCredentialsStatusOut(BaseModel):
     has_client_id: bool
     has_client_secret: bool
     has_refresh_token: bool
+
+
+class NowPlayingIn(BaseModel):
+    """Événement now-playing poussé par un client (agent desktop, /ws)."""
+
+    track_id: str | None = Field(default=None, max_length=64)
+    name: str | None = Field(default=None, max_length=300)
+    artist: str | None = Field(default=None, max_length=300)
+    album: str | None = Field(default=None, max_length=300)
+    image_url: str | None = Field(default=None, max_length=2048)
+    is_playing: bool = False
+    progress_ms: int | None = Field(default=None, ge=0)
+    duration_ms: int | None = Field(default=None, ge=0)
+
+    @field_validator("image_url")
+    @classmethod
+    def _check_image_url(cls, v):
+        # Le serveur télécharge cette URL: CDN Spotify en https uniquement (pas de SSRF)
+        if v is not None and not is_allowed_url(v):
+            raise ValueError("URL de pochette non autorisée (CDN Spotify uniquement)")
+        return v
+
+    def to_track_info(self) -> dict:
+        # Même forme que SpotifyClient.get_current_track()
+        if not self.track_id:
+            return {"id": None, "name": "No music playing", "is_playing": False}
+        return {
+            "id": self.track_id,
+            "name": self.name,
+            "artist": self.artist,
+            "album": self.album,
+            "duration_ms": self.duration_ms,
+            "progress_ms": self.progress_ms or 0,
+            "is_playing": self.is_playing,
+            "image_url": self.image_url,
+        }
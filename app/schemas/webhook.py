@@ -0,0 +1,42 @@
+from datetime import datetime
+from typing import List, Literal
+from pydantic import BaseModel, Field, field_validator
+
+WebhookEvent = Literal[
+    "track_changed", "playback_resumed", "playback_paused", "playback_stopped"
+]
+
+
+class WebhookCreateIn(BaseModel):
+    url: str = Field(min_length=1, max_length=500, description="URL http(s) publique")
+    # Vide: tous les événements
+    events: List[WebhookEvent] = Field(default_factory=list)
+
+
+class WebhookUpdateIn(BaseModel):
+    url: str | None = Field(default=None, min_length=1, max_length=500)
+    events: List[WebhookEvent] | None = None
+
+
+class WebhookOut(BaseModel):
+    id: str
+    url: str
+    events: List[str]
+    created_at: datetime
+    updated_at: datetime
+
+    @field_validator("events", mode="before")
+    @classmethod
+    def _split_events(cls, v):
+        # Stocké en base sous forme "a,b,c"
+        if isinstance(v, str):
+            return [e for e in v.split(",") if e]
+        return v
+
+    class Config:
+        from_attributes = True
+
+
+class WebhookSecretOut(WebhookOut):
+    # Renvoyé uniquement à la création / rotation: non récupérable ensuite
+    secret: str
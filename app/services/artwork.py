@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Pochettes d'album - Originaux téléchargés une fois par nœud et miniatures mises en
+cache (mémoire + disque), partagés par l'extraction de couleurs et le proxy public
+"""
+
+import io
+import os
+import re
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import requests
+from PIL import Image
+
+from .metrics import get_metrics
+
+ARTWORK_SIZES = (64, 160, 300, 640)
+ARTWORK_FORMATS = {"webp": "image/webp", "jpeg": "image/jpeg"}
+ARTWORK_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Seules les images du CDN Spotify sont récupérées (pas de proxy ouvert)
+ARTWORK_ALLOWED_HOSTS = ("i.scdn.co", "mosaic.scdn.co", "image-cdn-ak.spotifycdn.com")
+# Clé de contenu: sha1 tronqué (voir `artwork_key`)
+ARTWORK_KEY_RE = re.compile(r"^[0-9a-f]{20}$")
+
+
+def artwork_key(image_url: str) -> str:
+    """Clé de contenu: l'URL d'une pochette Spotify est immuable."""
+    return hashlib.sha1(image_url.encode()).hexdigest()[:20]
+
+
+def is_valid_key(key: str) -> bool:
+    """Clé reçue d'un client: seule une clé hexadécimale atteint le disque."""
+    return bool(ARTWORK_KEY_RE.match(key))
+
+
+def is_allowed_url(image_url: Optional[str]) -> bool:
+    if not image_url or not image_url.startswith("https://"):
+        return False
+    host = image_url[len("https://") :].split("/", 1)[0].lower()
+    return host in ARTWORK_ALLOWED_HOSTS
+
+
+class ArtworkCache:
+    """LRU en octets (originaux + miniatures) devant un répertoire disque borné.
+
+    Un seul téléchargement en vol par URL: les extracteurs de plusieurs utilisateurs
+    qui écoutent le même album partagent le même fetch amont. Le disque est purgé
+    des fichiers les moins récemment lus (mtime rafraîchi à chaque lecture) dès que
+    `ARTWORK_DISK_MB` est dépassé.
+    """
+
+    def __init__(self) -> None:
+        self.directory = os.getenv("ARTWORK_CACHE_DIR", "data/artwork")
+        self.max_bytes = int(float(os.getenv("ARTWORK_MEMORY_MB", "32")) * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._mem: "OrderedDict[str, bytes]" = OrderedDict()
+        self._mem_bytes = 0
+        self._inflight: Dict[str, threading.Lock] = {}
+        self.disk_max_bytes = int(
+            float(os.getenv("ARTWORK_DISK_MB", "512")) * 1024 * 1024
+        )
+        # Inconnu jusqu'au premier parcours du répertoire (fait hors de la boucle)
+        self._disk_bytes: Optional[int] = None
+        self._evicting = threading.Lock()
+        self._session = requests.Session()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+        except OSError as e:
+            logging.warning(f"⚠️ Cache disque des pochettes indisponible: {e}")
+            self.directory = None
+        get_metrics().register_collector(
+            "artwork",
+            lambda: {
+                "memory_entries": len(self._mem),
+                "memory_bytes": self._mem_bytes,
+                "disk_bytes": self._disk_bytes or 0,
+            },
+        )
+
+    # --- mémoire / disque ---
+
+    def _mem_get(self, name: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._mem.get(name)
+            if data is not None:
+                self._mem.move_to_end(name)
+            return data
+
+    def _mem_set(self, name: str, data: bytes) -> None:
+        with self._lock:
+            old = self._mem.pop(name, None)
+            if old is not None:
+                self._mem_bytes -= len(old)
+            self._mem[name] = data
+            self._mem_bytes += len(data)
+            while self._mem_bytes > self.max_bytes and len(self._mem) > 1:
+                _, evicted = self._mem.popitem(last=False)
+                self._mem_bytes -= len(evicted)
+
+    def _path(self, name: str) -> Optional[str]:
+        if not self.directory:
+            return None
+        return os.path.join(self.directory, name[:2], name)
+
+    def _disk_get(self, name: str) -> Optional[bytes]:
+        path = self._path(name)
+        if not path:
+            return None
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # Ordre d'éviction: le mtime sert de date de dernier accès
+            os.utime(path)
+            return data
+        except OSError:
+            return None
+
+    def _disk_set(self, name: str, data: bytes) -> None:
+        path = self._path(name)
+        if not path:
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            # Écriture atomique: un lecteur ne voit jamais un fichier partiel
+            os.replace(tmp, path)
+        except OSError as e:
+            logging.warning(f"⚠️ Écriture cache pochette impossible: {e}")
+            return
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += len(data)
+            over = self._disk_bytes is None or self._disk_bytes > self.disk_max_bytes
+        if over:
+            self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        """Recompte le répertoire et supprime les fichiers les plus anciens jusqu'à
+        90% du budget. Un seul thread à la fois; les autres continuent sans attendre."""
+        if not self._evicting.acquire(blocking=False):
+            return
+        try:
+            entries = []
+            total = 0
+            for root, _, files in os.walk(self.directory):
+                for filename in files:
+                    if filename.endswith(".tmp"):
+                        continue
+                    path = os.path.join(root, filename)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, path))
+                    total += st.st_size
+            if total > self.disk_max_bytes:
+                target = self.disk_max_bytes * 0.9
+                entries.sort()
+                removed = 0
+                for _, size, path in entries:
+                    if total <= target:
+                        break
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        continue
+                    total -= size
+                    removed += 1
+                get_metrics().inc("artwork_disk_evictions", removed)
+            with self._lock:
+                self._disk_bytes = total
+        finally:
+            self._evicting.release()
+
+    def _load(self, name: str) -> Optional[bytes]:
+        data = self._mem_get(name)
+        if data is not None:
+            get_metrics().inc("artwork_memory_hits")
+            return data
+        data = self._disk_get(name)
+        if data is not None:
+            get_metrics().inc("artwork_disk_hits")
+            self._mem_set(name, data)
+        return data
+
+    def _store(self, name: str, data: bytes) -> None:
+        self._mem_set(name, data)
+        self._disk_set(name, data)
+
+    # --- originaux ---
+
+    def has_original(self, key: str) -> bool:
+        name = f"{key}.orig"
+        if self._mem_get(name) is not None:
+            return True
+        path = self._path(name)
+        return bool(path and os.path.exists(path))
+
+    def original(self, image_url: str) -> Optional[bytes]:
+        """Octets de la pochette, téléchargée au plus une fois par nœud (bloquant).
+        Uniquement depuis le CDN Spotify, sans suivre de redirection."""
+        if not is_allowed_url(image_url):
+            return None
+        name = f"{artwork_key(image_url)}.orig"
+        data = self._load(name)
+        if data is not None:
+            return data
+        with self._lock:
+            flight = self._inflight.setdefault(name, threading.Lock())
+        try:
+            with flight:
+                # Un autre thread a pu terminer le téléchargement pendant l'attente
+                data = self._load(name)
+                if data is not None:
+                    return data
+                try:
+                    response = self._session.get(
+                        image_url, timeout=10, allow_redirects=False
+                    )
+                except requests.RequestException:
+                    return None
+                if response.status_code != 200:
+                    return None
+                data = response.content
+                get_metrics().inc("artwork_upstream_fetches")
+                # Verrou gardé jusqu'à l'écriture: les suivants lisent le cache
+                self._store(name, data)
+                return data
+        finally:
+            with self._lock:
+                if self._inflight.get(name) is flight:
+                    self._inflight.pop(name, None)
+
+    def image(self, image_url: str) -> Optional[Image.Image]:
+        """Image PIL RGB (utilisée par l'extraction de couleurs)."""
+        data = self.original(image_url)
+        if data is None:
+            return None
+        try:
+            image = Image.open(io.BytesIO(data))
+            return image if image.mode == "RGB" else image.convert("RGB")
+        except (OSError, ValueError, Image.DecompressionBombError):
+            return None
+
+    # --- miniatures ---
+
+    def thumbnail(self, key: str, size: int, fmt: str) -> Optional[bytes]:
+        """Miniature rendue depuis un original déjà en cache (jamais de fetch amont)."""
+        if (
+            not is_valid_key(key)
+            or size not in ARTWORK_SIZES
+            or fmt not in ARTWORK_FORMATS
+        ):
+            return None
+        name = f"{key}-{size}.{fmt}"
+        data = self._load(name)
+        if data is not None:
+            return data
+        original = self._load(f"{key}.orig")
+        if original is None:
+            return None
+        try:
+            image = Image.open(io.BytesIO(original))
+            image = image if image.mode == "RGB" else image.convert("RGB")
+            image.thumbnail((size, size), Image.Resampling.LANCZOS)
+            out = io.BytesIO()
+            if fmt == "webp":
+                image.save(out, "WEBP", quality=80, method=4)
+            else:
+                image.save(out, "JPEG", quality=85, optimize=True, progressive=True)
+            data = out.getvalue()
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            logging.error(f"❌ Rendu miniature impossible: {e}")
+            return None
+        get_metrics().inc("artwork_thumbnails_rendered")
+        self._store(name, data)
+        return data
+
+
+_ARTWORK: Optional[ArtworkCache] = None
+
+
+def get_artwork() -> ArtworkCache:
+    global _ARTWORK
+    if _ARTWORK is None:
+        _ARTWORK = ArtworkCache()
+    return _ARTWORK
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Backplane temps réel - Diffusion des opérations WebSocket (envoi, kick, fermeture)
+entre workers et nœuds; chaque worker applique celles qui visent ses propres sockets
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional
+from urllib.parse import urlparse
+
+from .metrics import get_metrics
+from ..utils.shortid import new_short_uuid
+
+# Identifiant du worker (diagnostic et mesure de latence inter-workers)
+WORKER_ID = new_short_uuid()[:8]
+
+BatchHandler = Callable[[List[dict]], Awaitable[None]]
+
+
+class Backplane:
+    """Publication groupée: les enveloppes publiées pendant `batch_ms` (ou jusqu'à
+    `batch_max`) partent en un seul message; l'ordre de publication est conservé."""
+
+    distributed = False
+
+    def __init__(self) -> None:
+        self.batch_ms = float(os.getenv("BACKPLANE_BATCH_MS", "5"))
+        self.batch_max = int(os.getenv("BACKPLANE_BATCH_MAX", "100"))
+        self._handler: Optional[BatchHandler] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._flusher: Optional[asyncio.Task] = None
+
+    async def start(self, handler: BatchHandler) -> None:
+        self._handler = handler
+        self._queue = asyncio.Queue()
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        self._queue = None
+
+    @property
+    def started(self) -> bool:
+        return self._queue is not None
+
+    def publish(self, envelope: dict) -> None:
+        """Non bloquant; à appeler depuis la boucle d'événements après `start`."""
+        envelope["origin"] = WORKER_ID
+        envelope["ts"] = time.time()
+        self._queue.put_nowait(envelope)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            if self.batch_ms > 0:
+                await asyncio.sleep(self.batch_ms / 1000.0)
+            while len(batch) < self.batch_max and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            get_metrics().observe("backplane_batch_size", len(batch))
+            try:
+                await self._send_batch(batch)
+            except (RedisError, OSError, asyncio.IncompleteReadError) as e:
+                logging.error(f"❌ Backplane: publication impossible: {e}")
+                get_metrics().inc("backplane_publish_errors")
+                # Au moins les sockets de ce worker sont servies
+                await self._deliver(batch)
+
+    async def _send_batch(self, batch: List[dict]) -> None:
+        await self._deliver(batch)
+
+    async def _deliver(self, batch: List[dict]) -> None:
+        now = time.time()
+        for envelope in batch:
+            get_metrics().observe(
+                "backplane_delivery_latency_ms", (now - envelope.get("ts", now)) * 1000
+            )
+        if self._handler is not None:
+            await self._handler(batch)
+
+
+class LocalBackplane(Backplane):
+    """Défaut mono-processus: la publication est livrée au worker courant."""
+
+
+class RedisBackplane(Backplane):
+    """Pub/sub Redis (protocole RESP sur des streams asyncio, sans dépendance).
+
+    Une connexion PUBLISH et une connexion SUBSCRIBE, reconnectées avec backoff.
+    Chaque worker reçoit aussi ses propres publications: la livraison locale passe
+    par le même chemin que les autres workers.
+    """
+
+    distributed = True
+
+    def __init__(self, url: str, channel: str) -> None:
+        super().__init__()
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.channel = channel
+        self._pub: Optional[tuple] = None
+        self._pub_lock = asyncio.Lock()
+        self._subscriber: Optional[asyncio.Task] = None
+
+    async def start(self, handler: BatchHandler) -> None:
+        await super().start(handler)
+        self._subscriber = asyncio.create_task(self._subscribe_loop())
+
+    async def stop(self) -> None:
+        await super().stop()
+        if self._subscriber is not None:
+            self._subscriber.cancel()
+            self._subscriber = None
+        if self._pub is not None:
+            self._pub[1].close()
+            self._pub = None
+
+    async def _connect(self) -> tuple:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            await _command(writer, "AUTH", self.password)
+            reply = await _read_reply(reader)
+            if isinstance(reply, RedisError):
+                writer.close()
+                raise reply
+        return reader, writer
+
+    async def _send_batch(self, batch: List[dict]) -> None:
+        payload = json.dumps(batch, separators=(",", ":"))
+        async with self._pub_lock:
+            for attempt in (1, 2):
+                try:
+                    if self._pub is None:
+                        self._pub = await self._connect()
+                    reader, writer = self._pub
+                    await _command(writer, "PUBLISH", self.channel, payload)
+                    reply = await _read_reply(reader)
+                    if isinstance(reply, RedisError):
+                        raise reply
+                    return
+                except (OSError, ConnectionError, asyncio.IncompleteReadError):
+                    # Connexion perdue: une reconnexion immédiate, puis échec
+                    if self._pub is not None:
+                        self._pub[1].close()
+                        self._pub = None
+                    if attempt == 2:
+                        raise
+
+    async def _subscribe_loop(self) -> None:
+        backoff = 0.5
+        while True:
+            writer = None
+            try:
+                reader, writer = await self._connect()
+                await _command(writer, "SUBSCRIBE", self.channel)
+                backoff = 0.5
+                while True:
+                    reply = await _read_reply(reader)
+                    if (
+                        isinstance(reply, list)
+                        and len(reply) == 3
+                        and reply[0] == b"message"
+                    ):
+                        try:
+                            batch = json.loads(reply[2])
+                        except ValueError:
+                            batch = None
+                        if not isinstance(batch, list) or not all(
+                            isinstance(e, dict) for e in batch
+                        ):
+                            get_metrics().inc("backplane_decode_errors")
+                            continue
+                        await self._deliver(batch)
+            except asyncio.CancelledError:
+                if writer is not None:
+                    writer.close()
+                raise
+            except (RedisError, OSError, asyncio.IncompleteReadError, ValueError) as e:
+                logging.warning(f"⚠️ Backplane: abonnement Redis perdu ({e})")
+                get_metrics().inc("backplane_reconnects")
+                if writer is not None:
+                    writer.close()
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+
+class RedisError(Exception):
+    pass
+
+
+async def _command(writer: asyncio.StreamWriter, *args: str) -> None:
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        data = arg.encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    writer.write(b"".join(parts))
+    await writer.drain()
+
+
+async def _read_reply(reader: asyncio.StreamReader):
+    line = await reader.readuntil(b"\r\n")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest
+    if kind == b"-":
+        return RedisError(rest.decode(errors="replace"))
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        n = int(rest)
+        if n < 0:
+            return None
+        data = await reader.readexactly(n + 2)
+        return data[:-2]
+    if kind == b"*":
+        n = int(rest)
+        if n < 0:
+            return None
+        return [await _read_reply(reader) for _ in range(n)]
+    raise ConnectionError(f"Réponse RESP inattendue: {line!r}")
+
+
+def make_backplane() -> Backplane:
+    url = os.getenv("REALTIME_BACKPLANE", "local").strip()
+    if url.startswith("redis://"):
+        channel = os.getenv("REALTIME_BACKPLANE_CHANNEL", "melodyhue:realtime")
+        return RedisBackplane(url, channel)
+    return LocalBackplane()
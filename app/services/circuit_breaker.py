@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Disjoncteurs (circuit breakers) - Coupent les appels Spotify qui échouent en boucle
+"""
+
+import os
+import time
+import threading
+from typing import Dict, Optional
+
+from .metrics import get_metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Disjoncteur à trois états avec refroidissement exponentiel.
+
+    - closed: les appels passent, les échecs consécutifs sont comptés
+    - open: les appels sont refusés jusqu'à la fin du refroidissement
+    - half_open: une seule sonde passe; succès => closed, échec => open (délai doublé)
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        base_cooldown: float = 30.0,
+        max_cooldown: float = 3600.0,
+        probe_timeout: float = 30.0,
+    ):
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.base_cooldown = float(base_cooldown)
+        self.max_cooldown = float(max_cooldown)
+        self.probe_timeout = float(probe_timeout)
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.open_until = 0.0
+        self.last_error: Optional[str] = None
+        self.last_failure_at = 0.0
+        self._probe_started_at = 0.0
+
+    def allow(self, now: float | None = None) -> bool:
+        now = time.time() if now is None else now
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if now < self.open_until:
+                    return False
+                self.state = HALF_OPEN
+                self._probe_started_at = 0.0
+            # half_open: une seule sonde à la fois (la sonde expire si jamais conclue)
+            if (
+                self._probe_started_at
+                and now - self._probe_started_at < self.probe_timeout
+            ):
+                return False
+            self._probe_started_at = now
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.trips = 0
+            self.open_until = 0.0
+            self._probe_started_at = 0.0
+
+    def record_failure(self, reason: str | None = None) -> None:
+        now = time.time()
+        tripped = False
+        with self._lock:
+            self.failures += 1
+            self.last_error = reason
+            self.last_failure_at = now
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.trips += 1
+                cooldown = min(
+                    self.max_cooldown, self.base_cooldown * (2 ** (self.trips - 1))
+                )
+                self.state = OPEN
+                self.open_until = now + cooldown
+                self._probe_started_at = 0.0
+                tripped = True
+        if tripped:
+            get_metrics().inc("spotify_breaker_trips")
+
+    def reset(self) -> None:
+        self.record_success()
+
+    def snapshot(self) -> dict:
+        now = time.time()
+        with self._lock:
+            state = self.state
+            if state == OPEN and now >= self.open_until:
+                # Le prochain appel sera une sonde
+                state = HALF_OPEN
+            return {
+                "state": state,
+                "failures": self.failures,
+                "trips": self.trips,
+                "retry_in_s": (
+                    max(0, round(self.open_until - now, 1)) if state == OPEN else 0
+                ),
+                "last_error": self.last_error,
+            }
+
+
+class BreakerRegistry:
+    """Registre des disjoncteurs par clé (`user:<id>`, `client:<client_id>`)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self.base_cooldown = float(os.getenv("SPOTIFY_BREAKER_BASE_COOLDOWN", "30.0"))
+        self.max_cooldown = float(os.getenv("SPOTIFY_BREAKER_MAX_COOLDOWN", "3600.0"))
+
+    def get(self, key: str, failure_threshold: int = 5) -> CircuitBreaker:
+        with self._lock:
+            b = self._breakers.get(key)
+            if b is None:
+                b = CircuitBreaker(
+                    key,
+                    failure_threshold=failure_threshold,
+                    base_cooldown=self.base_cooldown,
+                    max_cooldown=self.max_cooldown,
+                )
+                self._breakers[key] = b
+            return b
+
+    def peek(self, key: str) -> Optional[CircuitBreaker]:
+        with self._lock:
+            return self._breakers.get(key)
+
+    def forget(self, key: str) -> None:
+        with self._lock:
+            self._breakers.pop(key, None)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            items = list(self._breakers.items())
+        counts = {CLOSED: 0, OPEN: 0, HALF_OPEN: 0}
+        not_closed = {}
+        for key, b in items:
+            snap = b.snapshot()
+            counts[snap["state"]] += 1
+            if snap["state"] != CLOSED:
+                not_closed[key] = snap
+        return {"total": len(items), "states": counts, "tripped": not_closed}
+
+
+_REGISTRY: Optional[BreakerRegistry] = None
+
+
+def get_breakers() -> BreakerRegistry:
+    global _REGISTRY
+    if _REGISTRY is None:
+        _REGISTRY = BreakerRegistry()
+        get_metrics().register_collector("spotify_breakers", _REGISTRY.snapshot)
+    return _REGISTRY
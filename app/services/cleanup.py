@@ -7,6 +7,9 @@ from typing import Iterable
 from sqlalchemy.orm import Session
 
 from app.utils.database import SessionLocal
+from app.services.public_cache import get_public_cache
+from app.services.light_feed import get_light_feed
+from app.services.webhooks import get_webhooks
 from app.models.user import (
     User,
     UserBan,
@@ -20,9 +23,10 @@ from app.models.user import (
     TwoFADisable,
     LoginChallenge,
     UserSetting,
+    LightDevice,
+    Webhook,
 )
 
-
 CLEANUP_INTERVAL_SECONDS = 24 * 3600  # 1 jour
 PERMA_BAN_RETENTION_DAYS = 180
 
@@ -61,6 +65,12 @@ def _delete_user_full(db: Session, user_id: str) -> None:
     db.query(LoginChallenge).filter(LoginChallenge.user_id == user_id).delete(
         synchronize_session=False
     )
+    db.query(LightDevice).filter(LightDevice.owner_id == user_id).delete(
+        synchronize_session=False
+    )
+    db.query(Webhook).filter(Webhook.owner_id == user_id).delete(
+        synchronize_session=False
+    )
     db.query(UserSetting).filter(UserSetting.user_id == user_id).delete(
         synchronize_session=False
     )
@@ -91,6 +101,9 @@ def purge_permanent_banned_users(now: datetime | None = None) -> int:
         for uid in user_ids:
             try:
                 _delete_user_full(db, uid)
+                get_public_cache().invalidate_owner(uid)
+                get_light_feed().invalidate(uid)
+                get_webhooks().invalidate(uid)
                 deleted_users += 1
             except Exception:
                 logging.exception(
@@ -3,15 +3,14 @@
 Extracteur de couleurs - Analyse d'images et extraction de couleurs dominantes
 """
 
-import io
-import requests
 from PIL import Image
 
+from .artwork import get_artwork, is_allowed_url
+
 
 class ColorExtractor:
     def __init__(self):
         self.image_cache = {}  # Cache pour les images téléchargées
-        self.session = requests.Session()  # Session persistante
 
     def download_image(self, image_url):
         """Télécharger une image depuis une URL"""
@@ -22,24 +21,22 @@ class ColorExtractor:
         if image_url in self.image_cache:
             return self.image_cache[image_url]
 
-        try:
-            response = self.session.get(image_url, timeout=10, stream=True)
-            if response.status_code == 200:
-                image = Image.open(io.BytesIO(response.content))
-                if image.mode != "RGB":
-                    image = image.convert("RGB")
-
-                # Mettre en cache (limiter à 10 images max)
-                if len(self.image_cache) >= 10:
-                    oldest_key = next(iter(self.image_cache))
-                    del self.image_cache[oldest_key]
-
-                self.image_cache[image_url] = image
-                return image
-            else:
-                return None
-        except Exception:
+        # Pochettes Spotify uniquement, via le cache partagé du nœud (réutilisé par le
+        # proxy /artwork). Les autres URL (payload poussé par un client) ne sont
+        # jamais téléchargées: pas de requête vers un hôte arbitraire.
+        if not is_allowed_url(image_url):
             return None
+        image = get_artwork().image(image_url)
+        if image is not None:
+            self._remember(image_url, image)
+        return image
+
+    def _remember(self, image_url, image):
+        # Mettre en cache (limiter à 10 images max)
+        if len(self.image_cache) >= 10:
+            oldest_key = next(iter(self.image_cache))
+            del self.image_cache[oldest_key]
+        self.image_cache[image_url] = image
 
     def extract_primary_color(self, image):
         """Extraction couleur NATURELLE mais AMPLIFIÉE"""
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Bus d'événements en processus - Événements typés (now-playing, modération, réglages)
+distribués aux consommateurs enregistrés, chacun avec sa file bornée
+"""
+
+import os
+import time
+import asyncio
+import inspect
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, ClassVar, Dict, List, Optional
+
+from .metrics import get_metrics
+
+# Modes d'exécution d'un abonné
+INLINE = "inline"  # dans le thread de l'émetteur: opérations mémoire O(1) uniquement
+ASYNC = "async"  # sur la boucle d'événements (fonction ou coroutine)
+THREAD = "thread"  # sur les threads propres à l'abonné (code bloquant: DB, réseau)
+
+
+@dataclass(frozen=True, kw_only=True)
+class BusEvent:
+    name: ClassVar[str] = "event"
+    user_id: str
+    at: float = field(default_factory=time.time)
+
+
+@dataclass(frozen=True, kw_only=True)
+class NowPlayingEvent(BusEvent):
+    """Nouvel état issu du pipeline d'événements (snapshot déjà publié)."""
+
+    # Type d'événement du pipeline (track_events.TRACK_CHANGED, PLAYBACK_PAUSED, ...)
+    state: str
+    track: Optional[dict]
+    color: tuple
+    detected_at: float
+    processing_time_ms: int = 0
+
+
+@dataclass(frozen=True, kw_only=True)
+class ColorChanged(NowPlayingEvent):
+    """Émis pour chaque nouvel état (piste, reprise, pause, arrêt)."""
+
+    name: ClassVar[str] = "color_changed"
+
+
+@dataclass(frozen=True, kw_only=True)
+class TrackChanged(NowPlayingEvent):
+    name: ClassVar[str] = "track_changed"
+
+
+@dataclass(frozen=True, kw_only=True)
+class PlaybackPaused(NowPlayingEvent):
+    """Pause ou arrêt (`state` = playback_stopped, `track` = None)."""
+
+    name: ClassVar[str] = "playback_paused"
+
+
+@dataclass(frozen=True, kw_only=True)
+class UserBanned(BusEvent):
+    name: ClassVar[str] = "user_banned"
+    moderator_id: str
+    reason: Optional[str] = None
+
+
+@dataclass(frozen=True, kw_only=True)
+class SettingsChanged(BusEvent):
+    name: ClassVar[str] = "settings_changed"
+    default_overlay_color: Optional[str] = None
+
+
+@dataclass(frozen=True, kw_only=True)
+class CredentialsChanged(BusEvent):
+    """Identifiants ou jetons Spotify modifiés (saisie, OAuth, déconnexion)."""
+
+    name: ClassVar[str] = "credentials_changed"
+
+
+class _Subscriber:
+    __slots__ = (
+        "dropped",
+        "executor",
+        "handled",
+        "handler",
+        "mode",
+        "name",
+        "queues",
+        "tasks",
+    )
+
+    def __init__(self, name: str, handler: Callable, mode: str) -> None:
+        self.name = name
+        self.handler = handler
+        self.mode = mode
+        # Une file par shard (THREAD) ou une seule; vide tant que le bus n'a pas démarré
+        self.queues: List[asyncio.Queue] = []
+        self.tasks: List[asyncio.Task] = []
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.handled = 0
+        self.dropped = 0
+
+
+class EventBus:
+    """`publish` n'attend jamais: les abonnés INLINE sont appelés sur place, les
+    autres reçoivent l'événement dans leur file (la plus ancienne entrée est écartée
+    si elle est pleine) et le traitent dans l'ordre, chacun à son rythme.
+
+    Un abonné THREAD a ses propres threads et une file par thread, répartie par
+    utilisateur: l'ordre est conservé pour un utilisateur, et un appel lent (DB,
+    réseau) ne retarde que les utilisateurs de son shard, jamais les autres abonnés.
+
+    Publiable depuis n'importe quel thread (pipeline, routes sync, boucle).
+    """
+
+    def __init__(self) -> None:
+        self.max_queue = int(os.getenv("EVENT_BUS_QUEUE_SIZE", "1000"))
+        self.thread_workers = max(1, int(os.getenv("EVENT_BUS_WORKERS", "4")))
+        self._by_type: Dict[type, List[_Subscriber]] = {}
+        self._subscribers: List[_Subscriber] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        get_metrics().register_collector("event_bus", self._collect)
+
+    def subscribe(
+        self, name: str, handler: Callable, *event_types: type, mode: str = ASYNC
+    ) -> None:
+        """Abonne `handler` aux types donnés (correspondance exacte du type).
+
+        Hors INLINE, à appeler avant `start` ou depuis la boucle d'événements.
+        """
+        sub = _Subscriber(name, handler, mode)
+        self._subscribers.append(sub)
+        for event_type in event_types:
+            self._by_type.setdefault(event_type, []).append(sub)
+        if mode != INLINE and self._loop is not None:
+            self._start_subscriber(sub)
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        for sub in self._subscribers:
+            if sub.mode != INLINE:
+                self._start_subscriber(sub)
+
+    async def stop(self) -> None:
+        for sub in self._subscribers:
+            for task in sub.tasks:
+                task.cancel()
+            sub.tasks = []
+            sub.queues = []
+            if sub.executor is not None:
+                sub.executor.shutdown(wait=False)
+                sub.executor = None
+        self._loop = None
+
+    def _start_subscriber(self, sub: _Subscriber) -> None:
+        shards = 1
+        if sub.mode == THREAD:
+            shards = self.thread_workers
+            sub.executor = ThreadPoolExecutor(
+                max_workers=shards, thread_name_prefix=f"event-bus-{sub.name}"
+            )
+        sub.queues = [asyncio.Queue(maxsize=self.max_queue) for _ in range(shards)]
+        sub.tasks = [asyncio.create_task(self._consume(sub, q)) for q in sub.queues]
+
+    def has_subscribers(self, event_type: type) -> bool:
+        """Permet à l'émetteur de ne pas construire un événement que personne n'écoute."""
+        return bool(self._by_type.get(event_type))
+
+    def publish(self, event: BusEvent) -> None:
+        subs = self._by_type.get(type(event))
+        get_metrics().inc(f"event_bus_published_{event.name}")
+        if not subs:
+            return
+        queued = False
+        for sub in subs:
+            if sub.mode == INLINE:
+                self._call_inline(sub, event)
+            else:
+                queued = True
+        loop = self._loop
+        if not queued or loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._dispatch(event)
+        else:
+            try:
+                loop.call_soon_threadsafe(self._dispatch, event)
+            except RuntimeError:
+                # Boucle fermée (arrêt en cours)
+                get_metrics().inc("event_bus_lost")
+
+    def _call_inline(self, sub: _Subscriber, event: BusEvent) -> None:
+        try:
+            sub.handler(event)
+            sub.handled += 1
+        except Exception:
+            logging.exception(f"❌ Bus: abonné {sub.name} en erreur")
+            get_metrics().inc(f"event_bus_errors_{sub.name}")
+
+    def _dispatch(self, event: BusEvent) -> None:
+        published_at = time.time()
+        for sub in self._by_type.get(type(event), ()):
+            if not sub.queues:
+                continue
+            queue = sub.queues[hash(event.user_id) % len(sub.queues)]
+            if queue.full():
+                queue.get_nowait()
+                sub.dropped += 1
+                get_metrics().inc(f"event_bus_dropped_{sub.name}")
+            queue.put_nowait((event, published_at))
+
+    async def _consume(self, sub: _Subscriber, queue: asyncio.Queue) -> None:
+        loop = asyncio.get_running_loop()
+        metrics = get_metrics()
+        while True:
+            event, published_at = await queue.get()
+            # Retard de l'abonné: attente dans sa file avant traitement
+            metrics.observe(
+                f"event_bus_lag_ms_{sub.name}", (time.time() - published_at) * 1000
+            )
+            try:
+                if sub.mode == THREAD:
+                    await loop.run_in_executor(sub.executor, sub.handler, event)
+                else:
+                    result = sub.handler(event)
+                    if inspect.isawaitable(result):
+                        await result
+                sub.handled += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception(f"❌ Bus: abonné {sub.name} en erreur")
+                metrics.inc(f"event_bus_errors_{sub.name}")
+
+    def _collect(self) -> dict:
+        return {
+            sub.name: {
+                "mode": sub.mode,
+                "queued": sum(q.qsize() for q in sub.queues),
+                "handled": sub.handled,
+                "dropped": sub.dropped,
+            }
+            for sub in self._subscribers
+        }
+
+
+_BUS: Optional[EventBus] = None
+
+
+def get_bus() -> EventBus:
+    global _BUS
+    if _BUS is None:
+        _BUS = EventBus()
+    return _BUS
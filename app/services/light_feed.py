@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Flux couleur pour l'éclairage - Trames UDP signées (HMAC) envoyées aux appareils
+enregistrés à chaque changement détecté par le pipeline d'événements
+"""
+
+import os
+import hmac
+import time
+import socket
+import struct
+import hashlib
+import logging
+import ipaddress
+import threading
+from typing import Dict, List, Optional
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from .metrics import get_metrics
+from .track_events import TRACK_CHANGED, PLAYBACK_RESUMED
+from .event_bus import ColorChanged
+from ..models.user import LightDevice
+from ..utils.database import SessionLocal
+import app.utils.encryption as enc
+
+# Trame: magic "MH", version, flags (bit 0 = lecture en cours), numéro de séquence,
+# horodatage ms, r, g, b, puis HMAC-SHA256 tronqué (16 octets) de l'en-tête.
+FRAME_MAGIC = b"MH"
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct(">2sBBIQ3B")
+FRAME_MAC_SIZE = 16
+FLAG_PLAYING = 0x01
+
+
+def build_frame(secret: bytes, seq: int, rgb: tuple, playing: bool) -> bytes:
+    """Trame de 35 octets. La séquence repart à 1 au redémarrage du worker:
+    l'appareil écarte les trames dont l'horodatage n'est pas plus récent."""
+    r, g, b = (int(c) & 0xFF for c in rgb)
+    header = FRAME_HEADER.pack(
+        FRAME_MAGIC,
+        FRAME_VERSION,
+        FLAG_PLAYING if playing else 0,
+        seq & 0xFFFFFFFF,
+        int(time.time() * 1000),
+        r,
+        g,
+        b,
+    )
+    mac = hmac.new(secret, header, hashlib.sha256).digest()[:FRAME_MAC_SIZE]
+    return header + mac
+
+
+def _allowed_networks() -> list:
+    # Vide: adresses publiques seules; ex. "192.168.0.0/16,10.0.0.0/8" pour le LAN
+    raw = os.getenv("LIGHT_ALLOWED_NETWORKS", "").strip()
+    return [ipaddress.ip_network(n.strip()) for n in raw.split(",") if n.strip()]
+
+
+def resolve_target(host: str, port: int, networks: list) -> Optional[tuple]:
+    """Première adresse unicast autorisée (famille, sockaddr), sinon None: pas de
+    broadcast/multicast, le service ne sert pas d'amplificateur.
+
+    Comme pour les webhooks, les adresses non publiques (privées, loopback,
+    link-local) sont refusées, sauf si elles appartiennent à un réseau listé dans
+    LIGHT_ALLOWED_NETWORKS ou si LIGHT_ALLOW_PRIVATE=true.
+    """
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_DGRAM)
+    except (socket.gaierror, UnicodeError):
+        return None
+    allow_private = os.getenv("LIGHT_ALLOW_PRIVATE", "false").lower() == "true"
+    for family, _, _, _, sockaddr in infos:
+        ip = ipaddress.ip_address(sockaddr[0])
+        if (
+            ip.is_multicast
+            or ip.is_unspecified
+            or ip == ipaddress.ip_address("255.255.255.255")
+        ):
+            continue
+        if networks:
+            # Liste explicite: seule source d'autorisation, y compris pour le LAN
+            if not any(ip in n for n in networks if n.version == ip.version):
+                continue
+        elif not ip.is_global and not allow_private:
+            continue
+        return family, sockaddr
+    return None
+
+
+class LightFeed:
+    """Abonné du bus (`color_changed`): une trame par état et par appareil.
+
+    Les appareils (adresse résolue + clé) sont gardés en mémoire par utilisateur;
+    les routes `/devices` invalident l'entrée à chaque modification.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = os.getenv("LIGHT_FEED_ENABLED", "true").lower() == "true"
+        self.ttl = float(os.getenv("LIGHT_DEVICE_TTL", "300.0"))
+        # Au plus une trame par appareil sur cet intervalle (hors changement de piste)
+        self.min_interval = float(os.getenv("LIGHT_MIN_INTERVAL_MS", "100")) / 1000.0
+        self.networks = _allowed_networks()
+        self._lock = threading.Lock()
+        # user_id -> (chargé_le, [(device_id, family, sockaddr, secret)])
+        self._devices: Dict[str, tuple] = {}
+        # device_id -> (séquence, dernier envoi)
+        self._seq: Dict[str, tuple] = {}
+        self._sockets: Dict[int, socket.socket] = {}
+
+    def invalidate(self, user_id: str) -> None:
+        with self._lock:
+            self._devices.pop(user_id, None)
+
+    def _socket(self, family: int) -> socket.socket:
+        sock = self._sockets.get(family)
+        if sock is None:
+            sock = socket.socket(family, socket.SOCK_DGRAM)
+            sock.setblocking(False)
+            self._sockets[family] = sock
+        return sock
+
+    def _load_devices(self, user_id: str) -> List[tuple]:
+        db = SessionLocal()
+        try:
+            rows = db.query(LightDevice).filter(LightDevice.owner_id == user_id).all()
+        finally:
+            db.close()
+        out = []
+        for d in rows:
+            target = resolve_target(d.host, d.port, self.networks)
+            secret = (enc.decrypt_str(d.secret) or d.secret) if d.secret else None
+            if target is None or not secret:
+                get_metrics().inc("light_device_unresolved")
+                continue
+            out.append((d.id, target[0], target[1], secret.encode()))
+        return out
+
+    def _devices_for(self, user_id: str) -> List[tuple]:
+        with self._lock:
+            cached = self._devices.get(user_id)
+        if cached is not None and time.time() - cached[0] < self.ttl:
+            return cached[1]
+        devices = self._load_devices(user_id)
+        with self._lock:
+            self._devices[user_id] = (time.time(), devices)
+        return devices
+
+    def on_color_changed(self, event: ColorChanged) -> None:
+        """Appelé sur l'exécuteur du bus, juste après l'extraction."""
+        user_id = event.user_id
+        if not self.enabled:
+            return
+        try:
+            devices = self._devices_for(user_id)
+        except SQLAlchemyError as e:
+            logging.error(f"❌ Flux lumières: appareils indisponibles: {e}")
+            return
+        if not devices:
+            return
+        playing = event.state in (TRACK_CHANGED, PLAYBACK_RESUMED)
+        metrics = get_metrics()
+        now = time.time()
+        for device_id, family, sockaddr, secret in devices:
+            with self._lock:
+                seq, last = self._seq.get(device_id, (0, 0.0))
+                if event.state != TRACK_CHANGED and now - last < self.min_interval:
+                    metrics.inc("light_frames_throttled")
+                    continue
+                seq += 1
+                self._seq[device_id] = (seq, now)
+            frame = build_frame(secret, seq, event.color, playing)
+            try:
+                # UDP non bloquant: l'abonné n'attend jamais le réseau
+                self._socket(family).sendto(frame, sockaddr)
+                metrics.inc("light_frames_sent")
+            except OSError:
+                metrics.inc("light_send_errors")
+        metrics.observe(
+            "light_emit_latency_ms", (time.time() - event.detected_at) * 1000
+        )
+
+
+_FEED: Optional[LightFeed] = None
+
+
+def get_light_feed() -> LightFeed:
+    global _FEED
+    if _FEED is None:
+        _FEED = LightFeed()
+    return _FEED
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+Surveillance de la boucle d'événements - Mesure le retard (lag) causé par du code bloquant
+"""
+
+import os
+import time
+import asyncio
+import logging
+
+from .metrics import get_metrics
+
+
+async def loop_lag_monitor(stop_event: asyncio.Event | None = None) -> None:
+    """Tâche asynchrone: un sommeil qui se réveille en retard = boucle bloquée."""
+    interval = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+    warn_ms = float(os.getenv("LOOP_LAG_WARN_MS", "100"))
+    metrics = get_metrics()
+    while stop_event is None or not stop_event.is_set():
+        started = time.perf_counter()
+        try:
+            await asyncio.sleep(interval)
+        except asyncio.CancelledError:
+            break
+        lag_ms = (time.perf_counter() - started - interval) * 1000
+        metrics.observe("event_loop_lag_ms", lag_ms)
+        if lag_ms > warn_ms:
+            metrics.inc("event_loop_blocked")
+            logging.warning(f"⚠️ Boucle d'événements bloquée {lag_ms:.0f} ms")
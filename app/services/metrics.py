@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Métriques en mémoire - Compteurs, jauges et collecteurs exposés aux admins
+"""
+
+import logging
+import threading
+from typing import Callable, Dict, Optional
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+        # name -> {"count", "sum", "max", "last"}
+        self._observations: Dict[str, Dict[str, float]] = {}
+        # Collecteurs appelés à la lecture (état calculé à la demande)
+        self._collectors: Dict[str, Callable[[], dict]] = {}
+
+    def inc(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def get_counter(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def set_gauge(self, name: str, value: float) -> None:
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            o = self._observations.get(name)
+            if o is None:
+                o = {"count": 0, "sum": 0.0, "max": value, "last": value}
+                self._observations[name] = o
+            o["count"] += 1
+            o["sum"] += value
+            o["last"] = value
+            o["max"] = max(o["max"], value)
+
+    def register_collector(self, name: str, fn: Callable[[], dict]) -> None:
+        with self._lock:
+            self._collectors[name] = fn
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            observations = {
+                k: {
+                    **v,
+                    "avg": (v["sum"] / v["count"]) if v["count"] else 0.0,
+                }
+                for k, v in self._observations.items()
+            }
+            collectors = dict(self._collectors)
+        out: dict = {
+            "counters": counters,
+            "gauges": gauges,
+            "observations": observations,
+        }
+        for name, fn in collectors.items():
+            try:
+                out[name] = fn()
+            except Exception as e:
+                # Un collecteur défaillant ne doit pas casser l'export
+                logging.warning(f"⚠️ Métriques: collecteur {name}: {e}", exc_info=True)
+                out[name] = {"error": str(e)}
+        return out
+
+
+_METRICS: Optional[Metrics] = None
+
+
+def get_metrics() -> Metrics:
+    global _METRICS
+    if _METRICS is None:
+        _METRICS = Metrics()
+    return _METRICS
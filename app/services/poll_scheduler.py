@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Ordonnanceur de polling Spotify - Tas d'échéances, classes de priorité et plafond global
+"""
+
+import os
+import time
+import heapq
+import logging
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from .metrics import get_metrics
+
+# Classes de priorité (plus petit = plus prioritaire)
+LIVE = 0  # overlays/viewers connectés
+ACTIVE = 1  # utilisateur sollicité récemment (HTTP)
+BACKGROUND = 2  # le reste
+
+CLASS_NAMES = {LIVE: "live", ACTIVE: "active", BACKGROUND: "background"}
+
+
+class PollScheduler:
+    """Décide quel utilisateur poller ensuite.
+
+    - `_timers`: tas (échéance, seq, clé) des prochains polls
+    - `_ready`: polls échus, triés par échéance + pénalité de classe. Quand le plafond
+      req/s est atteint, les viewers live passent devant; la pénalité borne l'attente
+      des classes basses (vieillissement) pour garantir l'équité.
+    """
+
+    def __init__(self) -> None:
+        self.max_rps = float(os.getenv("SPOTIFY_POLL_MAX_RPS", "20.0"))
+        self.workers = int(os.getenv("SPOTIFY_POLL_WORKERS", "8"))
+        self.active_window = float(os.getenv("SPOTIFY_ACTIVE_WINDOW", "300.0"))
+        self.background_factor = float(
+            os.getenv("SPOTIFY_BACKGROUND_INTERVAL_FACTOR", "5.0")
+        )
+        self.class_penalty = {LIVE: 0.0, ACTIVE: 2.0, BACKGROUND: 10.0}
+        self.error_backoff = 10.0
+
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._timers: List[tuple] = []
+        self._ready: List[tuple] = []
+        # clé -> (extracteur, seq du timer valide)
+        self._entries: Dict[int, tuple] = {}
+        self._in_flight = 0
+        self._live_probes: List[Callable[[str], bool]] = []
+        self._access_probes: List[Callable[[str], float]] = []
+
+        # Seau à jetons pour le plafond global de requêtes/s
+        self._tokens = self.max_rps
+        self._last_refill = time.monotonic()
+
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._running = False
+        self._late_ms = 0.0
+        get_metrics().register_collector("spotify_scheduler", self.snapshot)
+
+    # --- API publique ---
+
+    def add_live_probe(self, probe: Callable[[str], bool]) -> None:
+        """Enregistre une sonde `user_id -> bool` (viewers live présents)."""
+        self._live_probes.append(probe)
+
+    def add_access_probe(self, probe: Callable[[str], float]) -> None:
+        """Enregistre une sonde `user_id -> horodatage` de dernière sollicitation
+        ailleurs (ex. autres workers)."""
+        self._access_probes.append(probe)
+
+    def register(self, extractor, delay: float = 0.0) -> None:
+        self._ensure_started()
+        key = id(extractor)
+        with self._cond:
+            if key in self._entries:
+                return
+            self._schedule_locked(key, extractor, time.monotonic() + delay)
+            self._cond.notify()
+
+    def unregister(self, extractor) -> None:
+        with self._cond:
+            # Les entrées orphelines des tas seront ignorées (seq invalide)
+            self._entries.pop(id(extractor), None)
+
+    def wake(self, extractor) -> None:
+        """Avance le prochain poll d'un extracteur (ex: un viewer vient de se connecter)."""
+        key = id(extractor)
+        with self._cond:
+            if key in self._entries:
+                self._schedule_locked(key, extractor, time.monotonic())
+                self._cond.notify()
+
+    def acquire(self, timeout: float = 5.0) -> bool:
+        """Jeton du plafond global pour un appel Spotify hors polling (file de
+        lecture...). Attend au plus `timeout` secondes; False si refusé."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                wait = self._take_token_locked(now)
+                if wait <= 0:
+                    return True
+                if now + wait > deadline:
+                    get_metrics().inc("spotify_extra_throttled")
+                    return False
+                self._cond.wait(wait)
+
+    def stop(self) -> None:
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self._thread = None
+
+    def classify(self, extractor) -> int:
+        user_id = getattr(extractor, "user_id", None)
+        if user_id:
+            for probe in self._live_probes:
+                try:
+                    if probe(user_id):
+                        return LIVE
+                except Exception:
+                    logging.debug("Sonde de présence en erreur", exc_info=True)
+        last_access = getattr(extractor, "last_access_at", 0)
+        if user_id:
+            for probe in self._access_probes:
+                try:
+                    last_access = max(last_access, probe(user_id))
+                except Exception:
+                    logging.debug("Sonde d'accès en erreur", exc_info=True)
+        if time.time() - last_access < self.active_window:
+            return ACTIVE
+        return BACKGROUND
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            by_class = {name: 0 for name in CLASS_NAMES.values()}
+            for item in self._ready:
+                by_class[CLASS_NAMES[item[4]]] += 1
+            return {
+                "registered": len(self._entries),
+                "scheduled": len(self._timers),
+                "ready": len(self._ready),
+                "ready_by_class": by_class,
+                "in_flight": self._in_flight,
+                "max_rps": self.max_rps,
+                "last_late_ms": round(self._late_ms, 1),
+            }
+
+    # --- Interne ---
+
+    def _ensure_started(self) -> None:
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="spotify-poll"
+            )
+            self._thread = threading.Thread(
+                target=self._run, name="spotify-poll-scheduler", daemon=True
+            )
+            self._thread.start()
+
+    def _schedule_locked(self, key: int, extractor, deadline: float) -> None:
+        seq = next(self._seq)
+        self._entries[key] = (extractor, seq)
+        heapq.heappush(self._timers, (deadline, seq, key))
+
+    def _interval_for(self, extractor, cls: int) -> float:
+        base = float(getattr(extractor, "spotify_check_interval", 3.0))
+        return base * self.background_factor if cls == BACKGROUND else base
+
+    def _take_token_locked(self, now: float) -> float:
+        """Consomme un jeton; retourne 0 si ok, sinon le délai avant le prochain."""
+        if self.max_rps <= 0:
+            return 0.0
+        self._tokens = min(
+            self.max_rps, self._tokens + (now - self._last_refill) * self.max_rps
+        )
+        self._last_refill = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.max_rps
+
+    def _pop_due_locked(self, now: float) -> List[tuple]:
+        """Retire les timers échus: (échéance, seq, clé, extracteur) à classer."""
+        due = []
+        while self._timers and self._timers[0][0] <= now:
+            deadline, seq, key = heapq.heappop(self._timers)
+            entry = self._entries.get(key)
+            if entry and entry[1] == seq:
+                due.append((deadline, seq, key, entry[0]))
+        return due
+
+    def _promote(self, due: List[tuple]) -> None:
+        # Hors verrou: les sondes peuvent interroger le backplane ou la table partagée
+        classified = [(item, self.classify(item[3])) for item in due]
+        with self._cond:
+            for (deadline, seq, key, _), cls in classified:
+                entry = self._entries.get(key)
+                # Désinscrit ou réveillé (wake) pendant le classement: timer caduc
+                if not entry or entry[1] != seq:
+                    continue
+                heapq.heappush(
+                    self._ready,
+                    (deadline + self.class_penalty[cls], seq, deadline, key, cls),
+                )
+
+    def _run(self) -> None:
+        metrics = get_metrics()
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                due = self._pop_due_locked(time.monotonic())
+            if due:
+                self._promote(due)
+            with self._cond:
+                if not self._running:
+                    return
+                now = time.monotonic()
+                metrics.set_gauge("spotify_poll_queue_depth", len(self._ready))
+                if not self._ready:
+                    timeout = self._timers[0][0] - now if self._timers else 1.0
+                    self._cond.wait(max(0.01, min(timeout, 1.0)))
+                    continue
+                _, seq, deadline, key, cls = self._ready[0]
+                entry = self._entries.get(key)
+                if not entry or entry[1] != seq:
+                    heapq.heappop(self._ready)
+                    continue
+                extractor = entry[0]
+            # Hors verrou: needs_poll peut vérifier la propriété du slot partagé (flock)
+            due = extractor.needs_poll()
+            with self._cond:
+                if not self._running:
+                    return
+                head = self._ready[0] if self._ready else None
+                entry = self._entries.get(key)
+                if head is None or head[1] != seq or not entry or entry[1] != seq:
+                    # File modifiée pendant la vérification (wake, unregister): réévaluer
+                    continue
+                now = time.monotonic()
+                if not due:
+                    # Rien à faire (push actif, disjoncteur ouvert...): pas de jeton consommé
+                    heapq.heappop(self._ready)
+                    self._schedule_locked(
+                        key, extractor, now + self._interval_for(extractor, cls)
+                    )
+                    continue
+                wait = self._take_token_locked(now)
+                if wait > 0:
+                    metrics.inc("spotify_poll_throttled")
+                    self._cond.wait(wait)
+                    continue
+                heapq.heappop(self._ready)
+                self._in_flight += 1
+                self._late_ms = (now - deadline) * 1000
+            metrics.observe("spotify_poll_lateness_ms", self._late_ms)
+            metrics.inc(f"spotify_polls_{CLASS_NAMES[cls]}")
+            executor = self._executor
+            if executor is None:
+                return
+            executor.submit(self._poll, key, seq, extractor, cls)
+
+    def _poll(self, key: int, seq: int, extractor, cls: int) -> None:
+        delay = self._interval_for(extractor, cls)
+        try:
+            extractor.poll_once()
+        except Exception:
+            logging.exception("❌ Erreur monitoring")
+            delay = self.error_backoff
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                entry = self._entries.get(key)
+                # Ne pas écraser un réveil anticipé (wake) arrivé pendant le poll
+                if entry and entry[1] == seq:
+                    self._schedule_locked(key, extractor, time.monotonic() + delay)
+                    self._cond.notify()
+
+
+_SCHEDULER: Optional[PollScheduler] = None
+
+
+def get_scheduler() -> PollScheduler:
+    global _SCHEDULER
+    if _SCHEDULER is None:
+        _SCHEDULER = PollScheduler()
+    return _SCHEDULER
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Cache des projections publiques - Overlays et profils servis sans DB, invalidés par
+les routes d'écriture (diffusées aux autres workers par le backplane)
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from sqlalchemy.orm import Session
+
+from .metrics import get_metrics
+from ..models.user import Overlay, User, UserSetting
+from ..schemas.overlay import OverlayOut
+from ..schemas.user import PublicUserOut
+from ..utils.security import gravatar_url
+from ..utils.database import SessionLocal
+
+DEFAULT_OVERLAY_COLOR = "#25d865"
+
+
+class TTLCache:
+    """LRU borné avec expiration, sûr entre threads.
+
+    `on_evict(clé, valeur)` est appelé hors verrou pour toute entrée retirée
+    (expiration, éviction LRU, invalidation).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_size: int,
+        ttl: float,
+        on_evict: Optional[Callable[[str, object], None]] = None,
+    ):
+        self.name = name
+        self.max_size = max(1, int(max_size))
+        self.ttl = float(ttl)
+        self.on_evict = on_evict
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[str, tuple[float, object]]" = OrderedDict()
+        # clé -> [génération, chargements en cours]; `pop` incrémente la génération
+        # pour que le résultat d'un chargement lancé avant l'invalidation soit ignoré
+        self._loading: dict[str, list] = {}
+
+    def get(self, key: str):
+        evicted = None
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.time():
+                if item is not None:
+                    evicted = self._data.pop(key, None)
+            else:
+                self._data.move_to_end(key)
+        if item is None or evicted is not None:
+            self._evicted([(key, evicted)] if evicted else [])
+            get_metrics().inc(f"{self.name}_cache_misses")
+            return None
+        get_metrics().inc(f"{self.name}_cache_hits")
+        return item[1]
+
+    def peek(self, key: str):
+        """Valeur présente (même expirée), sans effet sur l'ordre LRU ni les métriques."""
+        with self._lock:
+            item = self._data.get(key)
+        return item[1] if item is not None else None
+
+    def set(self, key: str, value) -> None:
+        with self._lock:
+            evicted = self._set_locked(key, value)
+        self._evicted(evicted)
+
+    def begin_load(self, key: str) -> int:
+        """Génération courante de la clé, à rendre à `end_load`."""
+        with self._lock:
+            entry = self._loading.setdefault(key, [0, 0])
+            entry[1] += 1
+            return entry[0]
+
+    def end_load(self, key: str, generation: int, value) -> bool:
+        """Met en cache le résultat (si non None) sauf invalidation depuis
+        `begin_load`; à appeler même si le chargement a échoué."""
+        evicted = []
+        with self._lock:
+            entry = self._loading[key]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._loading[key]
+            stored = value is not None and entry[0] == generation
+            if stored:
+                evicted = self._set_locked(key, value)
+        self._evicted(evicted)
+        return stored
+
+    def pop(self, key: str) -> None:
+        with self._lock:
+            item = self._data.pop(key, None)
+            entry = self._loading.get(key)
+            if entry is not None:
+                entry[0] += 1
+        self._evicted([(key, item)] if item is not None else [])
+
+    def _set_locked(self, key: str, value) -> list:
+        previous = self._data.get(key)
+        self._data[key] = (time.time() + self.ttl, value)
+        self._data.move_to_end(key)
+        evicted = []
+        if previous is not None and previous[1] is not value:
+            evicted.append((key, previous))
+        while len(self._data) > self.max_size:
+            evicted.append(self._data.popitem(last=False))
+        return evicted
+
+    def _evicted(self, items: list) -> None:
+        if self.on_evict is not None:
+            for key, item in items:
+                self.on_evict(key, item[1])
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def load_overlay_projection(db: Session, overlay_id: str) -> Optional[dict]:
+    """Projection publique d'un overlay + couleur par défaut du propriétaire (1 requête).
+
+    `owner_id` est conservé pour l'usage interne uniquement: ne jamais le sérialiser.
+    """
+    row = (
+        db.query(Overlay, UserSetting.default_overlay_color)
+        .outerjoin(UserSetting, UserSetting.user_id == Overlay.owner_id)
+        .filter(Overlay.id == overlay_id)
+        .first()
+    )
+    if not row:
+        return None
+    ov, default_color = row
+    return {
+        "overlay": OverlayOut.model_validate(ov).model_dump(mode="json"),
+        "owner_id": ov.owner_id,
+        "default_color": default_color or DEFAULT_OVERLAY_COLOR,
+        "updated_ms": int(ov.updated_at.timestamp() * 1000),
+    }
+
+
+def load_profile_projection(db: Session, user_id: str) -> Optional[dict]:
+    """Projection publique d'un profil (1 requête, gravatar calculé une fois)."""
+    row = (
+        db.query(User, UserSetting.default_overlay_color)
+        .outerjoin(UserSetting, UserSetting.user_id == User.id)
+        .filter(User.id == user_id)
+        .first()
+    )
+    if not row:
+        return None
+    u, default_color = row
+    out = PublicUserOut(
+        id=u.id,
+        username=u.username,
+        created_at=u.created_at,
+        avatar_url=gravatar_url(u.email),
+        default_overlay_color=default_color or None,
+    )
+    return out.model_dump(mode="json")
+
+
+class PublicCache:
+    """Lecture traversante; les routes d'écriture appellent `invalidate_*`.
+
+    L'invalidation est appliquée localement puis diffusée aux autres workers
+    (`set_broadcaster`, backplane distribué). Sans backplane distribué, le TTL est
+    raccourci au démarrage si plusieurs workers tournent (`limit_ttl`).
+    """
+
+    def __init__(self) -> None:
+        ttl = float(os.getenv("PUBLIC_CACHE_TTL", "300.0"))
+        size = int(os.getenv("PUBLIC_CACHE_SIZE", "10000"))
+        self.overlays = TTLCache(
+            "public_overlay", size, ttl, on_evict=self._unlink_overlay
+        )
+        self.profiles = TTLCache("public_profile", size, ttl)
+        # owner_id -> overlays en cache (pour invalider via le propriétaire); les
+        # entrées retirées du cache en sont retirées aussi (`_unlink_overlay`)
+        self._overlays_by_owner: dict[str, set] = {}
+        self._owners_lock = threading.Lock()
+        # Incrémenté à chaque invalidation "owner": le propriétaire d'un overlay en
+        # cours de chargement n'est connu qu'après la requête
+        self._owner_epoch = 0
+        # (type, clé) -> autres workers; appelable depuis n'importe quel thread
+        self._broadcast: Optional[Callable[[str, str], None]] = None
+        get_metrics().register_collector(
+            "public_cache",
+            lambda: {"overlays": len(self.overlays), "profiles": len(self.profiles)},
+        )
+
+    async def overlay(self, overlay_id: str, run_io: Callable) -> Optional[dict]:
+        proj = self.overlays.get(overlay_id)
+        if proj is not None:
+            return proj
+        generation = self.overlays.begin_load(overlay_id)
+        epoch = self._owner_epoch
+        proj = None
+        try:
+            proj = await run_io(_with_session, load_overlay_projection, overlay_id)
+        finally:
+            # Invalidation pendant le chargement: résultat servi mais pas mis en cache
+            cached = self.overlays.end_load(
+                overlay_id, generation, proj if epoch == self._owner_epoch else None
+            )
+        if cached:
+            self._link_overlay(proj["owner_id"], overlay_id, proj)
+        return proj
+
+    async def profile(self, user_id: str, run_io: Callable) -> Optional[dict]:
+        proj = self.profiles.get(user_id)
+        if proj is not None:
+            return proj
+        generation = self.profiles.begin_load(user_id)
+        proj = None
+        try:
+            proj = await run_io(_with_session, load_profile_projection, user_id)
+        finally:
+            self.profiles.end_load(user_id, generation, proj)
+        return proj
+
+    def _link_overlay(self, owner_id: str, overlay_id: str, proj: dict) -> None:
+        with self._owners_lock:
+            self._overlays_by_owner.setdefault(owner_id, set()).add(overlay_id)
+            # Retiré du cache avant l'ajout (invalidation, éviction): défaire le lien
+            if self.overlays.peek(overlay_id) is not proj:
+                self._discard_link_locked(owner_id, overlay_id)
+
+    def _unlink_overlay(self, overlay_id: str, proj) -> None:
+        with self._owners_lock:
+            self._discard_link_locked(proj["owner_id"], overlay_id)
+
+    def _discard_link_locked(self, owner_id: str, overlay_id: str) -> None:
+        ids = self._overlays_by_owner.get(owner_id)
+        if ids is not None:
+            ids.discard(overlay_id)
+            if not ids:
+                del self._overlays_by_owner[owner_id]
+
+    def set_broadcaster(self, fn: Callable[[str, str], None]) -> None:
+        self._broadcast = fn
+
+    def limit_ttl(self, ttl: float) -> None:
+        for cache in (self.overlays, self.profiles):
+            cache.ttl = min(cache.ttl, float(ttl))
+
+    def invalidate_overlay(self, overlay_id: str) -> None:
+        self._invalidate("overlay", overlay_id)
+
+    def invalidate_profile(self, user_id: str) -> None:
+        self._invalidate("profile", user_id)
+
+    def invalidate_owner(self, user_id: str) -> None:
+        """Profil + tous les overlays du propriétaire (couleur par défaut, suppression)."""
+        self._invalidate("owner", user_id)
+
+    def _invalidate(self, kind: str, key: str) -> None:
+        self.apply_invalidation(kind, key)
+        if self._broadcast is not None:
+            self._broadcast(kind, key)
+
+    def apply_invalidation(self, kind: str, key: str) -> None:
+        """Invalidation locale (écriture sur ce worker ou reçue d'un autre worker)."""
+        if kind == "overlay":
+            self.overlays.pop(key)
+        elif kind == "profile":
+            self.profiles.pop(key)
+        elif kind == "owner":
+            self.profiles.pop(key)
+            with self._owners_lock:
+                self._owner_epoch += 1
+                overlay_ids = self._overlays_by_owner.pop(key, set())
+            for overlay_id in overlay_ids:
+                self.overlays.pop(overlay_id)
+
+
+def _with_session(loader: Callable, key: str):
+    db = SessionLocal()
+    try:
+        return loader(db, key)
+    finally:
+        db.close()
+
+
+_CACHE: Optional[PublicCache] = None
+
+
+def get_public_cache() -> PublicCache:
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = PublicCache()
+    return _CACHE
@@ -1,35 +1,505 @@
-from typing import Dict, Set
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Callable, Dict, List, Optional, Set
 from fastapi import WebSocket
 
+from .backplane import Backplane, make_backplane
+from .metrics import get_metrics
+from .snapshots import Snapshot, get_snapshots
+from .ws_encoding import JSON, Frame, delta_message, encode
+from .event_bus import ColorChanged
+
+# Politique quand la file d'une socket est pleine
+DROP_OLDEST = "drop_oldest"
+COALESCE = "coalesce"
+DISCONNECT = "disconnect"
+SLOW_CONSUMER_POLICIES = (DROP_OLDEST, COALESCE, DISCONNECT)
+# Messages "état courant": seul le dernier compte pour un client en retard.
+# Les topics (clé = nom du topic) sont aussi des états.
+COALESCABLE_TYPES = {"now_playing"}
+CLOSE_MARKER = "__close__"
+SLOW_CONSUMER_CLOSE_CODE = 4408
+IDLE_CLOSE_CODE = 4000
+# Ping applicatif: ni compté comme message, ni mis en file derrière du trafic réel
+PING_FRAME = Frame({"type": "ping"})
+
+
+class Connection:
+    """Socket + file sortante bornée, vidée par une tâche d'écriture dédiée.
+
+    Un client lent ne retarde ni les autres sockets ni l'appelant: l'envoi se limite
+    à un ajout en file (trame encodée une fois par encodage, partagée entre sockets).
+    En mode delta, les états (clé non nulle) sont envoyés en différentiel par rapport
+    au dernier état de même clé envoyé sur cette socket.
+    """
+
+    def __init__(
+        self,
+        user_id: str,
+        websocket: WebSocket,
+        manager: "ConnectionManager",
+        max_queue: int,
+        policy: str,
+        encoding: str = JSON,
+        delta: bool = False,
+        heartbeat: bool = False,
+    ) -> None:
+        self.user_id = user_id
+        self.websocket = websocket
+        self.manager = manager
+        self.max_queue = max_queue
+        self.policy = policy
+        self.encoding = encoding
+        self.delta = delta
+        # Pings applicatifs demandés à la poignée de main (`?heartbeat=1`)
+        self.heartbeat = heartbeat
+        self._last_sent: Dict[str, dict] = {}
+        # Entrées: (clé de coalescence | None, Frame) ou (CLOSE_MARKER, (code, raison))
+        self.queue: deque = deque()
+        self.topics: Set[str] = set()
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        # Dernier message reçu du client (pong ou autre): base du reaping
+        self.last_seen = time.monotonic()
+        self._task = asyncio.create_task(self._writer())
+
+    def enqueue(self, frame: Frame, key: Optional[str] = None) -> None:
+        if self._closing:
+            return
+        if len(self.queue) >= self.max_queue and not self._make_room(key):
+            return
+        self.queue.append((key, frame))
+        self._wakeup.set()
+
+    def _make_room(self, key: Optional[str]) -> bool:
+        metrics = get_metrics()
+        if self.policy == DISCONNECT:
+            metrics.inc("ws_slow_consumer_disconnects")
+            self.close(SLOW_CONSUMER_CLOSE_CODE, "slow_consumer")
+            return False
+        if self.policy == COALESCE and key is not None:
+            # Ne garder que le nouvel état: les états en attente sont périmés
+            kept = deque(e for e in self.queue if e[0] != key)
+            coalesced = len(self.queue) - len(kept)
+            if coalesced:
+                self.queue = kept
+                metrics.inc("ws_messages_coalesced", coalesced)
+                return True
+        # Sacrifier d'abord un état (renvoyé au prochain changement), pas un
+        # message de contrôle (force_logout, ack...)
+        for i, (k, _) in enumerate(self.queue):
+            if k is not None and k != CLOSE_MARKER:
+                del self.queue[i]
+                break
+        else:
+            self.queue.popleft()
+        metrics.inc("ws_messages_dropped")
+        return True
+
+    @property
+    def closing(self) -> bool:
+        return self._closing
+
+    def close(self, code: int, reason: str) -> None:
+        """Fermeture après les messages déjà en file (ex. force_logout puis close)."""
+        if self._closing:
+            return
+        self._closing = True
+        self.queue.append((CLOSE_MARKER, (code, reason)))
+        self._wakeup.set()
+
+    def forget_state(self, key: str) -> None:
+        """Le prochain état de cette clé partira complet (ex. réabonnement)."""
+        self._last_sent.pop(key, None)
+
+    def cancel(self) -> None:
+        # Appelé aussi depuis le writer lui-même (socket morte): rien à annuler
+        if self._task is not asyncio.current_task():
+            self._task.cancel()
+
+    async def _writer(self) -> None:
+        metrics = get_metrics()
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                while self.queue:
+                    key, data = self.queue.popleft()
+                    if key == CLOSE_MARKER:
+                        code, reason = data
+                        await self.websocket.close(code=code, reason=reason)
+                        return
+                    ping = data is PING_FRAME
+                    if ping:
+                        payload = data.encoded(self.encoding)
+                    else:
+                        payload = self._payload(key, data)
+                    if payload is None:
+                        continue
+                    started = time.perf_counter()
+                    if isinstance(payload, bytes):
+                        await self.websocket.send_bytes(payload)
+                    else:
+                        await self.websocket.send_text(payload)
+                    if ping:
+                        metrics.inc("ws_pings_sent")
+                        continue
+                    metrics.inc("ws_messages_sent")
+                    metrics.inc(f"ws_bytes_sent_{self.encoding}", len(payload))
+                    metrics.inc(f"ws_messages_sent_{self.encoding}")
+                    metrics.observe(
+                        "ws_send_ms", (time.perf_counter() - started) * 1000
+                    )
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Socket morte: la retirer sans attendre la boucle de réception
+            logging.debug("WebSocket: envoi impossible", exc_info=True)
+        finally:
+            self.manager.disconnect(self.user_id, self.websocket)
+
+    def _payload(self, key: Optional[str], frame: Frame):
+        if not self.delta or key is None:
+            return frame.encoded(self.encoding)
+        prev = self._last_sent.get(key)
+        self._last_sent[key] = frame.message
+        if prev is None:
+            return frame.encoded(self.encoding)
+        # Différentiel propre à la socket: encodé pour elle seule
+        message = delta_message(prev, frame.message)
+        if message is None:
+            get_metrics().inc("ws_delta_skipped")
+            return None
+        return encode(message, self.encoding)
+
 
 class ConnectionManager:
-    def __init__(self) -> None:
-        # Map user_id -> set of websockets
-        self._by_user: Dict[str, Set[WebSocket]] = {}
+    """Sockets de ce worker; `send_to_user`, `kick_user` et `close_user` passent par le
+    backplane et sont appliqués par le worker qui détient les sockets visées."""
+
+    def __init__(self, backplane: Backplane | None = None) -> None:
+        # Map user_id -> websocket -> connexion (file + writer)
+        self._by_user: Dict[str, Dict[WebSocket, Connection]] = {}
+        # Boucle d'événements du worker (pour les envois depuis les threads de polling)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self.backplane = backplane or make_backplane()
+        self.max_queue = max(1, int(os.getenv("WS_SEND_QUEUE_SIZE", "64")))
+        policy = os.getenv("WS_SLOW_CONSUMER_POLICY", COALESCE).strip().lower()
+        if policy not in SLOW_CONSUMER_POLICIES:
+            logging.warning(f"⚠️ WS_SLOW_CONSUMER_POLICY inconnue: {policy}")
+            policy = COALESCE
+        self.policy = policy
+        # Heartbeats applicatifs et reaping des sockets muettes. Désactivé par défaut:
+        # les clients existants ne répondent pas au ping applicatif; la vivacité TCP
+        # est assurée par les ping/pong du protocole (uvicorn --ws-ping-interval).
+        # Sans reaping, seuls les clients qui l'ont demandé reçoivent des pings.
+        self.heartbeat_interval = float(os.getenv("WS_HEARTBEAT_INTERVAL", "25.0"))
+        self.idle_timeout = float(os.getenv("WS_IDLE_TIMEOUT", "0.0"))
+        self._reaper: Optional[asyncio.Task] = None
+        # Admission: bornes par utilisateur et par worker
+        self.max_per_user = int(os.getenv("WS_MAX_PER_USER", "10"))
+        self.max_connections = int(os.getenv("WS_MAX_CONNECTIONS", "5000"))
+        self.reject_code = int(os.getenv("WS_REJECT_CODE", "4429"))
+        self._count = 0
+        # Topics: nom -> connexions abonnées; un observateur de snapshot par topic
+        self.max_topics = int(os.getenv("WS_MAX_TOPICS", "20"))
+        self._topics: Dict[str, Set[Connection]] = {}
+        self._watchers: Dict[str, asyncio.Task] = {}
+        # Invalidations de caches reçues des autres workers: fn(type, clé)
+        self._invalidation_handlers: List[Callable[[str, str], None]] = []
+        get_metrics().register_collector("websockets", self._stats)
+
+    def _stats(self) -> dict:
+        depths = [
+            len(c.queue) for conns in self._by_user.values() for c in conns.values()
+        ]
+        return {
+            "users": len(self._by_user),
+            "connections": len(depths),
+            "queued": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "policy": self.policy,
+            "topics": len(self._topics),
+        }
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+
+    async def start(self) -> None:
+        await self.backplane.start(self._apply_batch)
+        if self.heartbeat_interval > 0:
+            self._reaper = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop(self) -> None:
+        await self.backplane.stop()
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+
+    async def _heartbeat_loop(self) -> None:
+        """Une seule tâche par worker: ping les sockets actives, ferme les muettes.
+        Seuls les messages reçus du client comptent comme activité (`touch`)."""
+        reaping = self.idle_timeout > 0
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            now = time.monotonic()
+            for conns in list(self._by_user.values()):
+                for conn in list(conns.values()):
+                    idle = now - conn.last_seen
+                    if not reaping or idle <= self.idle_timeout:
+                        # Trafic déjà en file: le ping n'apporterait rien
+                        if (reaping or conn.heartbeat) and not conn.queue:
+                            conn.enqueue(PING_FRAME)
+                    elif not conn.closing:
+                        get_metrics().inc("ws_connections_reaped")
+                        conn.close(IDLE_CLOSE_CODE, "idle_timeout")
+                    else:
+                        # Fermeture bloquée (TCP half-open): libérer sans attendre
+                        self.disconnect(conn.user_id, conn.websocket)
+
+    def admission_error(self, user_id: str) -> Optional[str]:
+        """Raison du refus d'une nouvelle socket, None si elle est admise."""
+        if self.max_connections > 0 and self._count >= self.max_connections:
+            return "too_many_connections"
+        if self.max_per_user > 0 and len(self._by_user.get(user_id, ())) >= (
+            self.max_per_user
+        ):
+            return "too_many_user_connections"
+        return None
+
+    def reject(self) -> None:
+        get_metrics().inc("ws_connections_rejected")
+
+    def touch(self, user_id: str, websocket: WebSocket) -> None:
+        conn = self._by_user.get(user_id, {}).get(websocket)
+        if conn is not None:
+            conn.last_seen = time.monotonic()
+
+    async def _publish(self, envelope: dict) -> None:
+        if self.backplane.started:
+            self.backplane.publish(envelope)
+        else:
+            # Hors serveur (scripts) ou avant le démarrage: application locale
+            await self._apply_batch([envelope])
+
+    def add_invalidation_handler(self, fn: Callable[[str, str], None]) -> None:
+        self._invalidation_handlers.append(fn)
+
+    def broadcast_invalidation(self, kind: str, key: str) -> None:
+        """Diffuse une invalidation de cache aux autres workers (depuis tout thread).
+        Sans backplane distribué: rien à diffuser."""
+        loop = self._loop
+        if loop is None or not self.backplane.distributed:
+            return
+        envelope = {"op": "invalidate", "kind": kind, "key": key}
+        try:
+            loop.call_soon_threadsafe(self._publish_invalidation, envelope)
+        except RuntimeError:
+            # Boucle fermée (arrêt en cours)
+            pass
+
+    def _publish_invalidation(self, envelope: dict) -> None:
+        if self.backplane.started:
+            self.backplane.publish(envelope)
+
+    def _apply_invalidation(self, envelope: dict) -> None:
+        # Idempotente: le worker d'origine la réapplique sans effet notable
+        get_metrics().inc("cache_invalidations_received")
+        for fn in self._invalidation_handlers:
+            fn(envelope["kind"], envelope["key"])
+
+    async def _apply_batch(self, batch: List[dict]) -> None:
+        for envelope in batch:
+            user_id = envelope.get("user_id")
+            op = envelope.get("op")
+            if op == "invalidate":
+                try:
+                    self._apply_invalidation(envelope)
+                except Exception:
+                    logging.exception("❌ Backplane: invalidation")
+                continue
+            # Rien à faire si ce worker ne détient aucune socket de l'utilisateur
+            if op != "topic" and (not user_id or not self.has_user(user_id)):
+                continue
+            try:
+                if op == "send":
+                    self._send_local(user_id, envelope["message"])
+                elif op == "topic":
+                    topic = envelope["topic"]
+                    message = {"type": "topic", "topic": topic}
+                    message["data"] = envelope["message"]
+                    self._broadcast_topic(topic, Frame(message))
+                elif op == "close":
+                    self._close_local(
+                        user_id, envelope.get("code", 4401), envelope.get("reason", "")
+                    )
+            except Exception:
+                logging.exception(f"❌ Backplane: opération {op}")
 
-    async def connect(self, user_id: str, websocket: WebSocket):
-        self._by_user.setdefault(user_id, set()).add(websocket)
+    def push_now_playing(self, event: ColorChanged) -> None:
+        """Abonné du bus (exécuteur): pousse le now-playing aux sockets de l'utilisateur."""
+        user_id = event.user_id
+        loop = self._loop
+        if loop is None or not self.has_user(user_id):
+            return
+        # Local: chaque worker pousse les événements de ses propres extracteurs.
+        # Encodage JSON hors de la boucle; la boucle ne fait que mettre en file
+        frame = _now_playing_frame(event.state, event.track, event.color)
+        frame.encoded(JSON)
+        loop.call_soon_threadsafe(self._broadcast_local, user_id, frame, "now_playing")
+
+    def local_users(self) -> List[str]:
+        return list(self._by_user)
+
+    def push_remote_snapshot(self, snap: Snapshot) -> None:
+        """Rappel de la table partagée (boucle): version écrite par le worker qui
+        possède l'utilisateur, poussée aux sockets de ce worker."""
+        # Sans type d'événement (couleur de secours, réglages): pas de push, comme en local
+        if snap is None or snap.state is None or not self.has_user(snap.user_id):
+            return
+        frame = _now_playing_frame(snap.state, snap.track, snap.color)
+        self._broadcast_local(snap.user_id, frame, "now_playing")
+
+    async def connect(
+        self,
+        user_id: str,
+        websocket: WebSocket,
+        encoding: str = JSON,
+        delta: bool = False,
+        heartbeat: bool = False,
+    ):
+        conn = Connection(
+            user_id,
+            websocket,
+            self,
+            self.max_queue,
+            self.policy,
+            encoding,
+            delta,
+            heartbeat,
+        )
+        self._by_user.setdefault(user_id, {})[websocket] = conn
+        self._count += 1
+        get_metrics().set_gauge("ws_connections_open", self._count)
 
     def disconnect(self, user_id: str, websocket: WebSocket):
         conns = self._by_user.get(user_id)
         if not conns:
             return
-        conns.discard(websocket)
+        conn = conns.pop(websocket, None)
+        if conn is not None:
+            conn.cancel()
+            for topic in list(conn.topics):
+                self._leave_topic(conn, topic)
+            self._count -= 1
+            get_metrics().set_gauge("ws_connections_open", self._count)
         if not conns:
             self._by_user.pop(user_id, None)
 
+    def has_user(self, user_id: str) -> bool:
+        return bool(self._by_user.get(user_id))
+
+    def send_to_socket(self, user_id: str, websocket: WebSocket, message: dict):
+        """Réponse à une socket précise, ordonnée avec les diffusions (file commune)."""
+        conn = self._by_user.get(user_id, {}).get(websocket)
+        if conn is not None:
+            conn.enqueue(Frame(message))
+
     async def send_to_user(self, user_id: str, message: dict):
-        conns = self._by_user.get(user_id)
-        if not conns:
+        await self._publish({"op": "send", "user_id": user_id, "message": message})
+
+    def _send_local(self, user_id: str, message: dict):
+        key = message.get("type")
+        self._broadcast_local(
+            user_id, Frame(message), key if key in COALESCABLE_TYPES else None
+        )
+
+    def _broadcast_local(self, user_id: str, frame: Frame, key: Optional[str]):
+        # Encodé une fois par encodage, mis en file pour chaque socket
+        for conn in list(self._by_user.get(user_id, {}).values()):
+            conn.enqueue(frame, key)
+
+    # --- topics ---
+
+    def subscribe(
+        self,
+        user_id: str,
+        websocket: WebSocket,
+        topic: str,
+        watch_user: Optional[str] = None,
+    ) -> Optional[str]:
+        """Abonne la socket au topic; `watch_user` relie le topic au snapshot de cet
+        utilisateur (état courant envoyé tout de suite). Retourne un code d'erreur."""
+        conn = self._by_user.get(user_id, {}).get(websocket)
+        if conn is None:
+            return "not_connected"
+        if topic in conn.topics:
+            return None
+        if self.max_topics > 0 and len(conn.topics) >= self.max_topics:
+            return "too_many_topics"
+        conn.topics.add(topic)
+        self._topics.setdefault(topic, set()).add(conn)
+        if watch_user is None:
+            return None
+        snap = get_snapshots().get(watch_user)
+        if snap is not None:
+            conn.forget_state(topic)
+            conn.enqueue(_snapshot_topic_frame(topic, snap), topic)
+        if topic not in self._watchers:
+            self._watchers[topic] = asyncio.create_task(
+                self._watch_snapshot(topic, watch_user, snap.version if snap else None)
+            )
+        return None
+
+    def unsubscribe(self, user_id: str, websocket: WebSocket, topic: str) -> None:
+        conn = self._by_user.get(user_id, {}).get(websocket)
+        if conn is not None and topic in conn.topics:
+            self._leave_topic(conn, topic)
+
+    def _leave_topic(self, conn: Connection, topic: str) -> None:
+        conn.topics.discard(topic)
+        conn.forget_state(topic)
+        members = self._topics.get(topic)
+        if members is None:
             return
-        dead: Set[WebSocket] = set()
-        for ws in conns:
-            try:
-                await ws.send_json(message)
-            except Exception:
-                dead.add(ws)
-        for ws in dead:
-            self.disconnect(user_id, ws)
+        members.discard(conn)
+        if not members:
+            self._topics.pop(topic, None)
+            watcher = self._watchers.pop(topic, None)
+            if watcher is not None:
+                watcher.cancel()
+
+    async def _watch_snapshot(
+        self, topic: str, user_id: str, since: Optional[int]
+    ) -> None:
+        # Abonné du snapshot: même chemin que le SSE (priorité de polling "live")
+        store = get_snapshots()
+        store.add_subscriber(user_id)
+        try:
+            while True:
+                snap = await store.wait_for_change(user_id, since, 60.0)
+                if snap is None:
+                    continue
+                since = snap.version
+                # Topic d'état: coalescible pour un client en retard
+                self._broadcast_topic(topic, _snapshot_topic_frame(topic, snap), topic)
+        finally:
+            store.remove_subscriber(user_id)
+
+    def _broadcast_topic(
+        self, topic: str, frame: Frame, key: Optional[str] = None
+    ) -> None:
+        # Encodé une fois par topic (et par encodage), mis en file pour chaque abonné
+        for conn in list(self._topics.get(topic, ())):
+            conn.enqueue(frame, key)
+
+    async def publish_topic(self, topic: str, message: dict) -> None:
+        """Diffusion sur un topic sans snapshot (ex. `moderation`), tous workers."""
+        await self._publish({"op": "topic", "topic": topic, "message": message})
 
     async def kick_user(self, user_id: str, reason: str = "banned"):
         await self.send_to_user(user_id, {"type": "force_logout", "reason": reason})
@@ -39,17 +509,34 @@ class ConnectionManager:
     async def close_user(
         self, user_id: str, code: int = 4401, reason: str = "unauthorized"
     ):
-        conns = self._by_user.get(user_id)
-        if not conns:
-            return
-        dead: Set[WebSocket] = set()
-        for ws in list(conns):
-            try:
-                await ws.close(code=code, reason=reason)
-            except Exception:
-                dead.add(ws)
-        for ws in dead:
-            self.disconnect(user_id, ws)
+        await self._publish(
+            {"op": "close", "user_id": user_id, "code": code, "reason": reason}
+        )
+
+    def _close_local(self, user_id: str, code: int, reason: str):
+        for conn in list(self._by_user.get(user_id, {}).values()):
+            conn.close(code, reason)
+
+
+def _now_playing_frame(state: str, track: Optional[dict], color: tuple) -> Frame:
+    r, g, b = color
+    message = {
+        "type": "now_playing",
+        "event": state,
+        "track": track,
+        "color": {"r": r, "g": g, "b": b, "hex": f"#{r:02x}{g:02x}{b:02x}"},
+    }
+    return Frame(message)
+
+
+def _snapshot_topic_frame(topic: str, snap: Snapshot) -> Frame:
+    # Payload public (sans `user`): un topic overlay n'expose pas son propriétaire.
+    # JSON assemblé depuis le rendu déjà en cache sur le snapshot.
+    tick = snap.tick()
+    data = snap.rendered("public", tick=tick).decode()
+    text = f'{{"type":"topic","topic":{json.dumps(topic)},"data":{data}}}'
+    message = {"type": "topic", "topic": topic, "data": snap.public_infos_payload(tick)}
+    return Frame(message, text)
 
 
 _MANAGER: ConnectionManager | None = None
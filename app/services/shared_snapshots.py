@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+Table partagée des snapshots - Fichier mmap à enregistrements fixes, commun aux workers
+d'un même hôte (`uvicorn --workers N`), lu sans verrou grâce à un seqlock
+"""
+
+import os
+import json
+import mmap
+import time
+import zlib
+import fcntl
+import struct
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+from .metrics import get_metrics
+
+MAGIC = b"MHSS"
+LAYOUT_VERSION = 1
+# magic, version, réservé, slots, taille d'enregistrement
+HEADER = struct.Struct("<4sHHII")
+HEADER_SIZE = 64
+
+# Enregistrement:
+#   0  seq (uint32)        seqlock: impair = écriture en cours
+#   4  owner_pid (uint32)  worker propriétaire (seul écrivain), modifié sous flock
+#   8  live_until (double) viewers live sur un autre worker (écrit par tous)
+#  16  accessed_at (double) dernière sollicitation HTTP/WS (écrit par tous)
+#  24  user_id (32s)       attribué sous flock; réattribué si le slot est abandonné
+#  56  charge utile protégée par le seqlock (PAYLOAD puis JSON de la piste)
+SEQ = struct.Struct("<I")
+PID = struct.Struct("<I")
+STAMP = struct.Struct("<d")
+OFF_PID = 4
+OFF_LIVE = 8
+OFF_ACCESS = 16
+OFF_USER = 24
+USER_SIZE = 32
+OFF_PAYLOAD = 56
+# boot_id, version, updated_at, processing_time_ms, r, g, b, état, longueur piste
+PAYLOAD = struct.Struct("<8sQdI4BI")
+OFF_TRACK = OFF_PAYLOAD + PAYLOAD.size
+
+MAX_PROBES = 32
+READ_RETRIES = 100
+EMPTY_USER = b"\0" * USER_SIZE
+
+# Type du dernier événement du pipeline (track_events), codé sur un octet
+STATES = (
+    None,
+    "track_changed",
+    "playback_resumed",
+    "playback_paused",
+    "playback_stopped",
+)
+STATE_CODES = {s: i for i, s in enumerate(STATES)}
+
+
+class SharedRecord:
+    """Copie cohérente de la charge utile d'un enregistrement."""
+
+    __slots__ = (
+        "boot_id",
+        "color",
+        "processing_time_ms",
+        "state",
+        "track",
+        "updated_at",
+        "version",
+    )
+
+    def __init__(self, payload: tuple, track: Optional[dict]) -> None:
+        boot, version, updated_at, ptime, r, g, b, state, _ = payload
+        self.boot_id = boot.rstrip(b"\0").decode()
+        self.version = version
+        self.updated_at = updated_at
+        self.processing_time_ms = ptime
+        self.color = (r, g, b)
+        self.state = STATES[state] if state < len(STATES) else None
+        self.track = track
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SharedSnapshotTable:
+    """Un enregistrement par utilisateur (slot trouvé par sondage linéaire depuis
+    crc32(user_id)). Un seul worker vivant possède un slot et y écrit; les autres le
+    lisent directement en mémoire, sans aller-retour entre processus.
+
+    Seuls les utilisateurs ayant une source (identifiants Spotify, push) prennent un
+    slot (`claim`). Un slot abandonné (propriétaire mort sans accès récent, ou aucun
+    accès depuis SHARED_SNAPSHOTS_RECLAIM_AFTER s) est réattribué au prochain
+    utilisateur qui sonde jusqu'à lui; l'identifiant est revérifié à chaque accès.
+
+    Lecture: seqlock (relire si `seq` est impair ou a changé pendant la copie). Les
+    écritures Python (memcpy sous le GIL) sont ordonnées sur x86 (TSO).
+    """
+
+    def __init__(self, path: str, slots: int, record_size: int) -> None:
+        self.path = path
+        self.slots = slots
+        self.record_size = record_size
+        self.owner_check = float(os.getenv("SHARED_SNAPSHOTS_OWNER_CHECK", "5.0"))
+        self.reclaim_after = float(
+            os.getenv("SHARED_SNAPSHOTS_RECLAIM_AFTER", "3600.0")
+        )
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        # user_id -> slot (revérifié: le slot a pu être réattribué par un autre worker)
+        self._slot_of: Dict[str, int] = {}
+        # user_id -> (propriétaire?, vérifié_le)
+        self._owned: Dict[str, Tuple[bool, float]] = {}
+        # Dernière écriture de accessed_at par utilisateur (limite les écritures)
+        self._touched: Dict[str, float] = {}
+        size = HEADER_SIZE + slots * record_size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+            self._mm = mmap.mmap(self._fd, size)
+            magic, version, _, n, rec = HEADER.unpack_from(self._mm, 0)
+            if magic == b"\0" * 4:
+                HEADER.pack_into(
+                    self._mm, 0, MAGIC, LAYOUT_VERSION, 0, slots, record_size
+                )
+            elif (magic, version, n, rec) != (
+                MAGIC,
+                LAYOUT_VERSION,
+                slots,
+                record_size,
+            ):
+                self._mm.close()
+                raise ValueError(
+                    f"{path}: disposition incompatible (supprimer le fichier)"
+                )
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        get_metrics().register_collector("shared_snapshots", self._collect)
+
+    # --- Localisation et propriété ---
+
+    def _offset(self, slot: int) -> int:
+        return HEADER_SIZE + slot * self.record_size
+
+    def _key(self, user_id: str) -> bytes:
+        return user_id.encode()[:USER_SIZE].ljust(USER_SIZE, b"\0")
+
+    def _user_at(self, slot: int) -> bytes:
+        off = self._offset(slot) + OFF_USER
+        return self._mm[off : off + USER_SIZE]
+
+    def _find(self, user_id: str, claim: bool = False) -> Optional[int]:
+        key = self._key(user_id)
+        slot = self._slot_of.get(user_id)
+        if slot is not None:
+            if self._user_at(slot) == key:
+                return slot
+            # Slot réattribué à un autre utilisateur
+            self._slot_of.pop(user_id, None)
+            self._owned.pop(user_id, None)
+        start = zlib.crc32(key) % self.slots
+        reclaimable = None
+        for i in range(MAX_PROBES):
+            slot = (start + i) % self.slots
+            current = self._user_at(slot)
+            if current == key:
+                self._slot_of[user_id] = slot
+                return slot
+            if current == EMPTY_USER:
+                # Fin de la chaîne de sondage: l'utilisateur n'a pas de slot
+                if claim:
+                    return self._assign(reclaimable or slot, key, user_id)
+                return None
+            if claim and reclaimable is None and self._abandoned(slot):
+                reclaimable = slot
+        if claim and reclaimable is not None:
+            return self._assign(reclaimable, key, user_id)
+        if claim:
+            get_metrics().inc("shared_snapshots_full")
+        return None
+
+    def _abandoned(self, slot: int) -> bool:
+        base = self._offset(slot)
+        idle = time.time() - max(
+            STAMP.unpack_from(self._mm, base + OFF_ACCESS)[0],
+            STAMP.unpack_from(self._mm, base + OFF_PAYLOAD + 16)[0],
+        )
+        if idle > self.reclaim_after:
+            return True
+        pid = PID.unpack_from(self._mm, base + OFF_PID)[0]
+        # Propriétaire mort et personne ne le consulte: orphelin
+        return (pid == 0 or not _alive(pid)) and idle > 2 * self.owner_check
+
+    def _assign(self, slot: int, key: bytes, user_id: str) -> int:
+        """Attribue le slot (appelant sous flock); un slot réattribué est remis à zéro
+        sous le seqlock: un lecteur de l'ancien utilisateur ne voit rien d'incohérent.
+        """
+        base = self._offset(slot)
+        if self._user_at(slot) != EMPTY_USER:
+            seq = SEQ.unpack_from(self._mm, base)[0]
+            SEQ.pack_into(self._mm, base, (seq + 1) & 0xFFFFFFFF)
+            self._mm[base + OFF_PID : base + self.record_size] = bytes(
+                self.record_size - OFF_PID
+            )
+            self._mm[base + OFF_USER : base + OFF_USER + USER_SIZE] = key
+            SEQ.pack_into(self._mm, base, (seq + 2) & 0xFFFFFFFF)
+            get_metrics().inc("shared_snapshots_reclaimed")
+        else:
+            self._mm[base + OFF_USER : base + OFF_USER + USER_SIZE] = key
+        self._slot_of[user_id] = slot
+        return slot
+
+    def owns(self, user_id: str, claim: bool = True) -> bool:
+        """Propriété du slot, (re)vérifiée au plus toutes les `owner_check` secondes;
+        reprise si le propriétaire est mort. Table pleine: True (repli local). Sans
+        `claim`, un utilisateur sans slot n'en reçoit pas (False)."""
+        cached = self._owned.get(user_id)
+        if cached is not None and time.time() - cached[1] < self.owner_check:
+            return cached[0]
+        return self.acquire(user_id, claim=claim)
+
+    def is_owner(self, user_id: str) -> bool:
+        """Dernière décision connue, sans vérification (chemin des lectures)."""
+        cached = self._owned.get(user_id)
+        return cached is not None and cached[0]
+
+    def acquire(self, user_id: str, force: bool = False, claim: bool = True) -> bool:
+        """Prend le slot s'il est libre, orphelin ou si `force` (source push reçue par
+        ce worker)."""
+        if not claim and self._find(user_id) is None:
+            # Pas de slot et pas d'attribution: ni flock ni décision mémorisée
+            return False
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                slot = self._find(user_id, claim=claim)
+                if slot is None and not claim:
+                    return False
+                if slot is None:
+                    # Table pleine: repli local
+                    owned = True
+                else:
+                    off = self._offset(slot) + OFF_PID
+                    pid = PID.unpack_from(self._mm, off)[0]
+                    owned = force or pid in (0, self.pid) or not _alive(pid)
+                    if owned and pid != self.pid:
+                        PID.pack_into(self._mm, off, self.pid)
+                        get_metrics().inc("shared_snapshots_acquired")
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            self._owned[user_id] = (owned, time.time())
+        return owned
+
+    # --- Écriture (propriétaire uniquement) ---
+
+    def last_version(self, user_id: str) -> int:
+        """Version courante du slot (le propriétaire continue la numérotation)."""
+        slot = self._find(user_id)
+        if slot is None:
+            return 0
+        off = self._offset(slot) + OFF_PAYLOAD + 8
+        return struct.unpack_from("<Q", self._mm, off)[0]
+
+    def write(
+        self,
+        user_id: str,
+        boot_id: str,
+        version: int,
+        updated_at: float,
+        processing_time_ms: int,
+        color: tuple,
+        state: Optional[str],
+        track: Optional[dict],
+    ) -> bool:
+        slot = self._find(user_id)
+        if slot is None:
+            return False
+        base = self._offset(slot)
+        data = json.dumps(track, separators=(",", ":")).encode() if track else b""
+        capacity = self.record_size - OFF_TRACK
+        if len(data) > capacity:
+            get_metrics().inc("shared_snapshots_track_truncated")
+            slim = {k: track.get(k) for k in ("id", "name", "artist", "is_playing")}
+            data = json.dumps(slim, separators=(",", ":")).encode()[:capacity]
+        r, g, b = color
+        with self._lock:
+            # Propriété reprise par un autre worker (push): ne plus écrire
+            owner = PID.unpack_from(self._mm, base + OFF_PID)[0]
+            if owner != self.pid or self._user_at(slot) != self._key(user_id):
+                self._owned[user_id] = (False, time.time())
+                return False
+            seq = SEQ.unpack_from(self._mm, base)[0]
+            SEQ.pack_into(self._mm, base, (seq + 1) & 0xFFFFFFFF)
+            PAYLOAD.pack_into(
+                self._mm,
+                base + OFF_PAYLOAD,
+                boot_id.encode()[:8],
+                version,
+                updated_at,
+                processing_time_ms & 0xFFFFFFFF,
+                r,
+                g,
+                b,
+                STATE_CODES.get(state, 0),
+                len(data),
+            )
+            self._mm[base + OFF_TRACK : base + OFF_TRACK + len(data)] = data
+            SEQ.pack_into(self._mm, base, (seq + 2) & 0xFFFFFFFF)
+        get_metrics().inc("shared_snapshots_written")
+        return True
+
+    # --- Lecture (tous les workers) ---
+
+    def version(self, user_id: str) -> Optional[Tuple[str, int]]:
+        """(boot_id, version) cohérents, ou None si rien n'a encore été écrit."""
+        slot = self._find(user_id)
+        if slot is None:
+            return None
+        base = self._offset(slot)
+        for _ in range(READ_RETRIES):
+            seq = SEQ.unpack_from(self._mm, base)[0]
+            if seq & 1:
+                continue
+            boot, version = struct.unpack_from("<8sQ", self._mm, base + OFF_PAYLOAD)
+            user = self._user_at(slot)
+            if SEQ.unpack_from(self._mm, base)[0] == seq:
+                if version == 0 or user != self._key(user_id):
+                    return None
+                return boot.rstrip(b"\0").decode(), version
+        get_metrics().inc("shared_snapshots_read_contended")
+        return None
+
+    def read(self, user_id: str) -> Optional[SharedRecord]:
+        slot = self._find(user_id)
+        if slot is None:
+            return None
+        base = self._offset(slot)
+        for _ in range(READ_RETRIES):
+            seq = SEQ.unpack_from(self._mm, base)[0]
+            if seq & 1:
+                continue
+            raw = self._mm[base + OFF_USER : base + self.record_size]
+            if SEQ.unpack_from(self._mm, base)[0] != seq:
+                continue
+            if raw[:USER_SIZE] != self._key(user_id):
+                return None
+            raw = raw[OFF_PAYLOAD - OFF_USER :]
+            payload = PAYLOAD.unpack_from(raw, 0)
+            if payload[1] == 0:
+                return None
+            length = payload[-1]
+            track = None
+            if length:
+                start = PAYLOAD.size
+                try:
+                    track = json.loads(raw[start : start + length])
+                except ValueError:
+                    track = None
+            return SharedRecord(payload, track)
+        get_metrics().inc("shared_snapshots_read_contended")
+        return None
+
+    # --- Demande (classe de priorité du propriétaire) ---
+
+    def mark_live(self, user_id: str, until: float) -> None:
+        slot = self._find(user_id)
+        if slot is not None:
+            STAMP.pack_into(self._mm, self._offset(slot) + OFF_LIVE, until)
+
+    def remote_live(self, user_id: str) -> bool:
+        slot = self._find(user_id)
+        if slot is None:
+            return False
+        off = self._offset(slot) + OFF_LIVE
+        return STAMP.unpack_from(self._mm, off)[0] > time.time()
+
+    def touch(self, user_id: str) -> None:
+        """Sollicitation reçue par ce worker (au plus une écriture par seconde)."""
+        now = time.time()
+        if now - self._touched.get(user_id, 0.0) < 1.0:
+            return
+        slot = self._find(user_id)
+        if slot is not None:
+            self._touched[user_id] = now
+            STAMP.pack_into(self._mm, self._offset(slot) + OFF_ACCESS, now)
+
+    def accessed_at(self, user_id: str) -> float:
+        slot = self._find(user_id)
+        if slot is None:
+            return 0.0
+        return STAMP.unpack_from(self._mm, self._offset(slot) + OFF_ACCESS)[0]
+
+    def close(self) -> None:
+        """Libère les slots possédés: un autre worker les reprend sans attendre."""
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                for user_id, (owned, _) in self._owned.items():
+                    slot = self._slot_of.get(user_id)
+                    if owned and slot is not None:
+                        off = self._offset(slot) + OFF_PID
+                        if PID.unpack_from(self._mm, off)[0] == self.pid:
+                            PID.pack_into(self._mm, off, 0)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            self._owned.clear()
+
+    def _collect(self) -> dict:
+        return {
+            "slots": self.slots,
+            "known": len(self._slot_of),
+            "owned": sum(1 for owned, _ in self._owned.values() if owned),
+        }
+
+
+_TABLE: Optional[SharedSnapshotTable] = None
+_TABLE_LOADED = False
+
+
+def get_shared_table() -> Optional[SharedSnapshotTable]:
+    """None sans SHARED_SNAPSHOTS_PATH (un seul worker: comportement inchangé)."""
+    global _TABLE, _TABLE_LOADED
+    if _TABLE_LOADED:
+        return _TABLE
+    _TABLE_LOADED = True
+    path = os.getenv("SHARED_SNAPSHOTS_PATH", "").strip()
+    if not path:
+        return None
+    try:
+        _TABLE = SharedSnapshotTable(
+            path,
+            int(os.getenv("SHARED_SNAPSHOTS_SLOTS", "16384")),
+            int(os.getenv("SHARED_SNAPSHOTS_RECORD_SIZE", "2048")),
+        )
+    except (OSError, ValueError) as e:
+        logging.error(f"❌ Snapshots partagés désactivés: {e}")
+        _TABLE = None
+    return _TABLE
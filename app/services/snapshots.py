@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""
+Snapshots now-playing - Dernier état (couleur + piste) par utilisateur, lu par les
+endpoints publics sans I/O
+"""
+
+import os
+import gzip
+import json
+import time
+import zlib
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional
+
+from .metrics import get_metrics
+from .shared_snapshots import get_shared_table
+from ..utils.shortid import new_short_uuid
+
+# Identifiant de démarrage: les versions repartent de 1 à chaque boot, l'ETag reste unique
+BOOT_ID = new_short_uuid()[:8]
+# Nombre max de rendus gardés par snapshot (borne les projections `fields=` arbitraires)
+MAX_RENDERED_PER_SNAPSHOT = 32
+
+
+def parse_fields(raw: Optional[str]) -> Optional[tuple]:
+    """`color.hex,track.name` -> (("color", "hex"), ("track", "name")).
+
+    Forme normalisée (triée, dédoublonnée, chemins couverts par un parent retirés):
+    deux écritures équivalentes partagent le même rendu en cache et le même ETag.
+    """
+    if not raw:
+        return None
+    paths = set()
+    for part in raw.split(","):
+        path = tuple(k for k in part.strip().split(".") if k)
+        if path:
+            paths.add(path)
+    kept = tuple(
+        sorted(p for p in paths if not any(p[:i] in paths for i in range(1, len(p))))
+    )
+    return kept or None
+
+
+def _fields_tag(fields: tuple) -> str:
+    key = ",".join(".".join(p) for p in fields)
+    return f"{zlib.crc32(key.encode()):08x}"
+
+
+def project(payload: dict, fields: tuple) -> dict:
+    """Ne garde que les chemins demandés; les chemins inconnus sont ignorés."""
+    out: dict = {}
+    for path in fields:
+        src = payload
+        for key in path:
+            if not isinstance(src, dict) or key not in src:
+                break
+            src = src[key]
+        else:
+            dst = out
+            for key in path[:-1]:
+                dst = dst.setdefault(key, {})
+            dst[path[-1]] = src
+    return out
+
+
+@dataclass
+class Snapshot:
+    user_id: str
+    version: int
+    color: tuple
+    track: Optional[dict]
+    processing_time_ms: int = 0
+    updated_at: float = field(default_factory=time.time)
+    # Type du dernier événement du pipeline (None: couleur de secours, réglages)
+    state: Optional[str] = None
+    # Worker qui a produit la version (lue depuis la table partagée sinon BOOT_ID)
+    boot_id: str = BOOT_ID
+    # Rendus mis en cache (encodés une seule fois par version et par seconde)
+    _rendered: dict = field(default_factory=dict, repr=False, compare=False)
+    _tick: Optional[int] = field(default=None, repr=False, compare=False)
+
+    @property
+    def event_id(self) -> str:
+        return f"{self.boot_id}-{self.version}"
+
+    @property
+    def is_playing(self) -> bool:
+        return bool(self.track and self.track.get("is_playing"))
+
+    def tick(self) -> Optional[int]:
+        """Seconde courante tant que la piste joue, sinon None. La progression est
+        extrapolée à cette seconde: les rendus avec piste changent au plus 1x/s."""
+        if not self.is_playing or self.track.get("progress_ms") is None:
+            return None
+        return int(time.time())
+
+    def live_track(self, tick: Optional[int] = None) -> Optional[dict]:
+        """Piste avec `progress_ms` extrapolé depuis `timestamp` (mesure Spotify/push)."""
+        if tick is None:
+            return self.track
+        track = dict(self.track)
+        since = track.get("timestamp") or self.updated_at
+        progress = track["progress_ms"] + max(0, int((tick - since) * 1000))
+        if track.get("duration_ms"):
+            progress = min(progress, track["duration_ms"])
+        track["progress_ms"] = progress
+        return track
+
+    def etag(
+        self, kind: str, fields: Optional[tuple] = None, tick: Optional[int] = None
+    ) -> str:
+        tag = f"{kind}-{self.boot_id}-{self.version}"
+        if tick is not None:
+            tag += f"-{tick}"
+        if fields:
+            tag += f"-{_fields_tag(fields)}"
+        return f'"{tag}"'
+
+    def color_block(self) -> dict:
+        r, g, b = self.color
+        return {"r": r, "g": g, "b": b, "hex": f"#{r:02x}{g:02x}{b:02x}"}
+
+    def color_payload(self) -> dict:
+        return {
+            "color": self.color_block(),
+            "processing_time_ms": self.processing_time_ms,
+            "source": "album",
+            "status": "success",
+            # Horodatage du snapshot (représentation stable pour un ETag fort)
+            "timestamp": int(self.updated_at),
+            "user": self.user_id,
+            # Curseur pour le long-poll (`?since=`)
+            "version": self.version,
+        }
+
+    def infos_payload(self, tick: Optional[int] = None) -> dict:
+        payload = self.color_payload()
+        payload["track"] = self.live_track(tick) or {
+            "id": None,
+            "name": "No music playing",
+            "is_playing": False,
+        }
+        return payload
+
+    def public_infos_payload(self, tick: Optional[int] = None) -> dict:
+        payload = self.infos_payload(tick)
+        payload.pop("user", None)
+        return payload
+
+    def _cache(self, key: tuple, data: bytes) -> None:
+        tick = key[-1]
+        if tick is not None and tick != self._tick:
+            # Nouvelle seconde: les rendus de la précédente ne resserviront plus
+            self._rendered = {k: v for k, v in self._rendered.items() if k[-1] is None}
+            self._tick = tick
+        if len(self._rendered) < MAX_RENDERED_PER_SNAPSHOT or key[2] is None:
+            self._rendered[key] = data
+
+    def rendered(
+        self,
+        kind: str,
+        encoding: str | None = None,
+        fields: Optional[tuple] = None,
+        tick: Optional[int] = None,
+    ) -> bytes:
+        """Corps JSON pré-sérialisé ("color" | "infos" | "public" sans `user`),
+        éventuellement réduit aux `fields` (voir `parse_fields`) et gzip, rendu une
+        seule fois par version (et par seconde `tick` pour la progression)."""
+        key = (kind, encoding, fields, tick)
+        data = self._rendered.get(key)
+        if data is None:
+            if encoding == "gzip":
+                data = gzip.compress(
+                    self.rendered(kind, fields=fields, tick=tick),
+                    compresslevel=6,
+                    mtime=0,
+                )
+            else:
+                if kind == "infos":
+                    payload = self.infos_payload(tick)
+                elif kind == "public":
+                    payload = self.public_infos_payload(tick)
+                else:
+                    payload = self.color_payload()
+                if fields:
+                    payload = project(payload, fields)
+                data = json.dumps(payload, separators=(",", ":")).encode()
+            self._cache(key, data)
+        return data
+
+    def sse_bytes(self) -> bytes:
+        """Message SSE complet, partagé par tous les abonnés de l'utilisateur.
+
+        Sans le champ `user`: le même message sert aussi les flux par overlay, qui ne
+        doivent pas exposer l'id du propriétaire.
+        """
+        tick = self.tick()
+        key = ("sse", None, None, tick)
+        data = self._rendered.get(key)
+        if data is None:
+            body = self.rendered("public", tick=tick).decode()
+            data = f"id: {self.event_id}\nevent: now_playing\ndata: {body}\n\n".encode()
+            self._cache(key, data)
+        return data
+
+
+class SnapshotStore:
+    """Table user_id -> Snapshot, écrite par les threads du pipeline, lue par les routes.
+
+    Les attentes async (SSE, long-poll) reposent sur un `asyncio.Event` par utilisateur,
+    remplacé à chaque publication: un changement réveille tous les abonnés d'un coup.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._by_user: Dict[str, Snapshot] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._events: Dict[str, asyncio.Event] = {}
+        self._subscribers: Dict[str, int] = {}
+        # Table mmap partagée entre workers (None: worker unique)
+        self._shared = get_shared_table()
+        # Snapshots lus dans la table partagée (réutilisés tant que la version tient)
+        self._remote: Dict[str, Snapshot] = {}
+        # user_id -> (boot_id, version) vue par ce worker (détection des changements)
+        self._seen: Dict[str, tuple] = {}
+        # (utilisateurs suivis, rappel) notifiés des changements écrits par un autre worker
+        self._remote_listeners: List[tuple] = []
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+
+    def get(self, user_id: str) -> Optional[Snapshot]:
+        snap = self._by_user.get(user_id)
+        table = self._shared
+        if table is None or table.is_owner(user_id):
+            return snap
+        # Un autre worker possède l'utilisateur: lecture directe de la table partagée
+        return self._read_remote(user_id) or snap
+
+    def _read_remote(self, user_id: str) -> Optional[Snapshot]:
+        current = self._shared.version(user_id)
+        if current is None:
+            return None
+        cached = self._remote.get(user_id)
+        if cached is not None and (cached.boot_id, cached.version) == current:
+            return cached
+        rec = self._shared.read(user_id)
+        if rec is None:
+            return None
+        snap = Snapshot(
+            user_id=user_id,
+            version=rec.version,
+            color=rec.color,
+            track=rec.track,
+            processing_time_ms=rec.processing_time_ms,
+            updated_at=rec.updated_at,
+            state=rec.state,
+            boot_id=rec.boot_id,
+        )
+        self._remote[user_id] = snap
+        get_metrics().inc("shared_snapshots_read")
+        return snap
+
+    def publish(
+        self,
+        user_id: str,
+        color: tuple,
+        track: Optional[dict],
+        processing_time_ms: int = 0,
+        state: Optional[str] = None,
+    ) -> Snapshot:
+        table = self._shared
+        # Pas d'attribution ici: seuls les utilisateurs pollés ou en push prennent
+        # un slot (identifiants aléatoires sur /color sans effet sur la table)
+        owner = table is not None and table.owns(user_id, claim=False)
+        with self._lock:
+            prev = self._by_user.get(user_id)
+            version = (prev.version + 1) if prev else 1
+            if owner:
+                # Reprise d'un slot: la numérotation continue celle du propriétaire
+                # précédent (curseurs `since` des clients toujours valides)
+                version = max(version, table.last_version(user_id) + 1)
+            snap = Snapshot(
+                user_id=user_id,
+                version=version,
+                color=tuple(int(c) for c in color),
+                track=dict(track) if track else None,
+                processing_time_ms=processing_time_ms,
+                state=state,
+            )
+            self._by_user[user_id] = snap
+            if owner:
+                table.write(
+                    user_id,
+                    snap.boot_id,
+                    snap.version,
+                    snap.updated_at,
+                    snap.processing_time_ms,
+                    snap.color,
+                    snap.state,
+                    snap.track,
+                )
+        get_metrics().inc("snapshots_published")
+        loop = self._loop
+        if loop is not None and user_id in self._events:
+            try:
+                loop.call_soon_threadsafe(self._notify, user_id)
+            except RuntimeError:
+                # Boucle fermée (arrêt en cours)
+                pass
+        return snap
+
+    def _notify(self, user_id: str) -> None:
+        ev = self._events.pop(user_id, None)
+        if ev is not None:
+            ev.set()
+
+    async def wait_for_change(
+        self, user_id: str, since: Optional[int], timeout: float
+    ) -> Optional[Snapshot]:
+        """Retourne le snapshot dès que sa version diffère de `since`, sinon None au timeout."""
+        snap = self.get(user_id)
+        if snap is not None and snap.version != since:
+            return snap
+        ev = self._events.get(user_id)
+        if ev is None:
+            ev = asyncio.Event()
+            self._events[user_id] = ev
+            if snap is not None and self._shared is not None:
+                self._seen.setdefault(user_id, (snap.boot_id, snap.version))
+            # Publication arrivée avant l'enregistrement de l'événement (autre thread)
+            snap = self.get(user_id)
+            if snap is not None and snap.version != since:
+                return snap
+        try:
+            await asyncio.wait_for(ev.wait(), timeout)
+        except TimeoutError:
+            return None
+        return self.get(user_id)
+
+    def add_remote_listener(
+        self,
+        users: Callable[[], Iterable[str]],
+        fn: Callable[[Snapshot], None],
+    ) -> None:
+        """`fn(snapshot)` (sur la boucle) à chaque version écrite par un autre worker
+        pour les utilisateurs renvoyés par `users()` (ex. sockets /ws locales)."""
+        self._remote_listeners.append((users, fn))
+
+    async def watch_shared(self) -> None:
+        """Workers non propriétaires: détecte les nouvelles versions de la table
+        partagée (lecture mémoire locale) pour réveiller SSE, long-poll et topics, et
+        signale au propriétaire les viewers live de ce worker."""
+        table = self._shared
+        interval = float(os.getenv("SHARED_SNAPSHOTS_WATCH_MS", "100")) / 1000.0
+        while True:
+            await asyncio.sleep(interval)
+            now = time.time()
+            listened: Dict[str, list] = {}
+            for users, fn in self._remote_listeners:
+                for user_id in users():
+                    listened.setdefault(user_id, []).append(fn)
+            watched = set(self._events) | set(self._subscribers) | set(listened)
+            for user_id in watched:
+                if table.is_owner(user_id):
+                    continue
+                # Priorité "live" chez le propriétaire tant que ce worker a des viewers
+                table.mark_live(user_id, now + 3.0)
+                current = table.version(user_id)
+                if current is None:
+                    continue
+                previous = self._seen.get(user_id)
+                self._seen[user_id] = current
+                if previous is None or previous == current:
+                    continue
+                self._notify(user_id)
+                snap = self.get(user_id)
+                for fn in listened.get(user_id, ()):
+                    try:
+                        fn(snap)
+                    except Exception:
+                        logging.exception("❌ Snapshots partagés: rappel en erreur")
+            for user_id in [u for u in self._seen if u not in watched]:
+                self._seen.pop(user_id, None)
+
+    def add_subscriber(self, user_id: str) -> None:
+        self._subscribers[user_id] = self._subscribers.get(user_id, 0) + 1
+
+    def remove_subscriber(self, user_id: str) -> None:
+        n = self._subscribers.get(user_id, 0) - 1
+        if n > 0:
+            self._subscribers[user_id] = n
+        else:
+            self._subscribers.pop(user_id, None)
+
+    def has_subscribers(self, user_id: str) -> bool:
+        return user_id in self._subscribers
+
+    def subscriber_count(self) -> int:
+        return sum(self._subscribers.values())
+
+    def forget(self, user_id: str) -> None:
+        with self._lock:
+            self._by_user.pop(user_id, None)
+            self._remote.pop(user_id, None)
+
+
+_STORE: Optional[SnapshotStore] = None
+
+
+def get_snapshots() -> SnapshotStore:
+    global _STORE
+    if _STORE is None:
+        _STORE = SnapshotStore()
+        get_metrics().register_collector(
+            "live_subscribers", lambda: {"total": _STORE.subscriber_count()}
+        )
+    return _STORE
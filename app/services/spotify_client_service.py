@@ -7,17 +7,20 @@ import os
 import time
 import json
 import base64
+import hashlib
 import logging
 from typing import Callable, Optional
 import requests
 from urllib.parse import urlencode
 from dotenv import load_dotenv
+from .circuit_breaker import get_breakers, CircuitBreaker
 
 load_dotenv()
 
 
 class SpotifyClient:
-    def __init__(self, persist_to_file: bool = False):
+    def __init__(self, persist_to_file: bool = False, user_id: str | None = None):
+        self.user_id = user_id
         self._persist_to_file = bool(persist_to_file)
         if self._persist_to_file:
             env_path = os.getenv("SPOTIFY_TOKENS_FILE")
@@ -39,6 +42,11 @@ class SpotifyClient:
         self.spotify_enabled = False
         self.spotify_api_errors = 0
         self.max_spotify_errors = 5
+        self._last_token_error: Optional[str] = None
+        # Base de l'API Web (surchargeable pour pointer vers un stub local)
+        self.api_base = os.getenv(
+            "SPOTIFY_API_BASE", "https://api.spotify.com/v1"
+        ).rstrip("/")
         self.redirect_uri = os.getenv(
             "SPOTIFY_REDIRECT_URI", "http://localhost:8765/spotify/callback"
         )
@@ -46,7 +54,7 @@ class SpotifyClient:
 
         self._last_spotify_check = 0
         self._last_spotify_result = None
-        self.min_request_interval = float(os.getenv("SPOTIFY_REQUEST_INTERVAL", 3.0))
+        self.min_request_interval = float(os.getenv("SPOTIFY_REQUEST_INTERVAL", "3.0"))
 
         self._setup_spotify()
 
@@ -70,11 +78,110 @@ class SpotifyClient:
         self.spotify_client_secret = client_secret
         self.spotify_refresh_token = refresh_token
 
+        # Identifiants connus comme invalides: ne pas re-solliciter l'endpoint token
+        if not self._breakers_allow():
+            return False
         if self._get_spotify_access_token():
             self.spotify_enabled = True
+            self._record_success()
             return True
+        self._record_token_failure()
+        return False
+
+    # --- Disjoncteurs (par utilisateur et par client_id) ---
+
+    def _user_breaker_key(self) -> Optional[str]:
+        return f"user:{self.user_id}" if self.user_id else None
+
+    def _client_breaker_key(self) -> Optional[str]:
+        # client_id public: la clé inclut une empreinte du secret, sinon un tiers qui
+        # saisit le client_id d'un autre avec un mauvais secret ouvrirait son disjoncteur
+        if not self.spotify_client_id:
+            return None
+        digest = hashlib.sha256(
+            str(self.spotify_client_secret or "").encode()
+        ).hexdigest()[:16]
+        return f"client:{self.spotify_client_id}:{digest}"
+
+    def breaker_keys(self) -> tuple:
+        """Clés des disjoncteurs utilisés par ce client (registre partagé)."""
+        return tuple(
+            k for k in (self._user_breaker_key(), self._client_breaker_key()) if k
+        )
+
+    def _user_breaker(self) -> Optional[CircuitBreaker]:
+        key = self._user_breaker_key()
+        if key is None:
+            return None
+        return get_breakers().get(key, failure_threshold=self.max_spotify_errors)
+
+    def _client_breaker(self) -> Optional[CircuitBreaker]:
+        key = self._client_breaker_key()
+        if key is None:
+            return None
+        return get_breakers().get(key, failure_threshold=self.max_spotify_errors)
+
+    def _breakers_allow(self) -> bool:
+        for b in (self._client_breaker(), self._user_breaker()):
+            if b and not b.allow():
+                return False
+        return True
+
+    def _record_success(self):
+        self.spotify_api_errors = 0
+        for b in (self._client_breaker(), self._user_breaker()):
+            if b:
+                b.record_success()
+
+    def _record_api_failure(self, reason: str):
+        self.spotify_api_errors += 1
+        b = self._user_breaker()
+        if b:
+            b.record_failure(reason)
+
+    def _record_token_failure(self):
+        # invalid_client => application Spotify cassée (partagée par client_id + secret)
+        # sinon (invalid_grant, réseau...) => intégration de l'utilisateur
+        reason = self._last_token_error or "token_error"
+        self.spotify_api_errors += 1
+        if reason == "invalid_client":
+            b = self._client_breaker()
+        else:
+            b = self._user_breaker()
+        if b:
+            b.record_failure(reason)
+
+    def _remember_token_error(self, response) -> None:
+        try:
+            self._last_token_error = response.json().get("error") or (
+                f"http_{response.status_code}"
+            )
+        except (ValueError, AttributeError):
+            # Corps non JSON ou non objet
+            self._last_token_error = f"http_{response.status_code}"
+
+    def reset_breakers(self):
+        """Réarme les disjoncteurs (ex: nouveaux identifiants saisis)."""
+        self.spotify_api_errors = 0
+        for b in (self._client_breaker(), self._user_breaker()):
+            if b:
+                b.reset()
+
+    def breaker_blocked(self) -> bool:
+        """Vrai si un disjoncteur est ouvert (sans consommer de sonde half-open)."""
+        for b in (self._client_breaker(), self._user_breaker()):
+            if b and b.snapshot()["state"] == "open":
+                return True
         return False
 
+    def breaker_status(self) -> dict:
+        user = self._user_breaker()
+        client = self._client_breaker()
+        return {
+            "user": user.snapshot() if user else None,
+            "client": client.snapshot() if client else None,
+        }
+
     def _load_refresh_token(self):
         if not self._persist_to_file:
             return None
@@ -178,8 +285,10 @@ class SpotifyClient:
                 self._save_tokens(self.spotify_access_token, expires_in=expires_in)
                 return True
 
+            self._remember_token_error(response)
             return False
         except Exception:
+            self._last_token_error = "network_error"
             return False
 
     def _refresh_access_token(self):
@@ -217,8 +326,10 @@ class SpotifyClient:
                 )
                 return True
 
+            self._remember_token_error(response)
             return False
         except Exception:
+            self._last_token_error = "network_error"
             return False
 
     def _test_spotify_api(self):
@@ -233,14 +344,14 @@ class SpotifyClient:
 
             if self.spotify_refresh_token:
                 response = requests.get(
-                    "https://api.spotify.com/v1/me/player/currently-playing",
+                    f"{self.api_base}/me/player/currently-playing",
                     headers=headers,
                     timeout=5,
                 )
                 return response.status_code in [200, 204]
             else:
                 response = requests.get(
-                    "https://api.spotify.com/v1/browse/categories",
+                    f"{self.api_base}/browse/categories",
                     headers=headers,
                     params={"limit": 1},
                     timeout=5,
@@ -259,9 +370,19 @@ class SpotifyClient:
 
         self._last_spotify_check = now
 
+        # Disjoncteur ouvert: ne pas frapper Spotify tant que le délai court
+        if not self._breakers_allow():
+            self._last_spotify_result = None
+            return None
+
         try:
-            if time.time() > self.spotify_token_expires:
-                self._get_spotify_access_token()
+            if (
+                time.time() > self.spotify_token_expires
+                and not self._get_spotify_access_token()
+            ):
+                self._record_token_failure()
+                self._last_spotify_result = None
+                return None
 
             headers = {
                 "Authorization": f"Bearer {self.spotify_access_token}",
@@ -270,7 +391,7 @@ class SpotifyClient:
 
             if self.spotify_refresh_token:
                 response = requests.get(
-                    "https://api.spotify.com/v1/me/player/currently-playing",
+                    f"{self.api_base}/me/player/currently-playing",
                     headers=headers,
                     timeout=3,
                 )
@@ -305,12 +426,13 @@ class SpotifyClient:
                             "image_url": image_url,
                             "timestamp": time.time(),
                         }
-                        self.spotify_api_errors = 0
+                        self._record_success()
                         self._last_spotify_result = track_info
                         return track_info
+                    self._record_success()
 
                 elif response.status_code == 204:
-                    self.spotify_api_errors = 0
+                    self._record_success()
                     result = {
                         "id": None,
                         "name": "No music playing",
@@ -319,17 +441,75 @@ class SpotifyClient:
                     self._last_spotify_result = result
                     return result
                 else:
-                    self.spotify_api_errors += 1
+                    self._record_api_failure(f"http_{response.status_code}")
                     self._last_spotify_result = None
                     return None
             else:
                 self._last_spotify_result = None
                 return None
-        except Exception:
-            self.spotify_api_errors += 1
+        except Exception as e:
+            self._record_api_failure(type(e).__name__)
             self._last_spotify_result = None
             return None
 
+    def get_queue(self, limit: int = 3) -> list:
+        """Pistes à venir (file de lecture) sous forme compacte: id, name, image_url.
+
+        Mêmes disjoncteurs et même pause sur 429 que get_current_track; le jeton du
+        plafond global est pris par l'appelant (ordonnanceur).
+        """
+        if not self.spotify_enabled or not self.spotify_refresh_token:
+            return []
+        if time.time() < self._last_spotify_check:
+            # Pause Retry-After en cours
+            return []
+        if not self._breakers_allow():
+            return []
+        try:
+            if (
+                time.time() > self.spotify_token_expires
+                and not self._get_spotify_access_token()
+            ):
+                self._record_token_failure()
+                return []
+            response = requests.get(
+                f"{self.api_base}/me/player/queue",
+                headers={"Authorization": f"Bearer {self.spotify_access_token}"},
+                timeout=3,
+            )
+            if response.status_code == 429:
+                retry_after = int(response.headers.get("Retry-After", 5))
+                self._last_spotify_check = time.time() + retry_after
+                return []
+            if response.status_code != 200:
+                self._record_api_failure(f"http_{response.status_code}")
+                return []
+            self._record_success()
+            items = []
+            for track in (response.json() or {}).get("queue") or []:
+                if not track or not track.get("id"):
+                    continue
+                images = (track.get("album") or {}).get("images") or []
+                items.append(
+                    {
+                        "id": track["id"],
+                        "name": track.get("name"),
+                        "image_url": images[0]["url"] if images else None,
+                    }
+                )
+                if len(items) >= limit:
+                    break
+            return items
+        except (
+            requests.RequestException,
+            ValueError,
+            KeyError,
+            TypeError,
+            AttributeError,
+        ) as e:
+            self._record_api_failure(type(e).__name__)
+            return []
+
     def exchange_code_for_tokens(self, authorization_code):
         try:
             auth_string = f"{self.spotify_client_id}:{self.spotify_client_secret}"
@@ -7,31 +7,97 @@ import time
 import os
 import logging
 import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from .spotify_client_service import SpotifyClient
 from .color_extractor_service import ColorExtractor
+from .poll_scheduler import get_scheduler
+from .metrics import get_metrics
+from .snapshots import get_snapshots
+from .shared_snapshots import get_shared_table
+from .track_events import (
+    TrackEventPipeline,
+    TRACK_CHANGED,
+    PLAYBACK_RESUMED,
+    PLAYBACK_PAUSED,
+    PLAYBACK_STOPPED,
+)
+
+# Pool partagé pour le préchargement des couleurs (hors du chemin de polling)
+_PREFETCH_POOL: ThreadPoolExecutor | None = None
+
+
+def _get_prefetch_pool() -> ThreadPoolExecutor:
+    global _PREFETCH_POOL
+    if _PREFETCH_POOL is None:
+        _PREFETCH_POOL = ThreadPoolExecutor(
+            max_workers=int(os.getenv("SPOTIFY_PREFETCH_WORKERS", "2")),
+            thread_name_prefix="color-prefetch",
+        )
+        get_metrics().register_collector("color_prefetch", _prefetch_stats)
+    return _PREFETCH_POOL
+
+
+def _prefetch_stats() -> dict:
+    m = get_metrics()
+    hits = m.get_counter("color_prefetch_hits")
+    misses = m.get_counter("color_prefetch_misses")
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / total, 3) if total else None,
+        "warmed": m.get_counter("color_prefetch_warmed"),
+    }
 
 
 class SpotifyColorExtractor:
-    def __init__(self, data_dir: str | None = None):
-        self.spotify_client = SpotifyClient()
+    def __init__(self, data_dir: str | None = None, user_id: str | None = None):
+        self.user_id = user_id
+        self.spotify_client = SpotifyClient(user_id=user_id)
         self.color_extractor = ColorExtractor()
 
         self.current_track_image_url = None
         self.current_track_id = None
 
         self.color_cache = {}
+        # Couleurs précalculées pour les prochaines pistes de la file (track_id -> rgb)
+        self.prefetch_count = int(os.getenv("SPOTIFY_PREFETCH_COUNT", "0"))
+        self.prefetched_colors: "OrderedDict[str, tuple]" = OrderedDict()
+        self._prefetched_for = None
         self.last_extraction_time = 0
         self.cache_duration = 5
 
         self.monitoring_enabled = True
-        self.monitoring_thread = None
-        self.spotify_check_interval = float(os.getenv("SPOTIFY_POLLING_INTERVAL", 3.0))
+        self.spotify_check_interval = float(
+            os.getenv("SPOTIFY_POLLING_INTERVAL", "3.0")
+        )
         self.last_spotify_check = 0
+        self.created_at = time.time()
+        # Dernière sollicitation (HTTP/WS) pour la classe de priorité "active"
+        self.last_access_at = time.time()
+        # Dernier état observé (détection de changement)
+        self._last_track_id = None
+        self._last_is_playing = None
+        self._change_lock = threading.RLock()
+
+        # Source push: tant qu'un client pousse, le polling serveur est coupé
+        self.push_source_ttl = float(os.getenv("PUSH_SOURCE_TTL", "30.0"))
+        self.last_push_at = 0.0
+        self._pushed_track = None
 
         self.stats = {"requests": 0, "cache_hits": 0, "extractions": 0, "errors": 0}
         self.verbose_logs = os.getenv("VERBOSE_SPOTIFY_LOGS", "false").lower() == "true"
         # Couleur de secours par défaut (peut être remplacée par utilisateur)
         self.default_fallback_rgb = (0x25, 0xD8, 0x65)  # #25d865
+        # Changements détectés => pipeline (coalescence, extraction, diffusion)
+        self.events = TrackEventPipeline(self)
+        self.events.subscribe(self._publish_snapshot)
+        if self.verbose_logs:
+            self.events.subscribe(self._log_event)
+        # Snapshot initial: couleur de secours tant que rien n'a été détecté
+        if self.user_id:
+            get_snapshots().publish(self.user_id, self.default_fallback_rgb, None)
         self.start_monitoring()
 
     def set_default_fallback_hex(self, hex_color: str | None):
@@ -46,94 +112,188 @@ class SpotifyColorExtractor:
             r = int(s[0:2], 16)
             g = int(s[2:4], 16)
             b = int(s[4:6], 16)
+            if (r, g, b) == self.default_fallback_rgb:
+                return
             self.default_fallback_rgb = (r, g, b)
+            # En pause/arrêt, la couleur publiée est la couleur de secours: la rafraîchir
+            snap = get_snapshots().get(self.user_id) if self.user_id else None
+            if snap and not snap.is_playing:
+                get_snapshots().publish(self.user_id, (r, g, b), snap.track)
         except Exception:
             # Ne pas interrompre si parsing échoue
             pass
 
     def start_monitoring(self):
-        if self.monitoring_thread and self.monitoring_thread.is_alive():
-            return
+        # Le polling est piloté par l'ordonnanceur central (plus de thread par utilisateur)
         self.monitoring_enabled = True
-        self.monitoring_thread = threading.Thread(
-            target=self._monitoring_loop, daemon=True
-        )
-        self.monitoring_thread.start()
+        get_scheduler().register(self)
         if self.verbose_logs:
             logging.info("⚡ Surveillance active - Logs réduits")
 
-    def _monitoring_loop(self):
-        last_track_id = None
-        last_is_playing = None
-        while self.monitoring_enabled:
-            try:
-                current_time = time.time()
-                if (
-                    self.spotify_client.spotify_enabled
-                    and current_time - self.last_spotify_check
-                    >= self.spotify_check_interval
-                ):
-                    track_info = self.spotify_client.get_current_track()
-                    self.last_spotify_check = current_time
-                    if track_info:
-                        current_track_id = track_info.get("id")
-                        current_is_playing = track_info.get("is_playing", False)
-                        track_changed = (last_track_id != current_track_id) and bool(
-                            current_track_id
+    def stop_monitoring(self):
+        self.monitoring_enabled = False
+        get_scheduler().unregister(self)
+
+    def touch(self):
+        self.last_access_at = time.time()
+        table = get_shared_table()
+        if table is not None and self.user_id:
+            # Sollicitation visible du worker qui polle (classe "active")
+            table.touch(self.user_id)
+
+    def needs_poll(self) -> bool:
+        return (
+            self.monitoring_enabled
+            and self.spotify_client.spotify_enabled
+            and not self.push_active()
+            and not self.spotify_client.breaker_blocked()
+            and self._owns_snapshot()
+        )
+
+    def cold_start_remaining(self, window: float) -> float:
+        """Attente restante (s) pour la première détection: 0 si déjà pollé, sans
+        Spotify, en push ou plus de `window` secondes après la création."""
+        if (
+            self.last_spotify_check
+            or not self.spotify_client.spotify_enabled
+            or self.push_active()
+        ):
+            return 0.0
+        return max(0.0, window - (time.time() - self.created_at))
+
+    def _owns_snapshot(self) -> bool:
+        """Plusieurs workers: seul le propriétaire du slot partagé polle Spotify."""
+        table = get_shared_table()
+        return table is None or not self.user_id or table.owns(self.user_id)
+
+    def poll_once(self):
+        """Un cycle de polling (appelé par l'ordonnanceur)."""
+        if not self.needs_poll():
+            return
+        track_info = self.spotify_client.get_current_track()
+        self.last_spotify_check = time.time()
+        self._process_track_info(track_info)
+
+    def _process_track_info(self, track_info):
+        """Détection de changement (piste / lecture-pause) commune au poller et au push."""
+        with self._change_lock:
+            if track_info:
+                current_track_id = track_info.get("id")
+                current_is_playing = track_info.get("is_playing", False)
+                track_changed = (self._last_track_id != current_track_id) and bool(
+                    current_track_id
+                )
+                playstate_changed = self._last_is_playing != current_is_playing
+                if track_changed:
+                    self.current_track_image_url = track_info.get("image_url")
+                    self.current_track_id = current_track_id
+                    self.color_cache.clear()
+                    if self.prefetch_count > 0:
+                        get_metrics().inc(
+                            "color_prefetch_hits"
+                            if current_track_id in self.prefetched_colors
+                            else "color_prefetch_misses"
                         )
-                        playstate_changed = last_is_playing != current_is_playing
-                        if track_changed:
-                            if self.verbose_logs:
-                                logging.info(
-                                    f"🎵 {track_info.get('artist', 'Unknown')} - {track_info.get('name', 'Unknown')}"
-                                )
+                        self._schedule_prefetch()
+                    self.events.submit(
+                        TRACK_CHANGED if current_is_playing else PLAYBACK_PAUSED,
+                        track_info,
+                    )
+                    self._last_track_id = current_track_id
+                    self._last_is_playing = current_is_playing
+                elif playstate_changed:
+                    if current_is_playing:
+                        if self.current_track_id != current_track_id:
                             self.current_track_image_url = track_info.get("image_url")
                             self.current_track_id = current_track_id
                             self.color_cache.clear()
-                            if current_is_playing:
-                                new_color = self.extract_color()
-                                if self.verbose_logs:
-                                    logging.info(
-                                        f"🎨 #{new_color[0]:02x}{new_color[1]:02x}{new_color[2]:02x}"
-                                    )
-                            last_track_id = current_track_id
-                            last_is_playing = current_is_playing
-                        elif playstate_changed:
-                            if current_is_playing:
-                                if self.verbose_logs:
-                                    logging.info(
-                                        f"▶️ {track_info.get('artist', 'Unknown')} - {track_info.get('name', 'Unknown')}"
-                                    )
-                                if self.current_track_id != current_track_id:
-                                    self.current_track_image_url = track_info.get(
-                                        "image_url"
-                                    )
-                                    self.current_track_id = current_track_id
-                                    self.color_cache.clear()
-                                new_color = self.extract_color()
-                                if self.verbose_logs:
-                                    logging.info(
-                                        f"🎨 #{new_color[0]:02x}{new_color[1]:02x}{new_color[2]:02x}"
-                                    )
-                            else:
-                                if self.verbose_logs:
-                                    logging.info("⏸️ PAUSE")
-                            last_is_playing = current_is_playing
+                        self.events.submit(PLAYBACK_RESUMED, track_info)
                     else:
-                        if last_track_id is not None or last_is_playing is not None:
-                            if self.verbose_logs:
-                                logging.info("🔇 STOP")
-                            last_track_id = None
-                            last_is_playing = None
-                time.sleep(1)
-            except Exception as e:
-                logging.error(f"❌ Erreur monitoring: {e}")
-                time.sleep(10)
+                        self.events.submit(PLAYBACK_PAUSED, track_info)
+                    self._last_is_playing = current_is_playing
+            else:
+                if self._last_track_id is not None or self._last_is_playing is not None:
+                    self.events.submit(PLAYBACK_STOPPED, None)
+                    self._last_track_id = None
+                    self._last_is_playing = None
+
+    def _publish_snapshot(self, event: dict):
+        if not self.user_id:
+            return
+        get_snapshots().publish(
+            self.user_id,
+            event["color"],
+            event.get("track"),
+            event.get("processing_time_ms", 0),
+            event["type"],
+        )
+
+    def _log_event(self, event: dict):
+        track = event.get("track") or {}
+        icons = {
+            TRACK_CHANGED: "🎵",
+            PLAYBACK_RESUMED: "▶️",
+            PLAYBACK_PAUSED: "⏸️",
+            PLAYBACK_STOPPED: "🔇",
+        }
+        r, g, b = event["color"]
+        logging.info(
+            f"{icons.get(event['type'], '•')} {track.get('artist', '')} - {track.get('name', '')} 🎨 #{r:02x}{g:02x}{b:02x}"
+        )
+
+    def extract_color_for_event(self, event: dict, check):
+        """Extraction pour un événement du pipeline; `check()` lève si l'événement est périmé."""
+        track = event.get("track") or {}
+        track_id = track.get("id")
+        image_url = track.get("image_url")
+        cache_key = f"color_{track_id}"
+        if cache_key in self.color_cache:
+            return self.color_cache[cache_key]
+        prefetched = self.prefetched_colors.get(track_id)
+        if prefetched is not None:
+            self.color_cache[cache_key] = prefetched
+            self.last_extraction_time = time.time()
+            return prefetched
+        if not image_url:
+            return self._get_fallback_color()
+        self.stats["extractions"] += 1
+        image = self.color_extractor.download_image(image_url)
+        check()
+        if not image:
+            return self._get_fallback_color()
+        color = self.color_extractor.extract_primary_color(image)
+        check()
+        self.color_cache[cache_key] = color
+        self.last_extraction_time = time.time()
+        return color
+
+    def push_active(self) -> bool:
+        """Vrai si un client pousse le now-playing récemment (poller coupé)."""
+        return (
+            self._pushed_track is not None
+            and time.time() - self.last_push_at < self.push_source_ttl
+        )
+
+    def ingest_now_playing(self, track_info: dict):
+        """Ingestion d'un événement now-playing poussé par un client (agent desktop, /ws).
+
+        Alimente la même détection de changement et la même extraction que le poller.
+        """
+        info = dict(track_info)
+        info.setdefault("timestamp", time.time())
+        info["source"] = "push"
+        self._pushed_track = info
+        self.last_push_at = time.time()
+        table = get_shared_table()
+        if table is not None and self.user_id:
+            # Le worker qui reçoit le push devient l'unique écrivain de l'utilisateur
+            table.acquire(self.user_id, force=True)
+        self._process_track_info(info)
 
     def extract_color(self):
         current_time = time.time()
         self.stats["requests"] += 1
-        track_info = self.spotify_client.get_current_track()
+        track_info = self.get_current_track_info()
         # Si pas de piste ou en pause => couleur de secours (toujours actualisée via state)
         if not track_info or not track_info.get("is_playing", False):
             return self._get_fallback_color()
@@ -146,6 +306,13 @@ class SpotifyColorExtractor:
             self.stats["cache_hits"] += 1
             return self.color_cache[cache_key]
 
+        prefetched = self.prefetched_colors.get(self.current_track_id)
+        if prefetched is not None:
+            self.color_cache[cache_key] = prefetched
+            self.last_extraction_time = current_time
+            self.stats["cache_hits"] += 1
+            return prefetched
+
         self.stats["extractions"] += 1
         try:
             if not self.current_track_image_url:
@@ -170,11 +337,56 @@ class SpotifyColorExtractor:
             logging.error(f"❌ Erreur extraction couleur: {e}")
             return self._get_fallback_color()
 
+    def _schedule_prefetch(self):
+        # Une lecture de file par piste courante suffit
+        if self._prefetched_for == self.current_track_id:
+            return
+        self._prefetched_for = self.current_track_id
+        _get_prefetch_pool().submit(self._prefetch_upcoming)
+
+    def _prefetch_upcoming(self):
+        """Chauffe le cache d'images et de couleurs pour les prochaines pistes."""
+        try:
+            # Disjoncteur ouvert: ni appel à la file ni jeton du plafond consommé
+            if self.spotify_client.breaker_blocked():
+                return
+            # Même plafond req/s que le polling: pas de rafale au changement de piste
+            if not get_scheduler().acquire():
+                return
+            for item in self.spotify_client.get_queue(limit=self.prefetch_count):
+                track_id = item.get("id")
+                image_url = item.get("image_url")
+                if not track_id or not image_url:
+                    continue
+                if track_id in self.prefetched_colors:
+                    continue
+                image = self.color_extractor.download_image(image_url)
+                if not image:
+                    continue
+                color = self.color_extractor.extract_primary_color(image)
+                self.prefetched_colors[track_id] = color
+                get_metrics().inc("color_prefetch_warmed")
+                # Borner la mémoire: garder les plus récentes
+                while len(self.prefetched_colors) > max(8, self.prefetch_count * 4):
+                    self.prefetched_colors.popitem(last=False)
+        except Exception as e:
+            logging.debug(f"Préchargement couleurs ignoré: {e}")
+
     def _get_fallback_color(self):
         # Utiliser la couleur par défaut (paramétrable par utilisateur)
         return self.default_fallback_rgb
 
     def get_current_track_info(self):
+        if self.push_active():
+            info = dict(self._pushed_track)
+            # Extrapoler la progression depuis le dernier push
+            if info.get("is_playing") and info.get("progress_ms") is not None:
+                elapsed_ms = int((time.time() - info["timestamp"]) * 1000)
+                progress = info["progress_ms"] + elapsed_ms
+                if info.get("duration_ms"):
+                    progress = min(progress, info["duration_ms"])
+                info["progress_ms"] = progress
+            return info
         return self.spotify_client.get_current_track()
 
     def get_stats(self):
@@ -1,7 +1,15 @@
+import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Dict
 from sqlalchemy.orm import Session
 from app.services.spotify_color_extractor_service import SpotifyColorExtractor
-from app.models.user import SpotifySecret, SpotifyToken, User
+from app.services.poll_scheduler import get_scheduler
+from app.services.circuit_breaker import get_breakers
+from app.services.event_bus import SettingsChanged, CredentialsChanged
+from app.models.user import SpotifySecret, SpotifyToken, User, UserSetting
+from app.utils.database import SessionLocal
 import app.utils.encryption as enc
 
 
@@ -9,14 +17,23 @@ class AppState:
     def __init__(self) -> None:
         self.extractor: Optional[SpotifyColorExtractor] = None
         self.user_extractors: Dict[str, SpotifyColorExtractor] = {}
+        # Config utilisateur (couleur, secrets) mise en cache pour le chemin public
+        self.config_ttl = float(os.getenv("USER_CONFIG_TTL", "60.0"))
+        self._config_loaded_at: Dict[str, float] = {}
+        self._configured_creds: Dict[int, tuple] = {}
+        self._loading: Dict[str, asyncio.Future] = {}
+        # Exécuteur dédié aux I/O bloquantes (DB, crypto) hors de la boucle
+        self._io_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("STATE_IO_WORKERS", "8")),
+            thread_name_prefix="state-io",
+        )
 
     async def start(self):
         # Ne pas initialiser d'extracteur global: chaque utilisateur a le sien
         return None
 
     async def stop(self):
-        # Rien de spécial pour l'instant
-        return None
+        get_scheduler().stop()
 
     def get_extractor(self) -> SpotifyColorExtractor:
         if not self.extractor:
@@ -31,44 +48,211 @@ class AppState:
         # Récupérer ou créer l'extracteur utilisateur
         extractor = self.user_extractors.get(user_id)
         if not extractor:
-            extractor = SpotifyColorExtractor()
+            extractor = SpotifyColorExtractor(user_id=user_id)
             self.user_extractors[user_id] = extractor
+        extractor.touch()
         # Toujours rafraîchir la couleur de secours depuis la DB pour refléter immédiatement les changements
         try:
-            from app.models.user import UserSetting
-
-            s = db.query(UserSetting).filter(UserSetting.user_id == user_id).first()
-            default_hex = getattr(s, "default_overlay_color", None) if s else None
-            if default_hex:
-                extractor.set_default_fallback_hex(default_hex)
-        except Exception:
-            pass
-        # Configurer/rafraîchir les secrets Spotify si présents (ne change rien si identiques)
-        try:
+            setting = (
+                db.query(UserSetting).filter(UserSetting.user_id == user_id).first()
+            )
             secret = (
                 db.query(SpotifySecret).filter(SpotifySecret.user_id == user_id).first()
             )
             token = (
                 db.query(SpotifyToken).filter(SpotifyToken.user_id == user_id).first()
             )
-            if secret:
-                cid = enc.decrypt_str(secret.client_id) if secret.client_id else None
-                csec = (
-                    enc.decrypt_str(secret.client_secret)
-                    if secret.client_secret
-                    else None
-                )
-                rtok = (
-                    enc.decrypt_str(token.refresh_token)
-                    if (token and token.refresh_token)
-                    else None
-                )
-                if cid and csec:
-                    extractor.spotify_client.configure_spotify_api(cid, csec, rtok)
+            self._apply_user_config(extractor, setting, secret, token)
         except Exception:
             pass
+        self._config_loaded_at[user_id] = time.time()
         return extractor
 
+    def _apply_user_config(
+        self,
+        extractor: SpotifyColorExtractor,
+        setting: Optional[UserSetting],
+        secret: Optional[SpotifySecret],
+        token: Optional[SpotifyToken],
+    ) -> None:
+        default_hex = (
+            getattr(setting, "default_overlay_color", None) if setting else None
+        )
+        if default_hex:
+            extractor.set_default_fallback_hex(default_hex)
+        # Configurer les secrets Spotify si présents; ne rien refaire s'ils sont identiques
+        # et que le client est déjà opérationnel (évite un refresh token à chaque requête)
+        if not secret:
+            return
+        cid = enc.decrypt_str(secret.client_id) if secret.client_id else None
+        csec = enc.decrypt_str(secret.client_secret) if secret.client_secret else None
+        rtok = (
+            enc.decrypt_str(token.refresh_token)
+            if (token and token.refresh_token)
+            else None
+        )
+        if not (cid and csec):
+            return
+        creds = (cid, csec, rtok)
+        client = extractor.spotify_client
+        if client.spotify_enabled and creds == self._configured_creds.get(
+            id(extractor)
+        ):
+            return
+        previous = client.breaker_keys()
+        if client.configure_spotify_api(cid, csec, rtok):
+            self._configured_creds[id(extractor)] = creds
+            # Premier poll sans attendre l'échéance prévue avant la configuration
+            get_scheduler().wake(extractor)
+        self._release_breakers(previous)
+
+    def _release_breakers(self, keys) -> None:
+        """Oublie les disjoncteurs qu'aucun extracteur n'utilise plus (le registre ne
+        grossit pas avec chaque utilisateur ou identifiant vu)."""
+        in_use = set()
+        for extractor in list(self.user_extractors.values()):
+            in_use.update(extractor.spotify_client.breaker_keys())
+        breakers = get_breakers()
+        for key in keys:
+            if key not in in_use:
+                breakers.forget(key)
+
+    def drop_extractor(self, user_id: str) -> None:
+        """Retire l'extracteur d'un utilisateur (compte supprimé): plus de polling,
+        config et disjoncteurs oubliés."""
+        extractor = self.user_extractors.pop(user_id, None)
+        self._config_loaded_at.pop(user_id, None)
+        if extractor is None:
+            return
+        extractor.stop_monitoring()
+        self._configured_creds.pop(id(extractor), None)
+        self._release_breakers(extractor.spotify_client.breaker_keys())
+
+    def _load_extractor_blocking(self, user_id: str) -> SpotifyColorExtractor:
+        db = SessionLocal()
+        try:
+            return self.get_extractor_for_user(user_id, db)
+        finally:
+            db.close()
+
+    async def ensure_extractor(self, user_id: str) -> SpotifyColorExtractor:
+        """Variante non bloquante pour les routes publiques async.
+
+        Chemin chaud en mémoire; la config (DB + déchiffrement + token Spotify) n'est
+        rechargée qu'après `USER_CONFIG_TTL` secondes, dans un exécuteur dédié.
+        """
+        extractor = self.user_extractors.get(user_id)
+        loaded_at = self._config_loaded_at.get(user_id, 0)
+        if extractor and time.time() - loaded_at < self.config_ttl:
+            extractor.touch()
+            return extractor
+        # Un seul chargement en vol par utilisateur
+        fut = self._loading.get(user_id)
+        if fut is None:
+            loop = asyncio.get_running_loop()
+            fut = loop.run_in_executor(
+                self._io_executor, self._load_extractor_blocking, user_id
+            )
+            self._loading[user_id] = fut
+            fut.add_done_callback(lambda _f: self._loading.pop(user_id, None))
+        if extractor:
+            # Config en cours de rafraîchissement: servir l'état courant sans attendre
+            extractor.touch()
+            return extractor
+        return await asyncio.shield(fut)
+
+    async def run_io(self, fn, *args):
+        """Exécute une fonction bloquante (DB, crypto) sur l'exécuteur I/O dédié."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._io_executor, fn, *args)
+
+    def mark_active(self, user_id: str) -> None:
+        extractor = self.user_extractors.get(user_id)
+        if extractor:
+            extractor.touch()
+
+    def invalidate_config(self, user_id: str) -> None:
+        """Force le rechargement de la config au prochain accès public."""
+        self._config_loaded_at.pop(user_id, None)
+
+    def on_settings_changed(self, event: SettingsChanged) -> None:
+        """Abonné du bus (inline): couleur de secours appliquée immédiatement
+        (snapshot public inclus)."""
+        extractor = self.user_extractors.get(event.user_id)
+        if extractor and event.default_overlay_color:
+            extractor.set_default_fallback_hex(event.default_overlay_color)
+
+    def on_credentials_changed(self, event: CredentialsChanged) -> None:
+        """Abonné du bus (inline): disjoncteurs réarmés pour retenter immédiatement,
+        config rechargée au prochain accès."""
+        extractor = self.user_extractors.get(event.user_id)
+        if extractor:
+            extractor.spotify_client.reset_breakers()
+        self.invalidate_config(event.user_id)
+
+    def prepare_batch_blocking(self, user_ids: list[str]) -> Dict[str, dict]:
+        """Charge la config de plusieurs utilisateurs (une requête IN par table).
+
+        Crée un extracteur uniquement pour les utilisateurs ayant des identifiants
+        Spotify; les autres sont signalés sans extracteur ni polling.
+        Retourne user_id -> {"status": "ready"|"no_data"|"not_found", "default_color"}.
+        """
+        out: Dict[str, dict] = {}
+        if not user_ids:
+            return out
+        db = SessionLocal()
+        try:
+            existing = {
+                uid for (uid,) in db.query(User.id).filter(User.id.in_(user_ids)).all()
+            }
+            settings = {
+                r.user_id: r
+                for r in db.query(UserSetting)
+                .filter(UserSetting.user_id.in_(user_ids))
+                .all()
+            }
+            secrets = {
+                r.user_id: r
+                for r in db.query(SpotifySecret)
+                .filter(SpotifySecret.user_id.in_(user_ids))
+                .all()
+            }
+            tokens = {
+                r.user_id: r
+                for r in db.query(SpotifyToken)
+                .filter(SpotifyToken.user_id.in_(user_ids))
+                .all()
+            }
+        finally:
+            db.close()
+        for uid in user_ids:
+            setting = settings.get(uid)
+            default_color = getattr(setting, "default_overlay_color", None)
+            if uid not in existing:
+                out[uid] = {"status": "not_found", "default_color": None}
+                continue
+            secret = secrets.get(uid)
+            if not (secret and secret.client_id and secret.client_secret):
+                out[uid] = {"status": "no_data", "default_color": default_color}
+                continue
+            extractor = self.user_extractors.get(uid)
+            if not extractor:
+                extractor = SpotifyColorExtractor(user_id=uid)
+                self.user_extractors[uid] = extractor
+            extractor.touch()
+            try:
+                self._apply_user_config(extractor, setting, secret, tokens.get(uid))
+            except Exception:
+                pass
+            self._config_loaded_at[uid] = time.time()
+            out[uid] = {"status": "ready", "default_color": default_color}
+        return out
+
+    def ingest_now_playing(self, user_id: str, db: Session, track_info: dict) -> None:
+        """Injecte un now-playing poussé par le client dans le pipeline de l'utilisateur."""
+        extractor = self.get_extractor_for_user(user_id, db)
+        extractor.ingest_now_playing(track_info)
+
 
 # Singleton global pour un accès simple depuis les routes
 _STATE_SINGLETON: Optional[AppState] = None
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Pipeline d'événements de lecture - Coalescence des changements de piste et annulation
+des extractions devenues obsolètes
+"""
+
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+from .metrics import get_metrics
+from .event_bus import get_bus, ColorChanged, TrackChanged, PlaybackPaused
+
+TRACK_CHANGED = "track_changed"
+PLAYBACK_RESUMED = "playback_resumed"
+PLAYBACK_PAUSED = "playback_paused"
+PLAYBACK_STOPPED = "playback_stopped"
+
+_POOL: Optional[ThreadPoolExecutor] = None
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _POOL
+    if _POOL is None:
+        _POOL = ThreadPoolExecutor(
+            max_workers=int(os.getenv("TRACK_EVENT_WORKERS", "8")),
+            thread_name_prefix="track-events",
+        )
+    return _POOL
+
+
+class Cancelled(Exception):
+    """L'événement a été remplacé par un plus récent pendant son traitement."""
+
+
+class TrackEventPipeline:
+    """Entre la détection de changement et les consommateurs (extraction, push, abonnés).
+
+    Un événement soumis attend la fenêtre de coalescence; s'il est remplacé entre-temps,
+    il est abandonné. Une extraction en cours pour une piste qui n'est plus courante
+    est annulée entre ses étapes (téléchargement, analyse, diffusion).
+    """
+
+    def __init__(self, extractor, window_ms: float | None = None):
+        self.extractor = extractor
+        if window_ms is None:
+            window_ms = float(os.getenv("TRACK_EVENT_COALESCE_MS", "300"))
+        self.window = max(0.0, window_ms / 1000.0)
+        self._lock = threading.Lock()
+        self._pending: Optional[dict] = None
+        self._generation = 0
+        self._draining = False
+        self._subscribers: List[Callable[[dict], None]] = []
+
+    def subscribe(self, fn: Callable[[dict], None]) -> None:
+        self._subscribers.append(fn)
+
+    def submit(self, event_type: str, track_info: Optional[dict]) -> None:
+        event = {
+            "type": event_type,
+            "user_id": self.extractor.user_id,
+            "track": dict(track_info) if track_info else None,
+            "detected_at": time.time(),
+        }
+        with self._lock:
+            if self._pending is not None:
+                get_metrics().inc("track_events_coalesced")
+            self._generation += 1
+            event["generation"] = self._generation
+            self._pending = event
+            if self._draining:
+                return
+            self._draining = True
+        _get_pool().submit(self._drain)
+
+    def is_current(self, generation: int) -> bool:
+        return generation == self._generation
+
+    def _drain(self) -> None:
+        while True:
+            with self._lock:
+                event = self._pending
+                if event is None:
+                    self._draining = False
+                    return
+            # Attendre la fin de la fenêtre: un événement plus récent remplacera celui-ci
+            wait = event["detected_at"] + self.window - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            with self._lock:
+                if self._pending is not event:
+                    continue
+                self._pending = None
+            try:
+                self._process(event)
+            except Cancelled:
+                get_metrics().inc("track_events_cancelled")
+            except Exception:
+                logging.exception("❌ Erreur pipeline événements")
+
+    def _check(self, event: dict) -> None:
+        if not self.is_current(event["generation"]):
+            raise Cancelled()
+
+    def _process(self, event: dict) -> None:
+        started = time.time()
+        if event["type"] in (TRACK_CHANGED, PLAYBACK_RESUMED):
+            color = self.extractor.extract_color_for_event(
+                event, lambda: self._check(event)
+            )
+        else:
+            color = self.extractor._get_fallback_color()
+        self._check(event)
+        event["color"] = color
+        event["processing_time_ms"] = int((time.time() - started) * 1000)
+        get_metrics().inc("track_events_delivered")
+        get_metrics().observe(
+            "track_event_latency_ms", (time.time() - event["detected_at"]) * 1000
+        )
+        for fn in self._subscribers:
+            try:
+                fn(event)
+            except Exception:
+                logging.exception("❌ Abonné événement en erreur")
+        if event["user_id"]:
+            _publish_bus(event)
+
+
+def _publish_bus(event: dict) -> None:
+    """Consommateurs communs (push WebSocket, lumières, webhooks): via le bus, sans
+    attendre dans le thread du pipeline."""
+    fields = {
+        "user_id": event["user_id"],
+        "state": event["type"],
+        "track": event.get("track"),
+        "color": event["color"],
+        "detected_at": event["detected_at"],
+        "processing_time_ms": event.get("processing_time_ms", 0),
+    }
+    bus = get_bus()
+    bus.publish(ColorChanged(**fields))
+    # Événements spécialisés: publiés seulement s'ils ont un abonné
+    if event["type"] == TRACK_CHANGED and bus.has_subscribers(TrackChanged):
+        bus.publish(TrackChanged(**fields))
+    elif event["type"] in (PLAYBACK_PAUSED, PLAYBACK_STOPPED) and bus.has_subscribers(
+        PlaybackPaused
+    ):
+        bus.publish(PlaybackPaused(**fields))
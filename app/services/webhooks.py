@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Webhooks sortants - POST signés HMAC aux changements de piste/couleur, livrés hors
+du pipeline avec une file par cible, coalescence et reprises avec backoff
+"""
+
+import os
+import json
+import hmac
+import time
+import random
+import socket
+import asyncio
+import hashlib
+import logging
+import ipaddress
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy.exc import SQLAlchemyError
+
+from .metrics import get_metrics
+from .event_bus import ColorChanged
+from .track_events import (
+    TRACK_CHANGED,
+    PLAYBACK_RESUMED,
+    PLAYBACK_PAUSED,
+    PLAYBACK_STOPPED,
+)
+from ..models.user import Webhook
+from ..utils.database import SessionLocal
+from ..utils.shortid import new_short_uuid
+import app.utils.encryption as enc
+
+WEBHOOK_EVENTS = (TRACK_CHANGED, PLAYBACK_RESUMED, PLAYBACK_PAUSED, PLAYBACK_STOPPED)
+SIGNATURE_HEADER = "X-MelodyHue-Signature"
+# 4xx définitifs; ces codes-là sont réessayés
+RETRYABLE_STATUS = (408, 425, 429)
+
+
+def resolve_url(url: str) -> Tuple[Optional[str], Optional[str]]:
+    """(erreur, adresse IP validée): une seule des deux est renseignée.
+
+    Les adresses privées, loopback et link-local sont refusées (le serveur ne doit
+    pas servir de relais vers son propre réseau) sauf WEBHOOK_ALLOW_PRIVATE=true.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        return "URL http(s) attendue", None
+    try:
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        infos = socket.getaddrinfo(parsed.hostname, port, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError, ValueError):
+        return "Hôte introuvable", None
+    if not infos:
+        return "Hôte introuvable", None
+    if os.getenv("WEBHOOK_ALLOW_PRIVATE", "false").lower() != "true":
+        for info in infos:
+            ip = ipaddress.ip_address(info[4][0])
+            if not ip.is_global or ip.is_multicast:
+                return "Adresse non autorisée", None
+    return None, infos[0][4][0]
+
+
+def check_url(url: str) -> Optional[str]:
+    """Message d'erreur si l'URL n'est pas une cible acceptable, sinon None."""
+    return resolve_url(url)[0]
+
+
+def pin_url(url: str, address: str) -> Tuple[str, str]:
+    """(URL pointant sur l'adresse validée, en-tête Host d'origine): la connexion ne
+    refait pas de résolution DNS (un hôte en rebinding ne peut plus basculer vers une
+    adresse interne entre la vérification et l'envoi)."""
+    parsed = urlparse(url)
+    host = f"[{parsed.hostname}]" if ":" in parsed.hostname else parsed.hostname
+    literal = f"[{address}]" if ":" in address else address
+    port = f":{parsed.port}" if parsed.port else ""
+    return parsed._replace(netloc=f"{literal}{port}").geturl(), f"{host}{port}"
+
+
+class _PinnedAdapter(HTTPAdapter):
+    """Requêtes réécrites par `pin_url`: SNI et vérification du certificat TLS se
+    font sur le nom de l'en-tête Host, pas sur l'adresse IP de l'URL."""
+
+    def build_connection_pool_key_attributes(self, request, verify, cert=None):
+        host_params, pool_kwargs = super().build_connection_pool_key_attributes(
+            request, verify, cert
+        )
+        hostname = urlparse(f"//{request.headers.get('Host', '')}").hostname
+        if host_params["scheme"] == "https" and hostname:
+            pool_kwargs["server_hostname"] = hostname
+            pool_kwargs["assert_hostname"] = hostname
+        return host_params, pool_kwargs
+
+
+def sign(secret: bytes, timestamp: int, body: bytes) -> str:
+    """`t=<ts>,v1=<hex>`: HMAC-SHA256 de "<ts>." + corps; le destinataire rejette
+    les horodatages trop anciens (rejeu)."""
+    mac = hmac.new(secret, b"%d." % timestamp + body, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={mac}"
+
+
+class _Delivery:
+    __slots__ = ("body", "detected_at", "event", "id", "secret", "url")
+
+    def __init__(self, url, secret, event, body, detected_at) -> None:
+        self.id = new_short_uuid()
+        self.url = url
+        self.secret = secret
+        self.event = event
+        self.body = body
+        self.detected_at = detected_at
+
+
+class _Target:
+    """File d'une cible (webhook): une livraison en cours, au plus une en attente.
+    Chaque événement décrit l'état complet: le plus récent remplace l'attente."""
+
+    __slots__ = ("pending", "task")
+
+    def __init__(self) -> None:
+        self.pending: Optional[_Delivery] = None
+        self.task: Optional[asyncio.Task] = None
+
+
+class WebhookDispatcher:
+    """Abonné du bus (`color_changed`).
+
+    L'abonné ne fait que lire les webhooks (cache par utilisateur) et sérialiser le
+    corps; l'envoi est planifié sur la boucle d'événements et les POST bloquants
+    passent par un exécuteur borné (concurrence globale).
+    """
+
+    def __init__(self) -> None:
+        self.ttl = float(os.getenv("WEBHOOK_CACHE_TTL", "300.0"))
+        self.timeout = float(os.getenv("WEBHOOK_TIMEOUT", "5.0"))
+        self.max_attempts = max(1, int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "5")))
+        self.backoff = float(os.getenv("WEBHOOK_BACKOFF", "1.0"))
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("WEBHOOK_CONCURRENCY", "16")),
+            thread_name_prefix="webhooks",
+        )
+        self._local = threading.local()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        # user_id -> (chargé_le, [(webhook_id, url, secret, events)])
+        self._hooks: Dict[str, tuple] = {}
+        # webhook_id -> _Target (boucle d'événements uniquement)
+        self._targets: Dict[str, _Target] = {}
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+
+    def invalidate(self, user_id: str) -> None:
+        with self._lock:
+            self._hooks.pop(user_id, None)
+
+    def _load_hooks(self, user_id: str) -> List[tuple]:
+        db = SessionLocal()
+        try:
+            rows = db.query(Webhook).filter(Webhook.owner_id == user_id).all()
+        finally:
+            db.close()
+        out = []
+        for h in rows:
+            secret = (enc.decrypt_str(h.secret) or h.secret) if h.secret else None
+            if not secret:
+                continue
+            events = frozenset(e for e in (h.events or "").split(",") if e)
+            events = events or frozenset(WEBHOOK_EVENTS)
+            out.append((h.id, h.url, secret.encode(), events))
+        return out
+
+    def _hooks_for(self, user_id: str) -> List[tuple]:
+        with self._lock:
+            cached = self._hooks.get(user_id)
+        if cached is not None and time.time() - cached[0] < self.ttl:
+            return cached[1]
+        hooks = self._load_hooks(user_id)
+        with self._lock:
+            self._hooks[user_id] = (time.time(), hooks)
+        return hooks
+
+    def on_color_changed(self, event: ColorChanged) -> None:
+        """Appelé sur l'exécuteur du bus: aucune attente réseau ici."""
+        user_id = event.user_id
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            hooks = self._hooks_for(user_id)
+        except SQLAlchemyError as e:
+            logging.error(f"❌ Webhooks: chargement impossible: {e}")
+            return
+        hooks = [h for h in hooks if event.state in h[3]]
+        if not hooks:
+            return
+        r, g, b = event.color
+        body = json.dumps(
+            {
+                "event": event.state,
+                "user_id": user_id,
+                "track": event.track,
+                "color": {"r": r, "g": g, "b": b, "hex": f"#{r:02x}{g:02x}{b:02x}"},
+                "detected_at": event.detected_at,
+            },
+            separators=(",", ":"),
+        ).encode()
+        for hook_id, url, secret, _ in hooks:
+            delivery = _Delivery(url, secret, event.state, body, event.detected_at)
+            loop.call_soon_threadsafe(self._enqueue, hook_id, delivery)
+
+    def _enqueue(self, hook_id: str, delivery: _Delivery) -> None:
+        target = self._targets.get(hook_id)
+        if target is None:
+            target = self._targets[hook_id] = _Target()
+        if target.pending is not None:
+            get_metrics().inc("webhook_coalesced")
+        target.pending = delivery
+        if target.task is None:
+            target.task = asyncio.create_task(self._run(hook_id, target))
+
+    async def _run(self, hook_id: str, target: _Target) -> None:
+        loop = asyncio.get_running_loop()
+        metrics = get_metrics()
+        try:
+            while target.pending is not None:
+                delivery, target.pending = target.pending, None
+                for attempt in range(1, self.max_attempts + 1):
+                    try:
+                        ok, retryable = await loop.run_in_executor(
+                            self._executor, self._post, delivery
+                        )
+                    except Exception:
+                        logging.exception(f"❌ Webhook {hook_id}")
+                        ok, retryable = False, False
+                    if ok:
+                        metrics.inc("webhook_delivered")
+                        metrics.observe(
+                            "webhook_delivery_latency_ms",
+                            (time.time() - delivery.detected_at) * 1000,
+                        )
+                        break
+                    if not retryable or attempt == self.max_attempts:
+                        metrics.inc("webhook_failed")
+                        break
+                    # Backoff exponentiel avec gigue; abandon si un état plus récent
+                    # attend déjà (il part à la place)
+                    delay = self.backoff * (2 ** (attempt - 1))
+                    await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+                    if target.pending is not None:
+                        metrics.inc("webhook_superseded")
+                        break
+                    metrics.inc("webhook_retries")
+        finally:
+            target.task = None
+            if target.pending is None:
+                self._targets.pop(hook_id, None)
+
+    def _session(self) -> requests.Session:
+        # Une session (pool de connexions) par thread de l'exécuteur
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            adapter = _PinnedAdapter()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        return session
+
+    def _post(self, delivery: _Delivery) -> tuple:
+        """(livré, réessayable); exécuté sur l'exécuteur des webhooks."""
+        # Résolution vérifiée à chaque envoi: le DNS a pu changer depuis l'enregistrement
+        error, address = resolve_url(delivery.url)
+        if error is not None:
+            logging.warning(f"⚠️ Webhook {delivery.url}: {error}")
+            return False, False
+        url, host = pin_url(delivery.url, address)
+        timestamp = int(time.time())
+        headers = {
+            "Host": host,
+            "Content-Type": "application/json",
+            "User-Agent": "MelodyHue-Webhooks",
+            "X-MelodyHue-Event": delivery.event,
+            "X-MelodyHue-Delivery": delivery.id,
+            SIGNATURE_HEADER: sign(delivery.secret, timestamp, delivery.body),
+        }
+        started = time.perf_counter()
+        try:
+            response = self._session().post(
+                url,
+                data=delivery.body,
+                headers=headers,
+                timeout=self.timeout,
+                allow_redirects=False,
+            )
+        except requests.RequestException:
+            get_metrics().inc("webhook_request_errors")
+            return False, True
+        finally:
+            get_metrics().observe(
+                "webhook_request_ms", (time.perf_counter() - started) * 1000
+            )
+        status = response.status_code
+        response.close()
+        if 200 <= status < 300:
+            return True, False
+        get_metrics().inc(f"webhook_status_{status // 100}xx")
+        return False, status >= 500 or status in RETRYABLE_STATUS
+
+
+_DISPATCHER: Optional[WebhookDispatcher] = None
+
+
+def get_webhooks() -> WebhookDispatcher:
+    global _DISPATCHER
+    if _DISPATCHER is None:
+        _DISPATCHER = WebhookDispatcher()
+    return _DISPATCHER
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Encodage WebSocket - Négociation par sous-protocole (JSON / MessagePack, mode delta)
+et trames encodées une seule fois par encodage
+"""
+
+import json
+import time
+from typing import Optional, Union
+
+from .metrics import get_metrics
+
+try:  # Dans requirements.txt; si absente (installation minimale), seul JSON est proposé
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = "json"
+MSGPACK = "msgpack"
+# Sous-protocoles: "melodyhue.json", "melodyhue.msgpack", suffixe "+delta" optionnel
+SUBPROTOCOL_PREFIX = "melodyhue."
+DELTA_SUFFIX = "+delta"
+# Champs toujours présents dans un delta (identification du message)
+IDENTITY_FIELDS = ("type", "topic")
+
+
+def available_encodings() -> tuple:
+    return (JSON, MSGPACK) if msgpack is not None else (JSON,)
+
+
+def negotiate(offered: list) -> tuple:
+    """Premier sous-protocole proposé et supporté, dans l'ordre du client.
+
+    Retourne (sous-protocole | None, encodage, delta). Sans accord: JSON complet,
+    comme les clients historiques.
+    """
+    for proto in offered or ():
+        if not proto.startswith(SUBPROTOCOL_PREFIX):
+            continue
+        name = proto[len(SUBPROTOCOL_PREFIX) :]
+        delta = name.endswith(DELTA_SUFFIX)
+        if delta:
+            name = name[: -len(DELTA_SUFFIX)]
+        if name in available_encodings():
+            return proto, name, delta
+    return None, JSON, False
+
+
+def encode(message: dict, encoding: str) -> Union[str, bytes]:
+    """JSON en texte, MessagePack en binaire; taille et coût mesurés par encodage."""
+    started = time.perf_counter()
+    if encoding == MSGPACK:
+        data = msgpack.packb(message, use_bin_type=True)
+    else:
+        data = json.dumps(message, separators=(",", ":"))
+    metrics = get_metrics()
+    metrics.observe(f"ws_encode_us_{encoding}", (time.perf_counter() - started) * 1e6)
+    # JSON ASCII (ensure_ascii): longueur du texte = octets sur le fil
+    metrics.observe(f"ws_message_bytes_{encoding}", len(data))
+    return data
+
+
+def decode_client(data: Union[str, bytes, None], encoding: str) -> Optional[dict]:
+    """Messages client: JSON texte toujours accepté, binaire selon l'encodage."""
+    try:
+        if isinstance(data, str):
+            msg = json.loads(data)
+        elif data is not None and encoding == MSGPACK:
+            msg = msgpack.unpackb(data, raw=False)
+        else:
+            return None
+    except (ValueError, TypeError, RecursionError):
+        # Malformé (JSONDecodeError, erreurs msgpack: sous-classes de ValueError)
+        # ou imbriqué au-delà de la limite de récursion
+        return None
+    return msg if isinstance(msg, dict) else None
+
+
+class Frame:
+    """Message diffusé, encodé au plus une fois par encodage et partagé par toutes
+    les sockets qui le reçoivent."""
+
+    __slots__ = ("_encoded", "message")
+
+    def __init__(self, message: dict, json_text: Optional[str] = None) -> None:
+        self.message = message
+        self._encoded: dict = {JSON: json_text} if json_text is not None else {}
+
+    def encoded(self, encoding: str) -> Union[str, bytes]:
+        data = self._encoded.get(encoding)
+        if data is None:
+            data = encode(self.message, encoding)
+            self._encoded[encoding] = data
+        return data
+
+
+_MISSING = object()
+
+
+def _diff(prev: dict, cur: dict) -> dict:
+    out = {}
+    for key, value in cur.items():
+        old = prev.get(key, _MISSING)
+        if isinstance(value, dict) and isinstance(old, dict):
+            sub = _diff(old, value)
+            if sub:
+                out[key] = sub
+        elif old != value or old is _MISSING:
+            out[key] = value
+    for key in prev:
+        if key not in cur:
+            out[key] = None
+    return out
+
+
+def delta_message(prev: dict, cur: dict) -> Optional[dict]:
+    """Champs modifiés depuis `prev` (récursif, clés disparues à null), marqués
+    `"delta": true`; None si rien n'a changé. Le client fusionne en profondeur."""
+    diff = _diff(prev, cur)
+    for field in IDENTITY_FIELDS:
+        diff.pop(field, None)
+    if not diff:
+        return None
+    out = {field: cur[field] for field in IDENTITY_FIELDS if field in cur}
+    out["delta"] = True
+    out.update(diff)
+    return out
@@ -6,7 +6,6 @@ from .database import get_db
 from ..models.user import User, UserBan
 from datetime import datetime
 
-
 # Allow absence of Authorization header; we'll fallback to cookies
 bearer_scheme = HTTPBearer(auto_error=False)
 
@@ -41,21 +40,25 @@ def get_current_user(
     u = db.query(User).filter(User.id == sub).first()
     if not u:
         raise HTTPException(status_code=401, detail="Invalid token")
-    # Bloquer si banni (ban actif: until NULL ou > now, et non révoqué)
+    # Bloquer si banni
+    if get_active_ban(db, u.id):
+        raise HTTPException(status_code=403, detail="Banned")
+    return u
+
+
+def get_active_ban(db: Session, user_id: str) -> UserBan | None:
+    """Ban actif: until NULL ou > now, et non révoqué."""
     now = datetime.utcnow()
-    active_ban = (
+    return (
         db.query(UserBan)
         .filter(
-            UserBan.user_id == u.id,
+            UserBan.user_id == user_id,
             UserBan.revoked_at.is_(None),
             ((UserBan.until.is_(None)) | (UserBan.until > now)),
         )
         .order_by(UserBan.created_at.desc())
         .first()
     )
-    if active_ban:
-        raise HTTPException(status_code=403, detail="Banned")
-    return u
 
 
 def require_roles(*roles: str):
@@ -0,0 +1,32 @@
+from fastapi import Request, Response
+
+# Les navigateurs/OBS revalident à chaque poll; un proxy peut stocker et revalider
+NO_CACHE = "no-cache"
+OVERLAY_CACHE_CONTROL = "public, max-age=5, stale-while-revalidate=30"
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Compare If-None-Match à l'ETag (comparaison faible, cf. RFC 9110 §13.1.2)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    wanted = etag.removeprefix("W/")
+    for candidate in header.split(","):
+        c = candidate.strip()
+        c = c.removeprefix("W/")
+        if c == wanted:
+            return True
+    return False
+
+
+def not_modified(etag: str, cache_control: str = NO_CACHE) -> Response:
+    return Response(
+        status_code=304, headers={"ETag": etag, "Cache-Control": cache_control}
+    )
+
+
+def set_validators(response: Response, etag: str, cache_control: str = NO_CACHE):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
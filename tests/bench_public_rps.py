@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Débit (req/s) de /color et /infos - Appli ASGI appelée en processus (routage, route,
+sérialisation, réponse; sans réseau ni client HTTP). Pour comparer deux révisions,
+lancer le script depuis la racine de chacune:
+
+    git worktree add /tmp/avant <révision>
+    (cd /tmp/avant && DATABASE_URL=sqlite:// python /chemin/vers/tests/bench_public_rps.py)
+    DATABASE_URL=sqlite:// python tests/bench_public_rps.py
+"""
+
+import os
+import sys
+import time
+import asyncio
+
+sys.path.insert(0, os.getcwd())
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+DURATION = float(os.getenv("BENCH_DURATION", 3.0))
+USER_ID = "bench-user"
+
+
+async def _call(app, path: str) -> int:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 1),
+        "server": ("bench", 80),
+    }
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def _bench(app, path: str) -> float:
+    # Préchauffage: extracteur, config utilisateur, rendus en cache
+    for _ in range(50):
+        assert await _call(app, path) == 200
+    count = 0
+    started = time.perf_counter()
+    deadline = started + DURATION
+    while time.perf_counter() < deadline:
+        await _call(app, path)
+        count += 1
+    return count / (time.perf_counter() - started)
+
+
+async def main() -> None:
+    from app.main import app, on_startup, on_shutdown
+
+    await on_startup()
+    try:
+        for path in (f"/color/{USER_ID}", f"/infos/{USER_ID}"):
+            rps = await _bench(app, path)
+            print(f"{path:<24} {rps:>10.0f} req/s")
+    finally:
+        await on_shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
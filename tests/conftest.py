@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Les modules de l'app lisent leur configuration à l'import
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.pop("SHARED_SNAPSHOTS_PATH", None)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
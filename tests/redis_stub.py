@@ -0,0 +1,102 @@
+"""
+Serveur Redis minimal pour les tests (RESP: AUTH, SUBSCRIBE, PUBLISH, PING), lancé
+sur la boucle du test. `drop_connections()` simule une coupure réseau.
+"""
+
+import asyncio
+from typing import List, Optional, Set
+
+
+class RedisStub:
+    def __init__(self, password: Optional[str] = None) -> None:
+        self.password = password
+        self.port = 0
+        self.published: List[bytes] = []
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._writers: Set[asyncio.StreamWriter] = set()
+        self._subscribers: Set[asyncio.StreamWriter] = set()
+        self._changed = asyncio.Event()
+
+    async def start(self) -> "RedisStub":
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    @property
+    def url(self) -> str:
+        auth = f":{self.password}@" if self.password else ""
+        return f"redis://{auth}127.0.0.1:{self.port}"
+
+    async def stop(self) -> None:
+        self.drop_connections()
+        self._server.close()
+        await self._server.wait_closed()
+
+    def drop_connections(self) -> None:
+        for writer in list(self._writers):
+            writer.close()
+        self._writers.clear()
+        self._subscribers.clear()
+        self._changed.set()
+
+    async def wait_subscribers(self, n: int, timeout: float = 5.0) -> None:
+        async def _wait():
+            while len(self._subscribers) < n:
+                self._changed.clear()
+                await self._changed.wait()
+
+        await asyncio.wait_for(_wait(), timeout)
+
+    async def _handle(self, reader, writer) -> None:
+        self._writers.add(writer)
+        authed = self.password is None
+        try:
+            while True:
+                args = await _read_command(reader)
+                name = args[0].upper()
+                if name == b"AUTH":
+                    authed = args[1].decode() == self.password
+                    writer.write(b"+OK\r\n" if authed else b"-WRONGPASS\r\n")
+                elif not authed:
+                    writer.write(b"-NOAUTH Authentication required.\r\n")
+                elif name == b"SUBSCRIBE":
+                    self._subscribers.add(writer)
+                    self._changed.set()
+                    writer.write(_array([b"subscribe", args[1], 1]))
+                elif name == b"PUBLISH":
+                    self.published.append(args[2])
+                    targets = list(self._subscribers)
+                    for sub in targets:
+                        sub.write(_array([b"message", args[1], args[2]]))
+                    writer.write(b":%d\r\n" % len(targets))
+                elif name == b"PING":
+                    writer.write(b"+PONG\r\n")
+                else:
+                    writer.write(b"-ERR unknown command\r\n")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            self._subscribers.discard(writer)
+            writer.close()
+
+
+async def _read_command(reader) -> List[bytes]:
+    line = await reader.readuntil(b"\r\n")
+    assert line[:1] == b"*", line
+    args = []
+    for _ in range(int(line[1:-2])):
+        size = int((await reader.readuntil(b"\r\n"))[1:-2])
+        args.append((await reader.readexactly(size + 2))[:-2])
+    return args
+
+
+def _array(items) -> bytes:
+    out = [b"*%d\r\n" % len(items)]
+    for item in items:
+        if isinstance(item, int):
+            out.append(b":%d\r\n" % item)
+        else:
+            out.append(b"$%d\r\n%s\r\n" % (len(item), item))
+    return b"".join(out)
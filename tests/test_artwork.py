@@ -0,0 +1,93 @@
+import os
+import time
+import threading
+
+import pytest
+
+for _mod in ("PIL", "requests"):
+    pytest.importorskip(_mod)
+
+from app.services.artwork import ArtworkCache, artwork_key, is_valid_key  # noqa: E402
+
+URL = "https://i.scdn.co/image/abc"
+
+
+class _Response:
+    status_code = 200
+    content = b"x" * 1000
+
+
+class _SlowSession:
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def get(self, url, timeout=None, allow_redirects=True):
+        self.calls += 1
+        time.sleep(0.1)
+        return _Response()
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("ARTWORK_CACHE_DIR", str(tmp_path))
+    return ArtworkCache()
+
+
+def test_keys_from_clients_must_be_content_hashes():
+    assert is_valid_key(artwork_key(URL))
+    for key in ("../../etc", "ABCDEF0123456789abcd", "0" * 19, "0" * 21, ""):
+        assert not is_valid_key(key)
+
+
+def test_thumbnail_rejects_path_traversal(cache):
+    assert cache.thumbnail("../../etc/passwd", 64, "webp") is None
+
+
+def test_original_refuses_hosts_outside_spotify_cdn(cache):
+    cache._session = _SlowSession()
+    assert cache.original("https://169.254.169.254/latest/meta-data") is None
+    assert cache._session.calls == 0
+
+
+def test_late_misses_wait_for_the_write_instead_of_refetching(cache, monkeypatch):
+    cache._session = _SlowSession()
+    writing = threading.Event()
+    real_store = cache._store
+
+    def slow_store(name, data):
+        # Écriture lente: les demandes arrivées entre-temps ne refont pas le fetch
+        writing.set()
+        time.sleep(0.2)
+        real_store(name, data)
+
+    monkeypatch.setattr(cache, "_store", slow_store)
+    results = []
+
+    def fetch():
+        results.append(cache.original(URL))
+
+    first = threading.Thread(target=fetch)
+    first.start()
+    assert writing.wait(2)
+    late = [threading.Thread(target=fetch) for _ in range(7)]
+    for t in late:
+        t.start()
+    for t in [first] + late:
+        t.join()
+    assert cache._session.calls == 1
+    assert results == [_Response.content] * 8
+
+
+def test_disk_cache_evicts_least_recently_read_files(cache):
+    names = [f"{i:020x}.orig" for i in range(8)]
+    for i, name in enumerate(names):
+        cache._disk_set(name, b"y" * 1000)
+        os.utime(cache._path(name), (1000 + i, 1000 + i))
+    # Le plus ancien vient d'être relu: il reste, les suivants partent
+    cache._disk_get(names[0])
+    cache.disk_max_bytes = 5000
+    cache._disk_set(f"{99:020x}.orig", b"y" * 1000)
+    present = [n for n in names if os.path.exists(cache._path(n))]
+    assert names[0] in present
+    assert names[1] not in present
+    assert cache._disk_bytes <= cache.disk_max_bytes
@@ -0,0 +1,179 @@
+import asyncio
+
+import pytest
+
+from app.services.backplane import RedisBackplane
+
+from redis_stub import RedisStub
+
+
+class _Worker:
+    """Backplane d'un worker simulé: collecte les lots livrés."""
+
+    def __init__(self, url: str) -> None:
+        self.backplane = RedisBackplane(url, "test:realtime")
+        self.batches = []
+        self._received = asyncio.Event()
+
+    async def start(self) -> "_Worker":
+        await self.backplane.start(self._handle)
+        return self
+
+    async def _handle(self, batch) -> None:
+        self.batches.append(batch)
+        self._received.set()
+
+    async def wait_for(self, count: int, timeout: float = 5.0) -> list:
+        async def _wait():
+            while sum(len(b) for b in self.batches) < count:
+                self._received.clear()
+                await self._received.wait()
+
+        await asyncio.wait_for(_wait(), timeout)
+        return [envelope for batch in self.batches for envelope in batch]
+
+
+def _run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 20))
+
+
+def test_publish_subscribe_round_trip_is_batched():
+    async def scenario():
+        stub = await RedisStub(password="secret").start()
+        a = await _Worker(stub.url).start()
+        b = await _Worker(stub.url).start()
+        try:
+            await stub.wait_subscribers(2)
+            for i in range(3):
+                a.backplane.publish({"op": "send", "user_id": "u1", "n": i})
+            received = await b.wait_for(3)
+            # Le worker d'origine reçoit ses propres publications (même chemin)
+            own = await a.wait_for(3)
+            return stub, received, own, b.batches
+        finally:
+            await a.backplane.stop()
+            await b.backplane.stop()
+            await stub.stop()
+
+    stub, received, own, batches = _run(scenario())
+    assert [e["n"] for e in received] == [0, 1, 2]
+    assert [e["n"] for e in own] == [0, 1, 2]
+    # Publiées dans la même fenêtre: un seul PUBLISH, un seul lot
+    assert len(stub.published) == 1
+    assert len(batches) == 1
+    assert all(e["origin"] and e["ts"] for e in received)
+
+
+def test_subscriber_and_publisher_reconnect_after_connection_loss():
+    async def scenario():
+        stub = await RedisStub().start()
+        a = await _Worker(stub.url).start()
+        b = await _Worker(stub.url).start()
+        try:
+            await stub.wait_subscribers(2)
+            a.backplane.publish({"op": "send", "user_id": "u1", "n": 1})
+            await b.wait_for(1)
+            # Coupure: connexions PUBLISH et SUBSCRIBE fermées côté serveur
+            stub.drop_connections()
+            await stub.wait_subscribers(2)
+            a.backplane.publish({"op": "send", "user_id": "u1", "n": 2})
+            return await b.wait_for(2)
+        finally:
+            await a.backplane.stop()
+            await b.backplane.stop()
+            await stub.stop()
+
+    received = _run(scenario())
+    assert [e["n"] for e in received] == [1, 2]
+
+
+def test_send_to_user_reaches_the_worker_holding_the_socket():
+    pytest.importorskip("fastapi")
+    from app.services.realtime import ConnectionManager
+
+    class FakeSocket:
+        def __init__(self) -> None:
+            self.sent = []
+            self.closed = None
+
+        async def send_text(self, data):
+            self.sent.append(data)
+
+        async def send_bytes(self, data):
+            self.sent.append(data)
+
+        async def close(self, code=1000, reason=""):
+            self.closed = (code, reason)
+
+    async def scenario():
+        stub = await RedisStub().start()
+        managers = [
+            ConnectionManager(RedisBackplane(stub.url, "test:realtime"))
+            for _ in range(2)
+        ]
+        socket = FakeSocket()
+        try:
+            for manager in managers:
+                manager.heartbeat_interval = 0
+                await manager.start()
+            await stub.wait_subscribers(2)
+            # La socket est détenue par le second worker; le premier publie
+            await managers[1].connect("u1", socket)
+            await managers[0].send_to_user("u1", {"type": "hello"})
+            await managers[0].kick_user("u1", "banned")
+            for _ in range(200):
+                if socket.closed:
+                    break
+                await asyncio.sleep(0.01)
+            return socket
+        finally:
+            for manager in managers:
+                await manager.stop()
+            await stub.stop()
+
+    socket = _run(scenario())
+    assert '"hello"' in socket.sent[0]
+    assert '"force_logout"' in socket.sent[1]
+    assert socket.closed == (4401, "banned")
+
+
+def test_public_cache_invalidation_reaches_other_workers():
+    for _mod in ("fastapi", "sqlalchemy"):
+        pytest.importorskip(_mod)
+    from app.services.public_cache import PublicCache
+    from app.services.realtime import ConnectionManager
+
+    async def scenario():
+        stub = await RedisStub().start()
+        managers, caches = [], []
+        for _ in range(2):
+            manager = ConnectionManager(RedisBackplane(stub.url, "test:realtime"))
+            manager.heartbeat_interval = 0
+            manager.bind_loop(asyncio.get_running_loop())
+            await manager.start()
+            cache = PublicCache()
+            cache.set_broadcaster(manager.broadcast_invalidation)
+            manager.add_invalidation_handler(cache.apply_invalidation)
+            managers.append(manager)
+            caches.append(cache)
+        try:
+            await stub.wait_subscribers(2)
+            for cache in caches:
+                cache.profiles.set("u1", {"id": "u1"})
+                cache.profiles.set("u2", {"id": "u2"})
+            # Écriture traitée par le premier worker (depuis un thread de l'exécuteur)
+            await asyncio.to_thread(caches[0].invalidate_profile, "u1")
+            for _ in range(200):
+                if caches[1].profiles.get("u1") is None:
+                    break
+                await asyncio.sleep(0.01)
+            return caches
+        finally:
+            for manager in managers:
+                await manager.stop()
+            await stub.stop()
+
+    caches = _run(scenario())
+    for cache in caches:
+        assert cache.profiles.get("u1") is None
+        assert cache.profiles.get("u2") == {"id": "u2"}
@@ -0,0 +1,124 @@
+import base64
+
+import pytest
+
+from app.services import circuit_breaker
+from app.services.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    BreakerRegistry,
+    CircuitBreaker,
+)
+
+
+class _Response:
+    def __init__(self, status_code: int, body: dict) -> None:
+        self.status_code = status_code
+        self._body = body
+
+    def json(self) -> dict:
+        return self._body
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = BreakerRegistry()
+    monkeypatch.setattr(circuit_breaker, "_REGISTRY", registry)
+    return registry
+
+
+def test_opens_after_threshold_then_lets_a_single_probe_through():
+    b = CircuitBreaker("t", failure_threshold=3, base_cooldown=10, max_cooldown=100)
+    for _ in range(3):
+        assert b.allow()
+        b.record_failure("http_500")
+    assert b.state == OPEN
+    assert not b.allow()
+    # Refroidissement écoulé: une seule sonde à la fois
+    later = b.open_until + 0.1
+    assert b.allow(now=later)
+    assert b.state == HALF_OPEN
+    assert not b.allow(now=later)
+    # Sonde en échec: rouvert avec un délai doublé
+    b.record_failure("http_500")
+    assert b.state == OPEN
+    assert b.open_until - b.last_failure_at == pytest.approx(20, abs=0.1)
+    assert b.allow(now=b.open_until + 0.1)
+    b.record_success()
+    assert b.state == CLOSED
+    assert b.failures == 0
+    assert b.allow()
+
+
+def test_registry_keys_are_isolated(registry):
+    a = registry.get("user:a", failure_threshold=1)
+    registry.get("user:b", failure_threshold=1)
+    a.record_failure("boom")
+    assert registry.peek("user:a").snapshot()["state"] == OPEN
+    assert registry.peek("user:b").snapshot()["state"] == CLOSED
+    registry.forget("user:a")
+    assert registry.peek("user:a") is None
+    assert registry.get("user:a").snapshot()["state"] == CLOSED
+
+
+def test_wrong_secret_for_a_shared_client_id_does_not_block_other_users(
+    registry, monkeypatch
+):
+    from app.services import spotify_client_service
+    from app.services.spotify_client_service import SpotifyClient
+
+    valid = "Basic " + base64.b64encode(b"shared-id:right-secret").decode()
+
+    def fake_post(url, headers=None, data=None, timeout=None):
+        if headers["Authorization"] == valid:
+            return _Response(200, {"access_token": "tok", "expires_in": 3600})
+        return _Response(400, {"error": "invalid_client"})
+
+    monkeypatch.setattr(spotify_client_service.requests, "post", fake_post)
+    victim = SpotifyClient(user_id="victim")
+    assert victim.configure_spotify_api("shared-id", "right-secret")
+    attacker = SpotifyClient(user_id="attacker")
+    for _ in range(10):
+        attacker.spotify_token_expires = 0
+        attacker.configure_spotify_api("shared-id", "wrong-secret")
+    # Seul le disjoncteur (client_id, mauvais secret) de l'attaquant est ouvert
+    assert attacker.breaker_blocked()
+    assert attacker.breaker_status()["client"]["state"] == OPEN
+    assert not victim.breaker_blocked()
+    assert victim.breaker_status()["client"]["state"] == CLOSED
+    assert victim._client_breaker_key() != attacker._client_breaker_key()
+
+
+def test_unused_breakers_are_forgotten(registry):
+    pytest.importorskip("sqlalchemy")
+    from app.services.state import AppState
+    from app.services.spotify_client_service import SpotifyClient
+
+    class FakeExtractor:
+        def __init__(self, user_id: str, client_id: str) -> None:
+            self.spotify_client = SpotifyClient(user_id=user_id)
+            self.spotify_client.spotify_client_id = client_id
+            self.spotify_client.spotify_client_secret = "secret"
+            self.stopped = False
+
+        def stop_monitoring(self) -> None:
+            self.stopped = True
+
+    state = AppState()
+    a = FakeExtractor("a", "shared-id")
+    b = FakeExtractor("b", "shared-id")
+    state.user_extractors.update(a=a, b=b)
+    for extractor in (a, b):
+        extractor.spotify_client.breaker_status()
+    shared = a.spotify_client._client_breaker_key()
+    assert shared == b.spotify_client._client_breaker_key()
+
+    state.drop_extractor("a")
+    assert a.stopped
+    assert registry.peek("user:a") is None
+    # Toujours utilisé par b
+    assert registry.peek(shared) is not None
+
+    state.drop_extractor("b")
+    assert registry.snapshot()["total"] == 0
@@ -0,0 +1,111 @@
+import time
+
+import pytest
+
+pytest.importorskip("requests")
+
+from app.services import circuit_breaker, spotify_client_service  # noqa: E402
+from app.services.circuit_breaker import BreakerRegistry  # noqa: E402
+from app.services import spotify_color_extractor_service as service  # noqa: E402
+from app.services.spotify_color_extractor_service import (  # noqa: E402
+    SpotifyColorExtractor,
+)
+
+QUEUE = {
+    "queue": [
+        {"id": "next", "name": "Next", "album": {"images": [{"url": "img://next"}]}},
+        {"id": "after", "name": "After", "album": {"images": []}},
+    ]
+}
+
+
+class _Response:
+    def __init__(self, status_code: int, body: dict) -> None:
+        self.status_code = status_code
+        self.headers = {}
+        self._body = body
+
+    def json(self) -> dict:
+        return self._body
+
+
+class FakeScheduler:
+    def __init__(self) -> None:
+        self.tokens = 0
+
+    def register(self, extractor) -> None:
+        pass
+
+    def unregister(self, extractor) -> None:
+        pass
+
+    def acquire(self, timeout: float = 5.0) -> bool:
+        self.tokens += 1
+        return True
+
+
+@pytest.fixture
+def extractor(monkeypatch):
+    scheduler = FakeScheduler()
+    monkeypatch.setattr(service, "get_scheduler", lambda: scheduler)
+    monkeypatch.setattr(circuit_breaker, "_REGISTRY", BreakerRegistry())
+    monkeypatch.setenv("SPOTIFY_PREFETCH_COUNT", "2")
+    extractor = SpotifyColorExtractor(user_id="prefetch")
+    client = extractor.spotify_client
+    client.spotify_enabled = True
+    client.spotify_refresh_token = "refresh"
+    client.spotify_access_token = "token"
+    client.spotify_token_expires = time.time() + 3600
+    downloads = []
+
+    def download_image(url):
+        downloads.append(url)
+        return url
+
+    monkeypatch.setattr(extractor.color_extractor, "download_image", download_image)
+    monkeypatch.setattr(
+        extractor.color_extractor, "extract_primary_color", lambda image: (1, 2, 3)
+    )
+    extractor.scheduler = scheduler
+    extractor.downloads = downloads
+    return extractor
+
+
+def _fake_queue(monkeypatch, status_code: int = 200) -> list:
+    calls = []
+
+    def fake_get(url, headers=None, timeout=None):
+        calls.append(url)
+        return _Response(status_code, QUEUE)
+
+    monkeypatch.setattr(spotify_client_service.requests, "get", fake_get)
+    return calls
+
+
+def test_next_track_color_is_served_from_the_prefetch(extractor, monkeypatch):
+    calls = _fake_queue(monkeypatch)
+    extractor._prefetch_upcoming()
+    assert calls == [f"{extractor.spotify_client.api_base}/me/player/queue"]
+    assert extractor.scheduler.tokens == 1
+    assert list(extractor.prefetched_colors) == ["next"]
+
+    # Changement de piste: couleur servie sans téléchargement
+    extractor.downloads.clear()
+    event = {"track": {"id": "next", "image_url": "img://next"}}
+    assert extractor.extract_color_for_event(event, lambda: None) == (1, 2, 3)
+    assert extractor.downloads == []
+
+
+def test_open_breaker_gates_the_queue_call(extractor, monkeypatch):
+    calls = _fake_queue(monkeypatch, status_code=500)
+    client = extractor.spotify_client
+    for _ in range(client.max_spotify_errors):
+        extractor._prefetch_upcoming()
+    assert client.breaker_blocked()
+    calls.clear()
+    tokens = extractor.scheduler.tokens
+
+    extractor._prefetch_upcoming()
+    assert calls == []
+    assert extractor.scheduler.tokens == tokens
+    assert not extractor.prefetched_colors
@@ -0,0 +1,74 @@
+import time
+import asyncio
+import threading
+
+from app.services.event_bus import THREAD, ColorChanged, EventBus
+
+
+def _event(user_id: str, n: int) -> ColorChanged:
+    return ColorChanged(
+        user_id=user_id,
+        state="track_changed",
+        track={"n": n},
+        color=(1, 2, 3),
+        detected_at=time.time(),
+    )
+
+
+def test_slow_blocking_subscriber_does_not_delay_other_users(monkeypatch):
+    monkeypatch.setenv("EVENT_BUS_WORKERS", "4")
+    release = threading.Event()
+    handled = {}
+
+    def light_feed(event):
+        if event.user_id == "slow":
+            # Appel DB bloqué pour cet utilisateur
+            release.wait(5)
+        handled.setdefault(event.user_id, []).append(event.track["n"])
+
+    async def scenario():
+        bus = EventBus()
+        bus.subscribe("light_feed", light_feed, ColorChanged, mode=THREAD)
+        await bus.start()
+        # Un utilisateur réparti sur un autre shard que "slow"
+        fast = next(
+            f"u{i}" for i in range(100) if hash(f"u{i}") % 4 != hash("slow") % 4
+        )
+        bus.publish(_event("slow", 0))
+        for n in range(3):
+            bus.publish(_event(fast, n))
+        started = time.perf_counter()
+        while len(handled.get(fast, ())) < 3 and time.perf_counter() - started < 2:
+            await asyncio.sleep(0.01)
+        fast_done = time.perf_counter() - started
+        release.set()
+        while "slow" not in handled and time.perf_counter() - started < 5:
+            await asyncio.sleep(0.01)
+        await bus.stop()
+        return fast, fast_done
+
+    fast, fast_done = asyncio.run(scenario())
+    assert fast_done < 1.0
+    # Ordre conservé par utilisateur
+    assert handled[fast] == [0, 1, 2]
+    assert handled["slow"] == [0]
+
+
+def test_events_without_subscribers_are_not_built(monkeypatch):
+    from app.services import track_events
+    from app.services.metrics import get_metrics
+
+    bus = EventBus()
+    monkeypatch.setattr(track_events, "get_bus", lambda: bus)
+    before = get_metrics().get_counter("event_bus_published_track_changed")
+    track_events._publish_bus(
+        {
+            "type": track_events.TRACK_CHANGED,
+            "user_id": "u1",
+            "track": {"id": "t1"},
+            "color": (1, 2, 3),
+            "detected_at": time.time(),
+        }
+    )
+    assert get_metrics().get_counter("event_bus_published_track_changed") == before
+    assert get_metrics().get_counter("event_bus_published_color_changed") >= 1
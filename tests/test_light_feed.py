@@ -0,0 +1,31 @@
+import ipaddress
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from app.services.light_feed import resolve_target  # noqa: E402
+
+LAN = [ipaddress.ip_network("192.168.0.0/16")]
+
+
+@pytest.mark.parametrize(
+    "host",
+    ["127.0.0.1", "::1", "169.254.169.254", "192.168.1.20", "10.0.0.5", "224.0.0.1"],
+)
+def test_non_global_addresses_are_refused_by_default(host, monkeypatch):
+    monkeypatch.delenv("LIGHT_ALLOW_PRIVATE", raising=False)
+    assert resolve_target(host, 4210, []) is None
+
+
+def test_listed_networks_opt_in_to_their_range_only():
+    assert resolve_target("192.168.1.20", 4210, LAN)[1][0] == "192.168.1.20"
+    for host in ("127.0.0.1", "169.254.169.254", "10.0.0.5", "8.8.8.8"):
+        assert resolve_target(host, 4210, LAN) is None
+
+
+def test_allow_private_opt_in(monkeypatch):
+    monkeypatch.setenv("LIGHT_ALLOW_PRIVATE", "true")
+    assert resolve_target("10.0.0.5", 4210, []) is not None
+    assert resolve_target("8.8.8.8", 4210, []) is not None
+    assert resolve_target("255.255.255.255", 4210, []) is None
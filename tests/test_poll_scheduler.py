@@ -0,0 +1,70 @@
+import time
+
+from app.services.poll_scheduler import PollScheduler
+
+
+class FakeExtractor:
+    spotify_check_interval = 0.05
+
+    def __init__(self, user_id: str, scheduler: PollScheduler, slow: float = 0.0):
+        self.user_id = user_id
+        self.last_access_at = time.time()
+        self.scheduler = scheduler
+        self.slow = slow
+        self.checked_under_lock = False
+        self.polls = 0
+
+    def needs_poll(self) -> bool:
+        # Propriété du slot partagé: flock potentiellement long
+        self.checked_under_lock |= self.scheduler._cond._is_owned()
+        time.sleep(self.slow)
+        return True
+
+    def poll_once(self) -> None:
+        self.polls += 1
+
+
+def test_ownership_check_runs_outside_the_scheduler_lock():
+    scheduler = PollScheduler()
+    slow = FakeExtractor("slow", scheduler, slow=0.2)
+    fast = FakeExtractor("fast", scheduler)
+    try:
+        scheduler.register(slow)
+        scheduler.register(fast)
+        time.sleep(0.05)
+        # Pendant la vérification lente, les autres appels restent immédiats
+        started = time.perf_counter()
+        scheduler.wake(fast)
+        assert scheduler.acquire(timeout=1.0)
+        assert time.perf_counter() - started < 0.1
+        time.sleep(0.5)
+    finally:
+        scheduler.stop()
+    assert not slow.checked_under_lock and not fast.checked_under_lock
+    assert slow.polls >= 1 and fast.polls >= 1
+
+
+def test_probes_run_outside_the_scheduler_lock():
+    scheduler = PollScheduler()
+    extractor = FakeExtractor("u1", scheduler)
+    under_lock = []
+
+    def probe(user_id: str) -> bool:
+        under_lock.append(scheduler._cond._is_owned())
+        # Sonde lente (backplane distant): les autres appels restent immédiats
+        time.sleep(0.2)
+        return True
+
+    scheduler.add_live_probe(probe)
+    try:
+        scheduler.register(extractor)
+        time.sleep(0.05)
+        started = time.perf_counter()
+        assert scheduler.acquire(timeout=1.0)
+        scheduler.snapshot()
+        assert time.perf_counter() - started < 0.1
+        time.sleep(0.3)
+    finally:
+        scheduler.stop()
+    assert under_lock and not any(under_lock)
+    assert extractor.polls >= 1
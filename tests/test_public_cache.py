@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from app.services.public_cache import PublicCache, TTLCache  # noqa: E402
+
+
+def _overlay(overlay_id: str, owner_id: str, color: str = "#25d865") -> dict:
+    return {"id": overlay_id, "owner_id": owner_id, "color": color}
+
+
+def _loader(result, during=None):
+    async def run_io(fn, loader, key):
+        # Invalidation reçue pendant que la requête est en cours
+        if during is not None:
+            during()
+        return result
+
+    return run_io
+
+
+def test_invalidation_during_a_load_is_not_overwritten():
+    cache = PublicCache()
+    stale = _overlay("o1", "u1", "#000000")
+    run_io = _loader(stale, lambda: cache.apply_invalidation("overlay", "o1"))
+    assert asyncio.run(cache.overlay("o1", run_io)) == stale
+    assert cache.overlays.peek("o1") is None
+
+    fresh = _overlay("o1", "u1")
+    assert asyncio.run(cache.overlay("o1", _loader(fresh))) == fresh
+    assert cache.overlays.peek("o1") == fresh
+    assert cache.overlays._loading == {}
+
+
+def test_owner_invalidation_during_loads_is_not_overwritten():
+    cache = PublicCache()
+    during = lambda: cache.apply_invalidation("owner", "u1")  # noqa: E731
+    asyncio.run(cache.overlay("o1", _loader(_overlay("o1", "u1"), during)))
+    asyncio.run(cache.profile("u1", _loader({"id": "u1"}, during)))
+    assert cache.overlays.peek("o1") is None
+    assert cache.profiles.peek("u1") is None
+
+
+def test_owner_index_is_pruned_on_eviction_and_invalidation():
+    cache = PublicCache()
+    cache.overlays = TTLCache("t", 2, 300, on_evict=cache._unlink_overlay)
+    for overlay_id in ("o1", "o2"):
+        asyncio.run(cache.overlay(overlay_id, _loader(_overlay(overlay_id, "u1"))))
+    assert cache._overlays_by_owner == {"u1": {"o1", "o2"}}
+
+    # o1 évincé (LRU) par o3
+    asyncio.run(cache.overlay("o3", _loader(_overlay("o3", "u2"))))
+    assert cache._overlays_by_owner == {"u1": {"o2"}, "u2": {"o3"}}
+
+    cache.apply_invalidation("overlay", "o2")
+    assert cache._overlays_by_owner == {"u2": {"o3"}}
+
+    # Expiré: retiré à la lecture suivante
+    cache.overlays.ttl = -1
+    cache.overlays.set("o3", cache.overlays.peek("o3"))
+    assert cache.overlays.get("o3") is None
+    assert cache._overlays_by_owner == {}
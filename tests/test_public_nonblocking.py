@@ -0,0 +1,122 @@
+import json
+import time
+import asyncio
+
+import pytest
+
+for _mod in ("fastapi", "sqlalchemy", "PIL", "requests", "dotenv"):
+    pytest.importorskip(_mod)
+
+from starlette.requests import Request  # noqa: E402
+
+from app.routes import public  # noqa: E402
+from app.services import state as state_module  # noqa: E402
+from app.services import snapshots as snapshots_module  # noqa: E402
+from app.services.poll_scheduler import get_scheduler  # noqa: E402
+from app.services.spotify_client_service import SpotifyClient  # noqa: E402
+from app.services.spotify_color_extractor_service import (  # noqa: E402
+    SpotifyColorExtractor,
+)
+
+# Appel Spotify lent (réseau dégradé) et chargement de config lent (DB)
+SPOTIFY_DELAY = 1.0
+CONFIG_DELAY = 0.3
+# Au-delà, un tick de 10 ms a été retardé par du code bloquant sur la boucle
+MAX_LOOP_GAP = 0.2
+
+
+def _request(path: str) -> Request:
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "headers": [],
+        "query_string": b"",
+    }
+    return Request(scope)
+
+
+def _slow_track(self):
+    time.sleep(SPOTIFY_DELAY)
+    return {
+        "id": "t1",
+        "name": "Song",
+        "artist": "Artist",
+        "album": "Album",
+        "duration_ms": 200_000,
+        "progress_ms": 1_000,
+        "is_playing": True,
+        "image_url": None,
+        "timestamp": time.time(),
+    }
+
+
+def _slow_load(self, user_id):
+    time.sleep(CONFIG_DELAY)
+    extractor = self.user_extractors.get(user_id)
+    if extractor is None:
+        extractor = SpotifyColorExtractor(user_id=user_id)
+        extractor.spotify_client.spotify_enabled = True
+        self.user_extractors[user_id] = extractor
+        get_scheduler().wake(extractor)
+    self._config_loaded_at[user_id] = time.time()
+    return extractor
+
+
+@pytest.fixture
+def app_state(monkeypatch):
+    monkeypatch.setattr(SpotifyClient, "_setup_spotify", lambda self: False)
+    monkeypatch.setattr(SpotifyClient, "get_current_track", _slow_track)
+    monkeypatch.setattr(state_module.AppState, "_load_extractor_blocking", _slow_load)
+    monkeypatch.setattr(state_module, "_STATE_SINGLETON", state_module.AppState())
+    monkeypatch.setattr(snapshots_module, "_STORE", snapshots_module.SnapshotStore())
+    yield state_module.get_state()
+    for extractor in state_module.get_state().user_extractors.values():
+        extractor.stop_monitoring()
+    get_scheduler().stop()
+
+
+def test_infos_and_color_do_not_block_the_loop_on_slow_spotify(app_state):
+    async def scenario():
+        snapshots_module.get_snapshots().bind_loop(asyncio.get_running_loop())
+        gaps = []
+        done = asyncio.Event()
+
+        async def ticker():
+            last = time.perf_counter()
+            while not done.is_set():
+                await asyncio.sleep(0.01)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        task = asyncio.create_task(ticker())
+        calls = []
+        for i in range(20):
+            user_id = f"user-{i % 4}"
+            request = _request(f"/infos/{user_id}")
+            if i % 2:
+                calls.append(public.infos(user_id, request, fields=None))
+            else:
+                calls.append(
+                    public.color(user_id, request, wait=None, since=None, fields=None)
+                )
+        started = time.perf_counter()
+        responses = await asyncio.gather(*calls)
+        elapsed = time.perf_counter() - started
+        done.set()
+        await task
+        return responses, max(gaps), elapsed
+
+    responses, worst_gap, elapsed = asyncio.run(scenario())
+
+    assert worst_gap < MAX_LOOP_GAP
+    # Les 4 utilisateurs sont chargés et pollés en parallèle, pas les uns après les autres
+    assert elapsed < 4 * (SPOTIFY_DELAY + CONFIG_DELAY)
+    for response in responses:
+        body = json.loads(response.body)
+        assert body["color"]["hex"].startswith("#")
+        assert body["version"] >= 2
+        if "track" in body:
+            # Premier accès: la réponse attend la première détection (pas de secours)
+            assert body["track"]["id"] == "t1"
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+from app.services.backplane import LocalBackplane  # noqa: E402
+from app.services.metrics import get_metrics  # noqa: E402
+from app.services.realtime import ConnectionManager  # noqa: E402
+
+
+class FakeSocket:
+    def __init__(self) -> None:
+        self.sent = []
+        self.closed = None
+
+    async def send_text(self, data):
+        self.sent.append(data)
+
+    async def send_bytes(self, data):
+        self.sent.append(data)
+
+    async def close(self, code=1000, reason=""):
+        self.closed = (code, reason)
+
+
+def _heartbeats(monkeypatch, idle_timeout=None, heartbeat=False):
+    monkeypatch.setenv("WS_HEARTBEAT_INTERVAL", "0.02")
+    if idle_timeout is not None:
+        monkeypatch.setenv("WS_IDLE_TIMEOUT", str(idle_timeout))
+    else:
+        monkeypatch.delenv("WS_IDLE_TIMEOUT", raising=False)
+
+    async def scenario():
+        manager = ConnectionManager(LocalBackplane())
+        socket = FakeSocket()
+        sent_before = get_metrics().get_counter("ws_messages_sent")
+        await manager.start()
+        await manager.connect("u1", socket, heartbeat=heartbeat)
+        # Client historique: ne répond jamais aux pings
+        await asyncio.sleep(0.2)
+        await manager.stop()
+        sent = get_metrics().get_counter("ws_messages_sent")
+        return socket, sent - sent_before
+
+    return asyncio.run(scenario())
+
+
+def test_silent_clients_are_kept_and_not_pinged_by_default(monkeypatch):
+    socket, _ = _heartbeats(monkeypatch)
+    assert socket.closed is None
+    assert socket.sent == []
+
+
+def test_clients_can_opt_in_to_pings(monkeypatch):
+    socket, messages = _heartbeats(monkeypatch, heartbeat=True)
+    assert socket.closed is None
+    assert socket.sent and all('"ping"' in frame for frame in socket.sent)
+    # Les pings du serveur ne comptent pas comme trafic applicatif
+    assert messages == 0
+
+
+def test_idle_reaping_is_opt_in(monkeypatch):
+    socket, _ = _heartbeats(monkeypatch, idle_timeout=0.05)
+    # Pings envoyés sans demande du client dès que le reaping est actif
+    assert socket.sent and '"ping"' in socket.sent[0]
+    assert socket.closed == (4000, "idle_timeout")
@@ -0,0 +1,68 @@
+import os
+import time
+
+import pytest
+
+from app.services.shared_snapshots import (
+    OFF_ACCESS,
+    OFF_PAYLOAD,
+    OFF_PID,
+    SharedSnapshotTable,
+)
+
+
+@pytest.fixture
+def table(tmp_path):
+    t = SharedSnapshotTable(str(tmp_path / "snapshots"), slots=4, record_size=256)
+    yield t
+    t.close()
+
+
+def _write(table, user_id, version=1):
+    assert table.write(
+        user_id, "boot", version, time.time(), 1, (1, 2, 3), "track_changed", None
+    )
+
+
+def test_lookups_without_claim_never_take_a_slot(table):
+    for i in range(20):
+        assert table.owns(f"random-{i}", claim=False) is False
+        assert table.read(f"random-{i}") is None
+    assert all(table._user_at(slot) == b"\0" * 32 for slot in range(4))
+
+
+def test_idle_slots_are_reclaimed_when_the_table_is_full(table):
+    users = [f"u{i}" for i in range(4)]
+    for user in users:
+        assert table.acquire(user)
+        _write(table, user)
+    assert table.acquire("late") is True  # table pleine: repli local
+    assert table._find("late") is None
+    # Plus aucun accès à u0 depuis longtemps
+    table.reclaim_after = 60
+    base = table._offset(table._find("u0"))
+    for stamp in (base + OFF_ACCESS, base + OFF_PAYLOAD + 16):
+        table._mm[stamp : stamp + 8] = bytes(8)
+    assert table.acquire("late")
+    assert table._find("late") == table._slot_of["late"]
+    # L'ancien utilisateur ne lit pas les données du nouveau et n'écrit plus
+    assert table.read("u0") is None
+    assert table.version("u0") is None
+    _write(table, "late")
+    assert table.read("late").version == 1
+
+
+def test_dead_owner_slot_is_orphaned_after_grace(table):
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0)
+    os.waitpid(pid, 0)
+    for i in range(4):
+        assert table.acquire(f"u{i}")
+        _write(table, f"u{i}")
+    base = table._offset(table._find("u0"))
+    table._mm[base + OFF_PID : base + OFF_PID + 4] = pid.to_bytes(4, "little")
+    table.owner_check = 0
+    time.sleep(0.01)
+    assert table._abandoned(table._find("u0"))
+    assert not table._abandoned(table._find("u1"))
@@ -0,0 +1,48 @@
+import json
+import time
+
+from app.services.snapshots import Snapshot
+
+
+def _track(**kw):
+    track = {
+        "id": "t1",
+        "name": "Song",
+        "is_playing": True,
+        "progress_ms": 10_000,
+        "duration_ms": 200_000,
+        "timestamp": time.time() - 5,
+    }
+    track.update(kw)
+    return track
+
+
+def test_infos_progress_is_extrapolated_from_timestamp():
+    snap = Snapshot("u1", 1, (1, 2, 3), _track())
+    tick = snap.tick()
+    body = json.loads(snap.rendered("infos", tick=tick))
+    assert 14_000 <= body["track"]["progress_ms"] <= 16_000
+    # Le snapshot lui-même n'est pas modifié
+    assert snap.track["progress_ms"] == 10_000
+
+
+def test_progress_capped_at_duration_and_frozen_when_paused():
+    ended = Snapshot("u1", 1, (1, 2, 3), _track(duration_ms=12_000))
+    assert ended.infos_payload(ended.tick())["track"]["progress_ms"] == 12_000
+    paused = Snapshot("u1", 1, (1, 2, 3), _track(is_playing=False))
+    assert paused.tick() is None
+    assert paused.infos_payload(paused.tick())["track"]["progress_ms"] == 10_000
+
+
+def test_etag_and_render_cache_follow_the_second():
+    snap = Snapshot("u1", 7, (1, 2, 3), _track())
+    assert snap.etag("i", None, 100) != snap.etag("i", None, 101)
+    assert snap.etag("c") == snap.etag("c", None, None)
+    first = snap.rendered("infos", tick=100)
+    assert snap.rendered("infos", tick=100) is first
+    snap.rendered("infos", tick=101)
+    # Les rendus de la seconde précédente sont écartés, pas ceux sans piste
+    snap.rendered("color")
+    snap.rendered("infos", tick=102)
+    ticks = {key[-1] for key in snap._rendered}
+    assert ticks == {None, 102}
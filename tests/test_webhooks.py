@@ -0,0 +1,94 @@
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+for _mod in ("requests", "sqlalchemy"):
+    pytest.importorskip(_mod)
+
+import requests  # noqa: E402
+from urllib3.util import connection  # noqa: E402
+
+from app.services import webhooks  # noqa: E402
+from app.services.webhooks import WebhookDispatcher, _Delivery, pin_url  # noqa: E402
+
+PUBLIC = "93.184.216.34"
+
+
+class _Receiver(BaseHTTPRequestHandler):
+    hosts = []
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        _Receiver.hosts.append(self.headers["Host"])
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def receiver():
+    server = HTTPServer(("127.0.0.1", 0), _Receiver)
+    _Receiver.hosts = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+def test_delivery_connects_to_the_validated_address(receiver, monkeypatch):
+    real_getaddrinfo = socket.getaddrinfo
+    real_create_connection = connection.create_connection
+    lookups = []
+    connected = []
+
+    def rebinding_getaddrinfo(host, port, *args, **kwargs):
+        if host != "hooks.example":
+            return real_getaddrinfo(host, port, *args, **kwargs)
+        lookups.append(host)
+        # Première résolution publique, puis bascule vers une adresse interne
+        address = PUBLIC if len(lookups) == 1 else "127.0.0.1"
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (address, port))]
+
+    def recording_create_connection(address, *args, **kwargs):
+        connected.append(address)
+        # Pas de réseau en test: toute connexion aboutit au récepteur local
+        return real_create_connection(("127.0.0.1", receiver), *args, **kwargs)
+
+    monkeypatch.setattr(socket, "getaddrinfo", rebinding_getaddrinfo)
+    monkeypatch.setattr(connection, "create_connection", recording_create_connection)
+    monkeypatch.delenv("WEBHOOK_ALLOW_PRIVATE", raising=False)
+
+    dispatcher = WebhookDispatcher()
+    delivery = _Delivery(
+        "http://hooks.example:8080/hook", b"secret", "track_changed", b"{}", 0.0
+    )
+    assert dispatcher._post(delivery) == (True, False)
+    # Une seule résolution (la vérifiée), connexion à l'adresse validée
+    assert lookups == ["hooks.example"]
+    assert connected == [(PUBLIC, 8080)]
+    assert _Receiver.hosts == ["hooks.example:8080"]
+
+
+def test_https_keeps_the_hostname_for_sni_and_certificate_checks():
+    url, host = pin_url("https://hooks.example/hook?x=1", PUBLIC)
+    assert url == f"https://{PUBLIC}/hook?x=1"
+    assert host == "hooks.example"
+    request = requests.Request("POST", url, headers={"Host": host}).prepare()
+    host_params, pool_kwargs = (
+        webhooks._PinnedAdapter().build_connection_pool_key_attributes(request, True)
+    )
+    assert host_params["host"] == PUBLIC
+    assert pool_kwargs["server_hostname"] == "hooks.example"
+    assert pool_kwargs["assert_hostname"] == "hooks.example"
+
+
+def test_ipv6_addresses_are_bracketed():
+    assert pin_url("http://hooks.example:81/", "2001:db8::1") == (
+        "http://[2001:db8::1]:81/",
+        "hooks.example:81",
+    )
@@ -0,0 +1,24 @@
+import pytest
+
+from app.services import ws_encoding
+from app.services.ws_encoding import JSON, MSGPACK, decode_client, encode, negotiate
+
+OFFER = ["melodyhue.msgpack+delta", "melodyhue.json"]
+
+
+def test_msgpack_is_negotiated_and_round_trips():
+    msgpack = pytest.importorskip("msgpack")
+    assert negotiate(OFFER) == ("melodyhue.msgpack+delta", MSGPACK, True)
+    data = encode({"type": "ping", "n": 1}, MSGPACK)
+    assert isinstance(data, bytes)
+    assert msgpack.unpackb(data, raw=False) == {"type": "ping", "n": 1}
+    assert decode_client(data, MSGPACK) == {"type": "ping", "n": 1}
+
+
+def test_without_msgpack_negotiation_falls_back_to_json(monkeypatch):
+    monkeypatch.setattr(ws_encoding, "msgpack", None)
+    assert negotiate(OFFER) == ("melodyhue.json", JSON, False)
+    assert negotiate(["melodyhue.msgpack"]) == (None, JSON, False)
+    # Binaire inattendu d'un client: ignoré, texte JSON toujours accepté
+    assert decode_client(b"\x81\xa4type\xa4pong", JSON) is None
+    assert decode_client('{"type":"pong"}', JSON) == {"type": "pong"}
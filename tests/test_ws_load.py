@@ -0,0 +1,120 @@
+import socket
+import asyncio
+
+import pytest
+
+for _mod in ("fastapi", "sqlalchemy", "uvicorn", "websockets", "httpx"):
+    pytest.importorskip(_mod)
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+import websockets  # noqa: E402
+from fastapi import Depends, FastAPI  # noqa: E402
+from sqlalchemy import create_engine, text  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.models.user import User, UserBan  # noqa: E402
+from app.routes import realtime as realtime_routes  # noqa: E402
+from app.services import realtime as realtime_module  # noqa: E402
+from app.utils.database import Base, SessionLocal, get_db  # noqa: E402
+from app.utils.security import create_access_token  # noqa: E402
+
+USERS = 30
+SOCKETS_PER_USER = 10  # WS_MAX_PER_USER par défaut
+PROBES = 50
+# Pool volontairement petit et impatient: une connexion épinglée par socket le
+# saturerait dès la 4e socket et les requêtes HTTP échoueraient en 2 s
+POOL_SIZE = 2
+POOL_OVERFLOW = 1
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'ws.db'}",
+        pool_size=POOL_SIZE,
+        max_overflow=POOL_OVERFLOW,
+        pool_timeout=2,
+        connect_args={"check_same_thread": False},
+    )
+    Base.metadata.create_all(engine)
+    SessionLocal.configure(bind=engine)
+    monkeypatch.setattr(realtime_module, "_MANAGER", None)
+    db = SessionLocal()
+    for i in range(USERS):
+        db.add(User(id=f"u{i}", username=f"u{i}", email=f"u{i}@x", password_hash="-"))
+    db.add(User(id="banned", username="b", email="b@x", password_hash="-"))
+    db.add(UserBan(user_id="banned", moderator_id="u0", reason="spam"))
+    db.commit()
+    db.close()
+    yield engine
+    from app.utils.database import engine as default_engine
+
+    SessionLocal.configure(bind=default_engine)
+    engine.dispose()
+
+
+def _app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(realtime_routes.router)
+
+    @app.get("/probe")
+    def probe(db: Session = Depends(get_db)):
+        return {"users": db.execute(text("SELECT COUNT(*) FROM api_users")).scalar()}
+
+    return app
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_hundreds_of_sockets_do_not_pin_db_connections(database):
+    port = _free_port()
+    server = uvicorn.Server(
+        uvicorn.Config(_app(), host="127.0.0.1", port=port, log_level="warning")
+    )
+
+    async def scenario():
+        serving = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.01)
+        sockets = []
+        try:
+            opens = [
+                websockets.connect(
+                    f"ws://127.0.0.1:{port}/ws?token={create_access_token(f'u{i}')}"
+                )
+                for i in range(USERS)
+                for _ in range(SOCKETS_PER_USER)
+            ]
+            opened = await asyncio.gather(*opens, return_exceptions=True)
+            sockets = [ws for ws in opened if not isinstance(ws, Exception)]
+            open_count = realtime_module.get_manager()._count
+            pinned = database.pool.checkedout()
+            async with httpx.AsyncClient(
+                base_url=f"http://127.0.0.1:{port}", timeout=5
+            ) as client:
+                probes = await asyncio.gather(
+                    *(client.get("/probe") for _ in range(PROBES)),
+                    return_exceptions=True,
+                )
+            with pytest.raises(websockets.InvalidStatusCode):
+                await websockets.connect(
+                    f"ws://127.0.0.1:{port}/ws?token={create_access_token('banned')}"
+                )
+            return open_count, pinned, probes
+        finally:
+            await asyncio.gather(*(ws.close() for ws in sockets))
+            server.should_exit = True
+            server.force_exit = True
+            await serving
+
+    open_count, pinned, probes = asyncio.run(asyncio.wait_for(scenario(), 60))
+
+    assert open_count == USERS * SOCKETS_PER_USER
+    assert pinned == 0
+    assert [getattr(r, "status_code", r) for r in probes] == [200] * PROBES
+    assert probes[0].json() == {"users": USERS + 1}